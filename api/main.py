@@ -1,16 +1,34 @@
-from fastapi import FastAPI, HTTPException, Form
+import asyncio
+import os
+from fastapi import FastAPI, HTTPException, Body, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from loguru import logger
+from typing import List, Optional
 from uuid import UUID
 
 from config.database import CassandraConnection
-from models.book import BookRepository
-from models.user import UserRepository
-from models.borrow import BorrowRepository
-from models.reservation import ReservationRepository
-from models.statistics import StatisticsRepository
+from models.book import AsyncBookRepository, MAX_BATCH_GET
+from models.user import AsyncUserRepository
+from models.aggregator import StatsAggregator
+from models.borrow import AsyncBorrowRepository
+from models.reservation import AsyncReservationRepository
+from models.statistics import AsyncStatisticsRepository, LEADERBOARD_SIZE
+from models.cache import LibraryCache, AsyncCachedBookRepository, AsyncCachedUserRepository
+from models.paging import Page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from models.metrics import instrument
+from models.projection import Projector, library_handlers
+from models.statements import prepare_statements
+from api.schemas import (
+    ActiveBorrowsResponse, AuthorBookItem, BatchGetResponse, BookBorrowItem, BookListItem, BookOut,
+    BorrowResponse, HealthResponse, OverdueResponse, Page as PageOut, Report, ReservationItem, SearchItem,
+    StatsResponse, UserBorrowItem, UserCreateResponse,
+)
+from api.streaming import LISTING_FORMATS, stream_listing
 
 
-app = FastAPI(title="Library API")
+# Réponses encodées par orjson (datetime / UUID natifs, sans passer par jsonable_encoder)
+app = FastAPI(title="Library API", default_response_class=ORJSONResponse)
 
 # -------------------- CORS --------------------
 # Autorise ton front (127.0.0.1:5500) à appeler l'API (127.0.0.1:8000)
@@ -28,6 +46,8 @@ app.add_middleware(
 )
 
 # -------------------- Cassandra / Repos (init) --------------------
+# Repositories asyncio : les handlers attendent les futures du driver au lieu de
+# bloquer un worker du threadpool pendant chaque aller-retour Cassandra.
 db = CassandraConnection(keyspace="library_system")
 session = None
 
@@ -36,23 +56,103 @@ user_repo = None
 borrow_repo = None
 reservation_repo = None
 stats_repo = None
+stats_buffer = None
+projector = None
+query_metrics = None
+
+# Compteurs d'emprunts (global_stats / book_popularity) : "buffered" = coalescés et écrits toutes les
+# STATS_FLUSH_INTERVAL_S secondes (perte max. d'un intervalle en cas de crash), "sync" = à chaque emprunt
+STATS_DURABILITY = os.getenv("STATS_DURABILITY", "buffered")
+STATS_FLUSH_INTERVAL_S = float(os.getenv("STATS_FLUSH_INTERVAL_S", "1.0"))
+STATS_MAX_PENDING = int(os.getenv("STATS_MAX_PENDING", "1000"))
+
+# Tables dénormalisées (listings, index, historique par livre) : "inline" = écrites dans la requête,
+# "outbox" = ligne autoritaire + événement, projetées en arrière-plan (cf. models/projection.py).
+# Un seul projecteur par cluster : PROJECTOR_EMBEDDED=0 sur les workers si `cli projector run` tourne à part.
+PROJECTION_MODE = os.getenv("PROJECTION_MODE", "inline")
+PROJECTOR_EMBEDDED = os.getenv("PROJECTOR_EMBEDDED", "1") == "1"
+PROJECTOR_POLL_S = float(os.getenv("PROJECTOR_POLL_S", "0.2"))
+
+# Réservations servies au retour : "inline" (pendant le POST /borrows/return), "worker" (file de retours
+# vidée en arrière-plan, réponse du retour plus rapide) ou "off"
+RESERVATION_FULFILMENT = os.getenv("RESERVATION_FULFILMENT", "inline")
+
+# Emprunts simultanés max. par utilisateur (0 = illimité) et durée de prêt
+MAX_ACTIVE_LOANS = int(os.getenv("MAX_ACTIVE_LOANS", "0"))
+LOAN_DAYS = int(os.getenv("LOAN_DAYS", "21"))
+
+# Historiques et files de réservations dans les tables *_month : à activer après `migrate-buckets`
+HISTORY_BUCKETED = os.getenv("HISTORY_BUCKETED", "0") == "1"
+
+# Métriques par requête CQL (latences, lignes, erreurs), exposées sur /metrics. QUERY_TRACE_RATE : fraction
+# des requêtes tracées par le coordinateur (system_traces) ; trace_id gardés avec les requêtes > QUERY_SLOW_MS
+QUERY_METRICS = os.getenv("QUERY_METRICS", "1") == "1"
+QUERY_TRACE_RATE = float(os.getenv("QUERY_TRACE_RATE", "0"))
+QUERY_SLOW_MS = float(os.getenv("QUERY_SLOW_MS", "500"))
+
+# Cache read-through (livres/users) partagé par les handlers, invalidé par les emprunts/retours
+cache = LibraryCache()
+
+
+def init_repositories(cassandra_session):
+    """Construit les repositories sur une session (le banc de test y passe une FakeSession)."""
+    global session, book_repo, user_repo, borrow_repo, reservation_repo, stats_repo, stats_buffer, projector
+    global query_metrics
+    session = cassandra_session
+    if QUERY_METRICS:
+        query_metrics = instrument(session, trace_rate=QUERY_TRACE_RATE, slow_threshold=QUERY_SLOW_MS / 1000)
+
+    stats_repo = AsyncStatisticsRepository(session)
+    # Chaque flush remonte les ISBN touchés dans top_books : /stats suit sans attendre la compaction
+    # (reconstruction complète : CLI `rebuild-leaderboard` en cron, jamais dans les workers de l'API).
+    # Réécriture conditionnelle sur top_books.version : les workers concurrents ne perdent pas d'ISBN.
+    stats_buffer = StatsAggregator(session, durability=STATS_DURABILITY, flush_interval=STATS_FLUSH_INTERVAL_S,
+                                   max_pending=STATS_MAX_PENDING, on_flush=stats_repo.refresh_leaderboard)
+    books = AsyncBookRepository(session, projection=PROJECTION_MODE)
+    book_repo = AsyncCachedBookRepository(books, cache.books)
+    user_repo = AsyncCachedUserRepository(AsyncUserRepository(session), cache.users)
+    borrow_repo = AsyncBorrowRepository(session, cache=cache, stats=stats_buffer, projection=PROJECTION_MODE,
+                                        fulfilment=RESERVATION_FULFILMENT, max_active=MAX_ACTIVE_LOANS or None,
+                                        loan_days=LOAN_DAYS, bucketed=HISTORY_BUCKETED)
+    reservation_repo = AsyncReservationRepository(session, bucketed=HISTORY_BUCKETED)
+    # Le projecteur réutilise les méthodes synchrones des repositories (il tourne dans ses threads)
+    projector = Projector(session, library_handlers(books, borrow_repo), poll_interval=PROJECTOR_POLL_S)
 
 
 @app.on_event("startup")
 def on_startup():
-    global session, book_repo, user_repo, borrow_repo, reservation_repo, stats_repo
-    session = db.connect()
+    init_repositories(db.connect())
+    # Requêtes préparées en un lot parallèle, en arrière-plan : le worker accepte déjà les requêtes
+    # (une requête arrivée avant la fin prépare simplement sa propre classe au premier usage)
+    warmup = asyncio.get_running_loop().run_in_executor(
+        None, prepare_statements, session, book_repo, user_repo, borrow_repo, reservation_repo, stats_repo,
+        projector)
+    warmup.add_done_callback(log_warmup)
+
+    if PROJECTION_MODE == "outbox" and PROJECTOR_EMBEDDED:
+        projector.start()
 
-    book_repo = BookRepository(session)
-    user_repo = UserRepository(session)
-    borrow_repo = BorrowRepository(session)
-    reservation_repo = ReservationRepository(session)
-    stats_repo = StatisticsRepository(session)
+
+def log_warmup(future):
+    """Issue du préchauffage : un échec est signalé, les requêtes seront préparées au premier usage."""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error(f"❌ prepare_statements error: {error}")
+    else:
+        logger.success(f"✅ {future.result()} requêtes préparées")
 
 
 @app.on_event("shutdown")
 def on_shutdown():
     global session
+    if stats_buffer:
+        stats_buffer.close()  # écrit les compteurs encore en attente avant de fermer la session
+    if borrow_repo:
+        borrow_repo.fulfiller.close()  # traite les retours encore en file (mode worker)
+    if projector:
+        projector.close()  # sauvegarde les checkpoints ; le reste de l'outbox sera repris au redémarrage
     # Si ta classe CassandraConnection gère un close propre, adapte ici.
     # Sinon, au minimum on ferme la session si possible.
     try:
@@ -70,94 +170,170 @@ def parse_uuid(value: str, field_name: str = "user_id") -> UUID:
         raise HTTPException(status_code=400, detail=f"{field_name} invalide (UUID attendu)")
 
 
+async def paged(coro) -> ORJSONResponse:
+    """Attend une page de listing ; un curseur invalide devient une 400."""
+    try:
+        page: Page = await coro
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return listing(page.to_dict())
+
+
+def listing(content) -> ORJSONResponse:
+    """Réponse d'un listing, encodée telle quelle par orjson.
+
+    Les items sont construits par les décodeurs des repositories : le response_model de la route
+    les documente (OpenAPI) sans revalider chaque ligne (10k lignes : ~57 ms validés, ~9 ms directs).
+    """
+    return ORJSONResponse(content)
+
+
+# Pagination des listings : ?limit=&cursor= (next_cursor renvoyé tant qu'il reste des lignes)
+Limit = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+# ?format=ndjson|json : toute la partition en flux (limit/cursor ignorés), voir api/streaming.py
+Format = Query("page", alias="format", pattern=f"^({'|'.join(LISTING_FORMATS)})$")
+
+
 # -------------------- HEALTH --------------------
-@app.get("/health")
-def health():
+@app.get("/health", response_model=HealthResponse)
+async def health():
     return {"status": "ok"}
 
 
 # -------------------- USERS --------------------
-@app.post("/users")
-def register_user(
+@app.post("/users", response_model=UserCreateResponse)
+async def register_user(
     email: str = Form(...),
     first_name: str = Form(...),
     last_name: str = Form(...),
     phone: str = Form(""),
     address: str = Form(""),
 ):
-    user_id = user_repo.create_user(email, first_name, last_name, phone, address)
+    user_id = await user_repo.create_user(email, first_name, last_name, phone, address)
     return {"user_id": str(user_id)}
 
 
 # -------------------- BOOKS --------------------
-@app.get("/books/{isbn}")
-def get_book(isbn: str):
-    book = book_repo.get_book_by_isbn(isbn)
+@app.post("/books:batchGet", response_model=BatchGetResponse)
+async def batch_get_books(isbns: List[str] = Body(..., embed=True, min_length=1)):
+    """Plusieurs livres en une requête (ordre conservé).
+
+    ISBN inexistants dans `missing`, lectures en échec dans `errors` ; 503 si toutes ont échoué.
+    """
+    if len(isbns) > MAX_BATCH_GET:
+        raise HTTPException(status_code=400, detail=f"{MAX_BATCH_GET} ISBN maximum par requête")
+
+    books = await book_repo.get_books_by_isbns(isbns)
+    if not books:
+        raise HTTPException(status_code=503, detail="Lecture des livres indisponible")
+    return {
+        "books": [book for book in books.values() if book is not None],
+        "missing": [isbn for isbn, book in books.items() if book is None],
+        "errors": [isbn for isbn in dict.fromkeys(isbns) if isbn not in books],
+    }
+
+
+@app.get("/books/{isbn}", response_model=BookOut)
+async def get_book(isbn: str):
+    book = await book_repo.get_book_by_isbn(isbn)
     if not book:
         raise HTTPException(status_code=404, detail="Livre introuvable")
+    return book
+
 
-    # Si book est un objet (dataclass ou model), __dict__ marche
-    # Si c'est déjà un dict, ça marche aussi (via return book)
-    return book.__dict__ if hasattr(book, "__dict__") else book
+@app.get("/books", response_model=PageOut[BookListItem])
+async def list_by_category(category: str, limit: int = Limit, cursor: Optional[str] = None, fmt: str = Format):
+    if fmt != "page":
+        return await stream_listing(book_repo.iter_books_by_category(category), fmt)
+    return await paged(book_repo.get_books_by_category_page(category, limit, cursor))
 
 
-@app.get("/books")
-def list_by_category(category: str):
-    return book_repo.get_books_by_category(category)
+@app.get("/authors/{author}/books", response_model=PageOut[AuthorBookItem])
+async def list_by_author(author: str, limit: int = Limit, cursor: Optional[str] = None, fmt: str = Format):
+    if fmt != "page":
+        return await stream_listing(book_repo.iter_books_by_author(author), fmt)
+    return await paged(book_repo.get_books_by_author_page(author, limit, cursor))
 
 
-@app.get("/authors/{author}/books")
-def list_by_author(author: str):
-    return book_repo.get_books_by_author(author)
+@app.get("/search", response_model=PageOut[SearchItem])
+async def search_books(q: str = Query(..., min_length=1), limit: int = Limit, cursor: Optional[str] = None):
+    """Recherche plein texte classée (titre > auteur > description), paginée par curseur."""
+    return await paged(book_repo.search_books(q, limit, cursor))
 
 
 # -------------------- BORROWS --------------------
-@app.post("/borrows")
-def borrow_book(
+@app.post("/borrows", response_model=BorrowResponse)
+async def borrow_book(
     user_id: str = Form(...),
     isbn: str = Form(...),
 ):
     user_uuid = parse_uuid(user_id, "user_id")
 
-    # Vérifier utilisateur
-    user = user_repo.get_user(user_uuid)
+    # Vérifier utilisateur + livre (deux lectures indépendantes, en parallèle)
+    user, book = await asyncio.gather(user_repo.get_user(user_uuid), book_repo.get_book_by_isbn(isbn))
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
 
-    # Vérifier livre
-    book = book_repo.get_book_by_isbn(isbn)
     if not book:
         raise HTTPException(status_code=404, detail="Livre introuvable")
 
     user_name = f"{user.first_name} {user.last_name}"
 
-    ok = borrow_repo.borrow_book(user.user_id, isbn, book.title, user_name)
+    ok = await borrow_repo.borrow_book(user.user_id, isbn, book.title, user_name)
     if not ok:
         raise HTTPException(status_code=400, detail="Emprunt impossible")
 
     return {"success": True}
 
 
-@app.get("/users/{user_id}/borrows")
-def user_borrows(user_id: str):
+@app.get("/users/{user_id}/borrows", response_model=PageOut[UserBorrowItem])
+async def user_borrows(user_id: str, limit: int = Limit, cursor: Optional[str] = None, fmt: str = Format):
     user_uuid = parse_uuid(user_id, "user_id")
-    return borrow_repo.get_user_borrows(user_uuid)
+    if fmt != "page":
+        return await stream_listing(borrow_repo.iter_user_borrows(user_uuid), fmt)
+    return await paged(borrow_repo.get_user_borrows_page(user_uuid, limit, cursor))
 
 
-@app.get("/books/{isbn}/borrows")
-def borrows_by_book(isbn: str):
-    return borrow_repo.get_borrows_by_book(isbn)
+@app.get("/users/{user_id}/borrows/active", response_model=ActiveBorrowsResponse)
+async def user_active_borrows(user_id: str):
+    """Livres détenus en ce moment (échéance la plus proche d'abord, retards signalés)."""
+    user_uuid = parse_uuid(user_id, "user_id")
+    items = await borrow_repo.get_active_borrows(user_uuid)
+    return listing({
+        "items": items,
+        "count": len(items),
+        "overdue": sum(1 for b in items if b["overdue"]),
+        "max_active": MAX_ACTIVE_LOANS or None,
+    })
+
+
+@app.get("/borrows/overdue", response_model=OverdueResponse)
+async def overdue_borrows(limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE)):
+    """Emprunts en retard, échéance la plus ancienne d'abord (lecture arrêtée dès `limit` atteint)."""
+    items = []
+    async for b in borrow_repo.iter_overdue():
+        items.append(b)
+        if len(items) >= limit:
+            break
+    return listing({"items": items, "count": len(items), "truncated": len(items) >= limit})
+
+
+@app.get("/books/{isbn}/borrows", response_model=PageOut[BookBorrowItem])
+async def borrows_by_book(isbn: str, limit: int = Limit, cursor: Optional[str] = None, fmt: str = Format):
+    if fmt != "page":
+        return await stream_listing(borrow_repo.iter_borrows_by_book(isbn), fmt)
+    return await paged(borrow_repo.get_borrows_by_book_page(isbn, limit, cursor))
 
 
 # -------------------- RETURN BOOK --------------------
-@app.post("/borrows/return")
-def return_book(
+@app.post("/borrows/return", response_model=BorrowResponse)
+async def return_book(
     user_id: str = Form(...),
     isbn: str = Form(...),
 ):
     user_uuid = parse_uuid(user_id, "user_id")
 
-    ok = borrow_repo.return_book(user_uuid, isbn)
+    ok = await borrow_repo.return_book(user_uuid, isbn)
     if not ok:
         raise HTTPException(status_code=400, detail="Retour impossible")
 
@@ -165,40 +341,65 @@ def return_book(
 
 
 # -------------------- RESERVATIONS --------------------
-@app.post("/reservations")
-def reserve_book(
+@app.post("/reservations", response_model=BorrowResponse)
+async def reserve_book(
     user_id: str = Form(...),
     isbn: str = Form(...),
 ):
     user_uuid = parse_uuid(user_id, "user_id")
 
-    # Vérifier utilisateur
-    user = user_repo.get_user(user_uuid)
+    # Vérifier utilisateur + livre (deux lectures indépendantes, en parallèle)
+    user, book = await asyncio.gather(user_repo.get_user(user_uuid), book_repo.get_book_by_isbn(isbn))
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur introuvable")
 
-    # Vérifier livre
-    book = book_repo.get_book_by_isbn(isbn)
     if not book:
         raise HTTPException(status_code=404, detail="Livre introuvable")
 
     user_name = f"{user.first_name} {user.last_name}"
 
-    ok = reservation_repo.reserve_book(user.user_id, isbn, book.title, user_name)
+    ok = await reservation_repo.add_reservation(isbn, user.user_id, user_name)
     if not ok:
         raise HTTPException(status_code=400, detail="Réservation impossible")
 
     return {"success": True}
 
 
-@app.get("/reservations/{isbn}")
-def list_reservations(isbn: str):
-    return reservation_repo.list_reservations_by_isbn(isbn)
+@app.get("/reservations/{isbn}", response_model=List[ReservationItem])
+async def list_reservations(isbn: str):
+    return listing(await reservation_repo.list_reservations(isbn))
 
 
 # -------------------- STATS --------------------
-@app.get("/stats")
-def stats(top: int = 5):
-    total = stats_repo.get_total_borrows()
-    popular = stats_repo.get_top_books(top=top)
+@app.get("/stats", response_model=StatsResponse)
+async def stats(top: int = Query(5, ge=1, le=LEADERBOARD_SIZE)):
+    # Top-N = une lecture de la partition top_books (jamais de scan de book_popularity)
+    total, popular = await asyncio.gather(stats_repo.get_total_borrows(), stats_repo.get_top_books(limit=top))
     return {"total_borrows": total, "top_books": popular}
+
+
+@app.get("/cache/stats", response_model=Report)
+async def cache_stats():
+    return cache.stats()
+
+
+# -------------------- METRICS --------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métriques des requêtes CQL au format texte Prometheus."""
+    if query_metrics is None:
+        raise HTTPException(status_code=404, detail="Métriques désactivées (QUERY_METRICS=0)")
+    return PlainTextResponse(query_metrics.prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/metrics/queries", response_model=Report)
+async def metrics_queries():
+    """Mêmes métriques en JSON (percentiles estimés, requêtes lentes / tracées) ; lu par `stats --perf`."""
+    if query_metrics is None:
+        raise HTTPException(status_code=404, detail="Métriques désactivées (QUERY_METRICS=0)")
+    return query_metrics.summary()
+
+
+@app.get("/projection/status", response_model=Report)
+async def projection_status():
+    return {"mode": PROJECTION_MODE, "embedded": PROJECTOR_EMBEDDED, **projector.stats()}
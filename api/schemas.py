@@ -1,31 +1,65 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Any, Dict, Generic, Optional, List, TypeVar
 from uuid import UUID
 from datetime import datetime
 
+T = TypeVar("T")
+
 
 class HealthResponse(BaseModel):
     status: str = "ok"
 
 
+class Page(BaseModel, Generic[T]):
+    """Listing paginé : next_cursor à renvoyer dans ?cursor= tant qu'il n'est pas null."""
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
+# Seules les colonnes de clé primaire sont garanties non nulles : les autres peuvent manquer sur une ligne
+# existante (import sans année, écriture partielle) et sont donc optionnelles dans les réponses.
 class BookOut(BaseModel):
     isbn: str
-    title: str
-    author: str
-    category: str
-    publisher: str
-    publication_year: int
-    total_copies: int
-    available_copies: int
+    title: Optional[str] = None
+    author: Optional[str] = None
+    category: Optional[str] = None
+    publisher: Optional[str] = None
+    publication_year: Optional[int] = None
+    total_copies: Optional[int] = None
+    available_copies: Optional[int] = None
     description: str = ""
 
 
 class BookListItem(BaseModel):
     isbn: str
     title: str
-    author: str
-    available_copies: int
-    total_copies: int
+    author: Optional[str] = None
+    available_copies: Optional[int] = None
+    total_copies: Optional[int] = None
+
+
+class AuthorBookItem(BaseModel):
+    isbn: str
+    title: str
+    category: Optional[str] = None
+    available_copies: Optional[int] = None
+    total_copies: Optional[int] = None
+
+
+class SearchItem(BaseModel):
+    isbn: str
+    title: Optional[str] = None
+    author: Optional[str] = None
+    category: Optional[str] = None
+    available_copies: Optional[int] = None
+    total_copies: Optional[int] = None
+    score: int
+
+
+class BatchGetResponse(BaseModel):
+    books: List[BookOut]
+    missing: List[str]                                  # livres inexistants
+    errors: List[str] = Field(default_factory=list)     # lectures en échec (erreur, timeout) : à réessayer
 
 
 class UserCreate(BaseModel):
@@ -47,3 +81,71 @@ class BorrowCreate(BaseModel):
 
 class BorrowResponse(BaseModel):
     success: bool
+
+
+class UserBorrowItem(BaseModel):
+    isbn: str
+    book_title: Optional[str] = None
+    borrow_date: datetime
+    status: Optional[str] = None
+    return_date: Optional[datetime] = None
+
+
+class BookBorrowItem(BaseModel):
+    borrow_date: datetime
+    user_id: UUID
+    user_name: Optional[str] = None
+    status: Optional[str] = None
+    return_date: Optional[datetime] = None
+    book_title: Optional[str] = None
+
+
+class ActiveBorrowItem(BaseModel):
+    isbn: str
+    book_title: Optional[str] = None
+    borrow_date: Optional[datetime] = None
+    due_date: datetime
+    overdue: bool
+
+
+class ActiveBorrowsResponse(BaseModel):
+    items: List[ActiveBorrowItem]
+    count: int
+    overdue: int
+    max_active: Optional[int] = Field(None, description="Limite d'emprunts simultanés (null = aucune)")
+
+
+class OverdueItem(BaseModel):
+    user_id: UUID
+    isbn: str
+    book_title: Optional[str] = None
+    user_name: Optional[str] = None
+    borrow_date: Optional[datetime] = None
+    due_date: datetime
+
+
+class OverdueResponse(BaseModel):
+    items: List[OverdueItem]
+    count: int
+    truncated: bool
+
+
+class ReservationItem(BaseModel):
+    reservation_date: datetime
+    user_id: UUID
+    user_name: Optional[str] = None
+    status: Optional[str] = None
+
+
+class TopBook(BaseModel):
+    isbn: str
+    borrow_count: int
+
+
+class StatsResponse(BaseModel):
+    total_borrows: int
+    top_books: List[TopBook]
+
+
+# Rapports de diagnostic (cache, métriques, projection) : structure libre
+Report = Dict[str, Any]
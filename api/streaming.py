@@ -0,0 +1,73 @@
+import orjson
+from typing import Any, AsyncIterator, List
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from loguru import logger
+
+# ?format= des listings : "page" (JSON paginé par curseur), "ndjson" (un objet JSON par ligne),
+# "json" (tableau JSON envoyé par morceaux). Les deux flux renvoient toute la partition.
+LISTING_FORMATS = ("page", "ndjson", "json")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Items sérialisés par morceau envoyé (un write par morceau, pas par ligne)
+STREAM_CHUNK_ITEMS = 100
+
+
+def _dumps(item: Any) -> bytes:
+    return orjson.dumps(item)
+
+
+async def _ndjson(first: List[Any], items: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+    lines = [_dumps(item) for item in first]
+    try:
+        async for item in items:
+            lines.append(_dumps(item))
+            if len(lines) >= STREAM_CHUNK_ITEMS:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+    except Exception as e:
+        # En-têtes déjà envoyés (200) : la dernière ligne signale l'interruption
+        logger.error(f"❌ stream error: {e}")
+        lines.append(_dumps({"error": "flux interrompu"}))
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def _json_array(first: List[Any], items: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+    parts = [b"[" + b",".join(_dumps(item) for item in first)]
+    sep = b"," if first else b""
+    count = len(first)
+    try:
+        async for item in items:
+            parts.append(sep + _dumps(item))
+            sep = b","
+            count += 1
+            if count % STREAM_CHUNK_ITEMS == 0:
+                yield b"".join(parts)
+                parts = []
+    except Exception as e:
+        # Tableau laissé ouvert : le client obtient un JSON invalide plutôt qu'une liste tronquée
+        logger.error(f"❌ stream error: {e}")
+        yield b"".join(parts)
+        return
+    parts.append(b"]")
+    yield b"".join(parts)
+
+
+async def stream_listing(items: AsyncIterator[Any], fmt: str) -> StreamingResponse:
+    """Réponse en flux d'un itérateur de repository (mémoire constante, quelle que soit la partition).
+
+    Le premier item est lu avant d'envoyer les en-têtes : une panne de lecture initiale
+    reste une vraie erreur HTTP (503) au lieu d'un 200 vide.
+    """
+    items = items.__aiter__()
+    try:
+        first = [await items.__anext__()]
+    except StopAsyncIteration:
+        first = []
+    except Exception as e:
+        logger.error(f"❌ stream error: {e}")
+        raise HTTPException(status_code=503, detail="Lecture impossible")
+    if fmt == "ndjson":
+        return StreamingResponse(_ndjson(first, items), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(_json_array(first, items), media_type="application/json")
@@ -0,0 +1,103 @@
+"""Banc de performance : python -m bench --backend fake|cluster [...] --output results.json"""
+import argparse
+import json
+import sys
+
+from loguru import logger
+
+from bench.harness import Benchmark, SCENARIOS, compare, failures
+from models.metrics import instrument
+from models.rows import ROW_FACTORIES, row_factory
+
+# Requêtes reprises dans le rapport (--query-metrics), par temps total décroissant
+QUERY_METRICS_TOP = 15
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__)
+    parser.add_argument("--backend", choices=["fake", "cluster"], default="fake",
+                        help="fake = FakeSession en mémoire (CI), cluster = Cassandra via CASSANDRA_*")
+    parser.add_argument("--books", type=int, default=1000, help="Taille du catalogue")
+    parser.add_argument("--users", type=int, default=200, help="Nombre d'utilisateurs")
+    parser.add_argument("--ops", type=int, default=2000, help="Opérations par scénario")
+    parser.add_argument("--concurrency", type=int, default=32, help="Opérations en vol simultanées")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Liste séparée par des virgules ({','.join(SCENARIOS)})")
+    parser.add_argument("--fake-latency-ms", type=float, default=0.5,
+                        help="Latence simulée par aller-retour (backend fake)")
+    parser.add_argument("--inventory", choices=["lwt", "plain"], default="lwt",
+                        help="Mode de mise à jour du stock de BorrowRepository")
+    parser.add_argument("--projection", choices=["inline", "outbox"], default="inline",
+                        help="Tables dénormalisées écrites dans la requête ou projetées depuis l'outbox")
+    parser.add_argument("--fulfilment", choices=["inline", "worker", "off"], default="inline",
+                        help="Réservations servies pendant le retour ou par le worker de la file de retours")
+    parser.add_argument("--holds", type=int, default=2000, help="Réservations en attente (reservation_queue)")
+    parser.add_argument("--hot-books", type=int, default=4, help="Livres contendus (borrow_contention)")
+    parser.add_argument("--hot-copies", type=int, default=5, help="Exemplaires par livre contendu")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--query-metrics", action="store_true",
+                        help="Instrumente la session (models/metrics.py) et ajoute les requêtes les plus coûteuses au rapport")
+    parser.add_argument("--row-factory", choices=ROW_FACTORIES, default="cached",
+                        help="Décodage des lignes : classes Row réutilisées ou factory du driver (une classe par page)")
+    parser.add_argument("--output", default=None, help="Fichier JSON du rapport (défaut: stdout)")
+    parser.add_argument("--baseline", default=None, help="Rapport JSON de référence à comparer")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Régression tolérée vs --baseline (0.25 = 25%% sur p95 et ops/s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")  # les logs par opération fausseraient les mesures
+
+    db = None
+    if args.backend == "fake":
+        from bench.fake_session import FakeSession
+        session = FakeSession(latency=args.fake_latency_ms / 1000)
+        session.row_factory = row_factory(args.row_factory)
+    else:
+        from dataclasses import replace
+        from config.database import CassandraConnection, ConnectionProfile
+        profile = replace(ConnectionProfile.from_env(), row_factory=args.row_factory)
+        db = CassandraConnection(keyspace="library_system", profile=profile)
+        session = db.connect()
+    metrics = instrument(session) if args.query_metrics else None
+
+    try:
+        bench = Benchmark(session, books=args.books, users=args.users, ops=args.ops,
+                          concurrency=args.concurrency, seed=args.seed, inventory=args.inventory,
+                          hot_books=args.hot_books, hot_copies=args.hot_copies, projection=args.projection,
+                          fulfilment=args.fulfilment, holds=args.holds)
+        report = bench.run([s.strip() for s in args.scenarios.split(",") if s.strip()])
+        report["backend"] = args.backend
+        if args.backend == "fake":
+            report["config"]["fake_latency_ms"] = args.fake_latency_ms
+        report["config"]["row_factory"] = args.row_factory
+        if metrics is not None:
+            report["checks"]["query_metrics"] = dict(list(metrics.snapshot().items())[:QUERY_METRICS_TOP])
+    finally:
+        if db:
+            db.close()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    failed = failures(report)
+    for line in failed:
+        print(f"❌ échec {line}", file=sys.stderr)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"❌ régression {line}", file=sys.stderr)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import asyncio
+import json
+from typing import Any, Optional, Tuple
+
+
+async def asgi_request(app, method: str, path: str, query_string: str = "",
+                       json_body: Optional[Any] = None) -> Tuple[int, bytes]:
+    """Requête en mémoire sur une application ASGI (toute la pile FastAPI, sans socket ni client HTTP)."""
+    payload = json.dumps(json_body).encode() if json_body is not None else b""
+    headers = [(b"host", b"bench")]
+    if json_body is not None:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+        "root_path": "",
+    }
+    status, body = 0, []
+    received, finished = False, asyncio.Event()
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # Comme un serveur : bloque jusqu'à la fin de la réponse (StreamingResponse guette la déconnexion)
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    return status, b"".join(body)
+
+
+async def asgi_get(app, path: str, query_string: str = "") -> Tuple[int, bytes]:
+    return await asgi_request(app, "GET", path, query_string)
@@ -0,0 +1,116 @@
+"""Micro-banc du décodage des lignes : python -m bench.decode [--rows 1000] [--repeat 30] [--output decode.json]
+
+Mesure, sans Cassandra, le coût CPU (µs par ligne) et mémoire (octets alloués par ligne) de chaque
+étape entre les valeurs décodées par le driver et la réponse : row_factory, objets métier, JSON.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+from cassandra.query import named_tuple_factory
+from fastapi.encoders import jsonable_encoder
+
+from api.schemas import BookListItem, BookOut
+from models.book import Book, BookRepository
+from models.paging import json_default
+from models.rows import RowModel, cached_named_tuple_factory
+
+CATEGORY_COLUMNS = ["isbn", "title", "author", "available_copies", "total_copies"]
+BOOK_COLUMNS = ["isbn", "title", "author", "category", "publisher", "publication_year",
+                "total_copies", "available_copies", "description"]
+
+
+@dataclass
+class DictBook:
+    """Book sans __slots__ (référence : instances avec __dict__)."""
+    isbn: str
+    title: str
+    author: str
+    category: str
+    publisher: str
+    publication_year: int
+    total_copies: int
+    available_copies: int
+    description: str = ""
+
+
+def _values(rows: int) -> Dict[str, List[tuple]]:
+    """Valeurs de colonnes telles que décodées par le driver."""
+    return {
+        "category": [(f"978{i:010d}", f"Titre {i}", f"Auteur {i % 97}", i % 5, 5) for i in range(rows)],
+        "book": [(f"978{i:010d}", f"Titre {i}", f"Auteur {i % 97}", "Roman", "Gallimard", 1950 + i % 70,
+                  5, i % 5, "") for i in range(rows)],
+    }
+
+
+def measure(fn: Callable[[], Any], rows: int, repeat: int) -> Dict[str, float]:
+    """µs par ligne (meilleur passage) et octets alloués par ligne (pic tracemalloc d'un passage)."""
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"us_per_row": round(best / rows * 1e6, 3), "bytes_per_row": round(peak / rows, 1)}
+
+
+def run(rows: int = 1000, repeat: int = 30) -> Dict[str, Any]:
+    data = _values(rows)
+    cat, book = data["category"], data["book"]
+    cat_rows = cached_named_tuple_factory(CATEGORY_COLUMNS, cat)
+    book_rows = cached_named_tuple_factory(BOOK_COLUMNS, book)
+    books = [BookRepository._row_to_book(r) for r in book_rows]
+    dict_items = [BookRepository._category_item(r) for r in cat_rows]
+    list_item, book_out = RowModel(BookListItem), RowModel(BookOut)
+    dumps = json.JSONEncoder(default=json_default, ensure_ascii=False, separators=(",", ":")).encode
+
+    single = [[v] for v in cat]
+    cases = {
+        # 1) row_factory : une page de `rows` lignes, puis `rows` réponses d'une ligne (lectures par clé)
+        "row_factory.named_tuple.page": lambda: named_tuple_factory(CATEGORY_COLUMNS, cat),
+        "row_factory.cached.page": lambda: cached_named_tuple_factory(CATEGORY_COLUMNS, cat),
+        "row_factory.named_tuple.single_row": lambda: [named_tuple_factory(CATEGORY_COLUMNS, s) for s in single],
+        "row_factory.cached.single_row": lambda: [cached_named_tuple_factory(CATEGORY_COLUMNS, s) for s in single],
+        # 2) objets par ligne
+        "items.dict": lambda: [BookRepository._category_item(r) for r in cat_rows],
+        "items.asdict": lambda: [r._asdict() for r in cat_rows],
+        "items.pydantic_from_rows": lambda: list_item.many(cat_rows),
+        "book.dataclass": lambda: [DictBook(*r) for r in book_rows],
+        "book.dataclass_slots": lambda: [Book(*r) for r in book_rows],
+        "book.pydantic_from_slots": lambda: book_out.many(books),
+        # 3) réponse JSON d'un listing
+        "json.jsonable_encoder+json": lambda: json.dumps(jsonable_encoder({"items": dict_items})).encode(),
+        "json.dict+json.dumps": lambda: dumps([BookRepository._category_item(r) for r in cat_rows]).encode(),
+        "json.rows_to_bytes": lambda: list_item.json_many(cat_rows),
+    }
+    results = {name: measure(fn, rows, repeat) for name, fn in cases.items()}
+    return {"rows": rows, "repeat": repeat, "results": results}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.decode", description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000, help="Lignes par passage")
+    parser.add_argument("--repeat", type=int, default=30, help="Passages mesurés (meilleur temps gardé)")
+    parser.add_argument("--output", default=None, help="Fichier JSON du rapport (défaut: stdout)")
+    args = parser.parse_args(argv)
+
+    text = json.dumps(run(args.rows, args.repeat), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
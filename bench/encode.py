@@ -0,0 +1,111 @@
+"""Micro-banc de l'encodage des réponses : python -m bench.encode [--rows 10000] [--repeat 10] [--output encode.json]
+
+Mesure, via l'application FastAPI en ASGI (sans serveur HTTP ni Cassandra), le temps de réponse d'un
+listing de `--rows` lignes selon trois chemins :
+- jsonable_encoder : route sans response_model, JSONResponse (chemin historique de l'API)
+- response_model : items validés puis sérialisés par pydantic, encodés par ORJSONResponse
+- orjson : ORJSONResponse renvoyée directement (api.main.listing, chemin des listings)
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict
+
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+from api.schemas import BookBorrowItem, BookListItem, Page, UserBorrowItem
+from bench.asgi import asgi_get
+from models.book import BookRepository
+from models.borrow import BorrowRepository
+from models.rows import cached_named_tuple_factory
+
+
+def _listings(rows: int) -> Dict[str, tuple]:
+    """Items tels que produits par les décodeurs des repositories, et leur modèle de réponse."""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    books = cached_named_tuple_factory(
+        ["isbn", "title", "author", "available_copies", "total_copies"],
+        [(f"978{i:010d}", f"Titre {i}", f"Auteur {i % 97}", i % 5, 5) for i in range(rows)])
+    user_borrows = cached_named_tuple_factory(
+        ["isbn", "book_title", "borrow_date", "status", "return_date"],
+        [(f"978{i:010d}", f"Titre {i}", start + timedelta(hours=i), "RETURNED", start + timedelta(hours=i + 48))
+         for i in range(rows)])
+    book_borrows = cached_named_tuple_factory(
+        ["borrow_date", "user_id", "user_name", "status", "return_date", "book_title"],
+        [(start + timedelta(hours=i), uuid.UUID(int=i), f"Lecteur {i}", "BORROWED", None, "Titre")
+         for i in range(rows)])
+    return {
+        "books_by_category": ([BookRepository._category_item(r) for r in books], BookListItem),
+        "user_borrows": ([BorrowRepository._user_borrow_item(r) for r in user_borrows], UserBorrowItem),
+        "book_borrows": ([BorrowRepository._book_borrow_item(r) for r in book_borrows], BookBorrowItem),
+    }
+
+
+def _apps(content: Dict[str, Any], model) -> Dict[str, FastAPI]:
+    legacy = FastAPI()
+    typed = FastAPI(default_response_class=ORJSONResponse)
+
+    @legacy.get("/listing")
+    async def legacy_listing():
+        return content
+
+    @typed.get("/listing", response_model=Page[model])
+    async def typed_listing():
+        return content
+
+    @typed.get("/direct", response_model=Page[model])
+    async def direct_listing():
+        return ORJSONResponse(content)
+
+    return {"jsonable_encoder": (legacy, "/listing"), "response_model": (typed, "/listing"),
+            "orjson": (typed, "/direct")}
+
+
+async def _measure(call: Callable, rows: int, repeat: int) -> Dict[str, Any]:
+    status, body = await call()
+    if status != 200:
+        raise RuntimeError(f"réponse {status}: {body[:200]!r}")
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await call()
+        best = min(best, time.perf_counter() - t0)
+    return {"ms": round(best * 1000, 2), "us_per_row": round(best / rows * 1e6, 3), "bytes": len(body)}
+
+
+async def _run(rows: int, repeat: int) -> Dict[str, Any]:
+    results = {}
+    for name, (items, model) in _listings(rows).items():
+        content = {"items": items, "next_cursor": None}
+        for path_name, (app, path) in _apps(content, model).items():
+            results[f"{name}.{path_name}"] = await _measure(lambda: asgi_get(app, path), rows, repeat)
+    return results
+
+
+def run(rows: int = 10_000, repeat: int = 10) -> Dict[str, Any]:
+    return {"rows": rows, "repeat": repeat, "results": asyncio.run(_run(rows, repeat))}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.encode", description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000, help="Lignes par listing")
+    parser.add_argument("--repeat", type=int, default=10, help="Réponses mesurées (meilleur temps gardé)")
+    parser.add_argument("--output", default=None, help="Fichier JSON du rapport (défaut: stdout)")
+    args = parser.parse_args(argv)
+
+    text = json.dumps(run(args.rows, args.repeat), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,468 @@
+"""Session Cassandra en mémoire pour le banc de performance (sans cluster).
+
+`FakeSession` imite l'API de `cassandra.cluster.Session` utilisée par les repositories
+(prepare, execute, execute_async, BATCH, paging, compteurs, colonnes STATIC, LWT `IF` /
+`IF NOT EXISTS`, batchs conditionnels) à partir du schéma `schema/schema.cql`. Elle compte
+chaque requête exécutée et peut ajouter une latence réseau simulée (`latency`, en secondes)
+à chaque aller-retour.
+
+Ce n'est pas un moteur CQL : seul le sous-ensemble de requêtes écrites par les
+repositories est pris en charge (égalités, IN, bornes sur la clé de clustering ou sur
+token(clé de partition), LIMIT).
+"""
+import copy
+import os
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from uuid import UUID, uuid4
+from concurrent.futures import ThreadPoolExecutor
+
+from cassandra.cluster import ResultSet
+from cassandra.metadata import Murmur3Token
+from cassandra.query import (BatchStatement, BoundStatement, PreparedStatement, SimpleStatement,
+                             FETCH_SIZE_UNSET, named_tuple_factory)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema", "schema.cql")
+
+
+def parse_schema(path: str = SCHEMA_PATH):
+    """Tables du schéma -> colonnes, clé de partition, clustering (+ ordre DESC), compteurs, colonnes statiques."""
+    with open(path, encoding="utf-8") as f:
+        text = re.sub(r"--[^\n]*", "", f.read())
+    tables = {}
+    for m in re.finditer(r"CREATE TABLE IF NOT EXISTS (\w+)\s*\((.*?)\)\s*(WITH[^;]*)?;", text, re.S | re.I):
+        name, body, opts = m.group(1), m.group(2), m.group(3) or ""
+        cols, counters, statics, pk = [], set(), set(), None
+        for line in [l.strip().rstrip(",") for l in body.split("\n") if l.strip()]:
+            if line.upper().startswith("PRIMARY KEY"):
+                inner = line[line.index("(") + 1: line.rindex(")")]
+                if inner.startswith("("):
+                    part = inner[1: inner.index(")")]
+                    rest = inner[inner.index(")") + 1:]
+                    pk = ([c.strip() for c in part.split(",")], [c.strip() for c in rest.split(",") if c.strip()])
+                else:
+                    parts = [c.strip() for c in inner.split(",")]
+                    pk = ([parts[0]], parts[1:])
+                continue
+            toks = line.split()
+            cols.append(toks[0])
+            if toks[1] == "counter":
+                counters.add(toks[0])
+            if len(toks) > 2 and toks[2].upper() == "STATIC":
+                statics.add(toks[0])
+            if len(toks) > 2 and toks[2].upper() == "PRIMARY":
+                pk = ([toks[0]], [])
+        desc = set(re.findall(r"(\w+)\s+DESC", opts, re.I))
+        tables[name] = dict(cols=cols, pk=pk[0], ck=pk[1], desc=desc, counters=counters, static=statics)
+    return tables
+
+
+class FakePreparedStatement(PreparedStatement):
+    def __init__(self, query: str, parsed):
+        self.query_string = query
+        self.query_id = str(id(self)).encode()
+        self.keyspace = None
+        self.routing_key_indexes = None
+        self.column_metadata = []
+        self.result_metadata = None
+        self.is_idempotent = False
+        self.custom_payload = None
+        self.fetch_size = FETCH_SIZE_UNSET
+        self.consistency_level = None
+        self.serial_consistency_level = None
+        self.parsed = parsed
+
+    def bind(self, values):
+        bound = BoundStatement.__new__(BoundStatement)
+        bound.prepared_statement = self
+        bound.values = list(values or ())
+        bound.keyspace = None
+        bound.custom_payload = None
+        bound.fetch_size = self.fetch_size
+        bound.consistency_level = None
+        bound.serial_consistency_level = None
+        bound.is_idempotent = self.is_idempotent
+        bound._routing_key = None
+        return bound
+
+
+class FakeResponseFuture:
+    """Sous-ensemble de ResponseFuture : result(), callbacks (conservés d'une page à l'autre), pages suivantes."""
+    _continuous_paging_session = None
+    _col_types = None
+    coordinator_host = "fake"
+
+    def __init__(self, session, query, params, fetch_size, row_factory):
+        self.session = session
+        self.query = query
+        self.params = params
+        self.fetch_size = fetch_size
+        self.row_factory = row_factory
+        # Comme le driver : message.tracing = True demande une trace au coordinateur
+        self.message = SimpleNamespace(tracing=False)
+        self._paging_state = None
+        self._col_names = None
+        self._callbacks = []
+        self._errbacks = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._result = None
+        self._exc = None
+        self._trace_ids = []
+
+    @property
+    def has_more_pages(self):
+        return self._paging_state is not None
+
+    def _run(self, paging_state):
+        try:
+            names, rows, next_state = self.session._run(self.query, self.params, paging_state, self.fetch_size)
+            self._col_names = names
+            result, exc = ResultSet(self, self.row_factory(names, rows) if names else []), None
+        except Exception as e:
+            result, exc, next_state = None, e, None
+        with self._lock:
+            self._paging_state = next_state
+            if self.message.tracing:
+                self._trace_ids.append(uuid4())
+            self._result, self._exc = result, exc
+            calls = list(self._callbacks if exc is None else self._errbacks)
+            self._done.set()
+        for fn, args, kwargs in calls:
+            fn(result.current_rows if exc is None else exc, *args, **kwargs)
+
+    def send(self, paging_state, sync: bool):
+        with self._lock:
+            self._done.clear()
+            self._result = self._exc = None
+        if sync:
+            self._run(paging_state)
+        else:
+            self.session.executor.submit(self._run, paging_state)
+        return self
+
+    def result(self):
+        self._done.wait()
+        if self._exc is not None:
+            raise self._exc
+        return self._result
+
+    def start_fetching_next_page(self):
+        self.send(self._paging_state, sync=False)
+
+    def get_query_trace_ids(self):
+        return list(self._trace_ids)
+
+    def add_callbacks(self, callback, errback, callback_args=(), callback_kwargs=None,
+                      errback_args=(), errback_kwargs=None):
+        with self._lock:
+            self._callbacks.append((callback, callback_args, callback_kwargs or {}))
+            self._errbacks.append((errback, errback_args, errback_kwargs or {}))
+            if not self._done.is_set():
+                return
+            result, exc = self._result, self._exc
+        # Déjà terminée : appel immédiat (comme le driver)
+        if exc is None:
+            callback(result.current_rows, *callback_args, **(callback_kwargs or {}))
+        else:
+            errback(exc, *errback_args, **(errback_kwargs or {}))
+
+    def add_callback(self, fn, *args, **kwargs):
+        self.add_callbacks(fn, lambda exc: None, callback_args=args, callback_kwargs=kwargs)
+
+    def add_errback(self, fn, *args, **kwargs):
+        self.add_callbacks(lambda rows: None, fn, errback_args=args, errback_kwargs=kwargs)
+
+    def clear_callbacks(self):
+        with self._lock:
+            self._callbacks = []
+            self._errbacks = []
+
+
+class FakeSession:
+    """Stand-in en mémoire de cassandra.cluster.Session (thread-safe, compte les requêtes)."""
+
+    def __init__(self, latency: float = 0.0, schema_path: str = SCHEMA_PATH, record: bool = False,
+                 max_workers: int = 64):
+        self.tables = parse_schema(schema_path)
+        self.data = {t: {} for t in self.tables}
+        self.statics = {t: {} for t in self.tables}   # colonnes STATIC : clé de partition -> valeurs
+        self.latency = latency
+        self.record = record
+        self.calls = []                     # (requête, paramètres) si record=True
+        self.statement_counts = Counter()   # requêtes exécutées, par texte CQL
+        self.prepared = {}
+        self.lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.default_fetch_size = 5000
+        self.row_factory = named_tuple_factory
+        self.keyspace = "library_system"
+        self._request_init_callbacks = []
+
+    def add_request_init_listener(self, fn, *args, **kwargs):
+        self._request_init_callbacks.append((fn, args, kwargs))
+
+    def remove_request_init_listener(self, fn, *args, **kwargs):
+        self._request_init_callbacks.remove((fn, args, kwargs))
+
+    def prepare(self, query: str) -> FakePreparedStatement:
+        ps = FakePreparedStatement(query, self._parse(" ".join(query.split())))
+        self.prepared[ps.query_id] = ps
+        return ps
+
+    def set_keyspace(self, keyspace: str):
+        self.keyspace = keyspace
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    # ========= Parsing (sous-ensemble CQL des repositories) =========
+
+    def _parse(self, q: str):
+        m = re.match(r"INSERT INTO (\w+) \((.*?)\) VALUES \((.*?)\)( IF NOT EXISTS)?( USING TTL (\?|\d+))?$", q, re.I)
+        if m:
+            return ("insert", m.group(1), [c.strip() for c in m.group(2).split(",")], bool(m.group(4)), m.group(6))
+        m = re.match(r"SELECT (.*?) FROM (\w+)(?: WHERE (.*?))?(?: LIMIT (\?|\d+))?$", q, re.I)
+        if m:
+            cols = [c.strip() for c in m.group(1).split(",")]
+            return ("select", m.group(2), cols, self._where(m.group(3)), m.group(4))
+        m = re.match(r"UPDATE (\w+) SET (.*?) WHERE (.*?)(?: IF (.*))?$", q, re.I)
+        if m:
+            sets = []
+            for assignment in m.group(2).split(","):
+                col, expr = [x.strip() for x in assignment.split("=", 1)]
+                inc = re.match(r"(\w+) ([+-]) (\?|\d+)", expr)
+                sets.append((col, inc.group(2), inc.group(3)) if inc else (col, "=", expr))
+            cond = m.group(4)
+            if cond and cond.strip().upper() == "EXISTS":
+                cond = "EXISTS"
+            elif cond:
+                cond = self._where(cond)
+            return ("update", m.group(1), sets, self._where(m.group(3)), cond)
+        m = re.match(r"DELETE FROM (\w+) WHERE (.*?)(?: IF (EXISTS))?$", q, re.I)
+        if m:
+            return ("delete", m.group(1), self._where(m.group(2)), bool(m.group(3)))
+        raise ValueError(f"FakeSession: requête non supportée: {q}")
+
+    @staticmethod
+    def _where(clause):
+        if not clause:
+            return []
+        out = []
+        for cond in re.split(r" AND ", clause, flags=re.I):
+            m = re.match(r"(token\([\w, ]+\)|\w+) (=|IN|<=|>=|<|>) (.*)$", cond.strip(), re.I)
+            out.append((m.group(1), m.group(2).upper(), m.group(3).strip()))
+        return out
+
+    # ========= Exécution =========
+
+    def _future(self, query, parameters, paging_state, sync: bool) -> FakeResponseFuture:
+        if isinstance(query, str):
+            query = SimpleStatement(query)
+        fetch = query.fetch_size
+        if fetch is FETCH_SIZE_UNSET or fetch is None:
+            fetch = self.default_fetch_size
+        future = FakeResponseFuture(self, query, parameters, fetch, self.row_factory)
+        for fn, args, kwargs in self._request_init_callbacks:
+            fn(future, *args, **kwargs)
+        return future.send(paging_state, sync)
+
+    def execute(self, query, parameters=None, timeout=None, trace=False, custom_payload=None,
+                execution_profile=None, paging_state=None, host=None, execute_as=None):
+        return self._future(query, parameters, paging_state, sync=True).result()
+
+    def execute_async(self, query, parameters=None, trace=False, custom_payload=None, timeout=None,
+                      execution_profile=None, paging_state=None, host=None, execute_as=None):
+        return self._future(query, parameters, paging_state, sync=False)
+
+    def _run(self, query, params, paging_state, fetch_size):
+        if self.latency:
+            time.sleep(self.latency)  # aller-retour réseau simulé (hors verrou)
+        with self.lock:
+            if isinstance(query, BatchStatement):
+                return self._batch(query)
+            if isinstance(query, SimpleStatement):
+                if params is None:
+                    return self._run_prepared(self.prepare(query.query_string), (), paging_state, fetch_size)
+                query = self.prepare(query.query_string).bind(params)
+            if isinstance(query, BoundStatement):
+                query, params = query.prepared_statement, query.values
+            return self._run_prepared(query, params, paging_state, fetch_size)
+
+    @staticmethod
+    def _conditional(ps) -> bool:
+        parsed = ps.parsed
+        return bool(parsed[3] if parsed[0] in ("insert", "delete") else parsed[0] == "update" and parsed[4])
+
+    def _batch(self, query):
+        self._count("BATCH", None)
+        statements = [(self.prepared[query_id], values) for _, query_id, values in query._statements_and_parameters]
+        if not any(self._conditional(ps) for ps, _ in statements):
+            for ps, values in statements:
+                self._run_prepared(ps, values, None, None)
+            return None, [], None
+        # Batch conditionnel (LWT) : tout ou rien. Les conditions sont évaluées dans l'ordre du batch :
+        # placer les écritures conditionnelles en tête pour qu'elles voient l'état d'avant le batch.
+        touched = {ps.parsed[1] for ps, _ in statements}
+        snapshot = {t: (copy.deepcopy(self.data[t]), copy.deepcopy(self.statics[t])) for t in touched}
+        for ps, values in statements:
+            _, rows, _ = self._run_prepared(ps, values, None, None)
+            if self._conditional(ps) and not rows[0][0]:
+                for t, (data, statics) in snapshot.items():
+                    self.data[t], self.statics[t] = data, statics
+                return ["[applied]"], [(False,)], None
+        return ["[applied]"], [(True,)], None
+
+    def _count(self, query, params):
+        self.statement_counts[query] += 1
+        if self.record:
+            self.calls.append((query, params))
+
+    @staticmethod
+    def _value(token, params):
+        if token == "?":
+            return next(params)
+        if token.startswith("'"):
+            return token.strip("'")
+        return int(token)
+
+    def _run_prepared(self, ps, params, paging_state, fetch_size):
+        self._count(ps.query_string, params)
+        it = iter(params or ())
+        kind, table = ps.parsed[0], ps.parsed[1]
+        meta = dict(self.tables[table], statics=self.statics[table])
+        store = self.data[table]
+        return getattr(self, f"_{kind}")(ps.parsed, meta, store, it, paging_state, fetch_size)
+
+    def _insert(self, parsed, meta, store, it, paging_state, fetch_size):
+        _, _, cols, if_not_exists, ttl = parsed
+        row = {c: next(it) for c in cols}
+        if ttl == "?":
+            next(it)
+        part = store.setdefault(tuple(row[c] for c in meta["pk"]), {})
+        ck = tuple(row[c] for c in meta["ck"])
+        if if_not_exists:
+            if ck in part:
+                existing = part[ck]
+                return ["[applied]"] + cols, [(False, *[existing.get(c) for c in cols])], None
+            part[ck] = row
+            return ["[applied]"], [(True,)], None
+        part.setdefault(ck, {}).update(row)
+        return None, [], None
+
+    def _update(self, parsed, meta, store, it, paging_state, fetch_size):
+        _, _, sets, where_clause, cond = parsed
+        sets = [(c, op, self._value(v, it) if v == "?" or v[0].isdigit() or v.startswith("'") else v)
+                for c, op, v in sets]
+        where = {c: self._value(v, it) for c, _, v in where_clause}
+        pk = tuple(where[c] for c in meta["pk"])
+        if all(c in meta["static"] for c, _, _ in sets):
+            # Colonnes STATIC seules : une valeur par partition (clustering absent du WHERE)
+            part, ck = meta["statics"], pk
+        else:
+            part, ck = store.setdefault(pk, {}), tuple(where[c] for c in meta["ck"])
+        row = part.get(ck)
+        if cond == "EXISTS":
+            if row is None:
+                return ["[applied]"], [(False,)], None
+        elif cond:
+            expected = [(c, self._value(v, it)) for c, _, v in cond]
+            # Ligne absente : ses colonnes valent null (`IF c = null` s'applique, comme dans Cassandra)
+            if any((row or {}).get(c) != v for c, v in expected):
+                return (["[applied]"] + [c for c, _ in expected],
+                        [(False, *[row.get(c) if row else None for c, _ in expected])], None)
+        if row is None:
+            row = part[ck] = dict(where)
+        for c, op, v in sets:
+            if op == "=":
+                row[c] = v
+            elif op == "+":
+                row[c] = (row.get(c) or 0) + v
+            else:
+                row[c] = (row.get(c) or 0) - v
+        return (["[applied]"], [(True,)], None) if cond else (None, [], None)
+
+    def _delete(self, parsed, meta, store, it, paging_state, fetch_size):
+        _, _, where_clause, if_exists = parsed
+        conds = [(c, op, self._value(v, it)) for c, op, v in where_clause]
+        where = {c: v for c, op, v in conds if op == "="}
+        pk = tuple(where[c] for c in meta["pk"])
+        part = store.get(pk, {})
+        ranges = [(c, op, v) for c, op, v in conds if op in ("<", "<=", ">", ">=")]
+        if ranges:
+            for ck in [k for k in part if self._matches(dict(zip(meta["ck"], k)), ranges)]:
+                del part[ck]
+            return None, [], None
+        if len(where) == len(meta["pk"]):
+            existed = pk in store
+            store.pop(pk, None)
+            meta["statics"].pop(pk, None)
+        else:
+            existed = part.pop(tuple(where[c] for c in meta["ck"]), None) is not None
+        return (["[applied]"], [(existed,)], None) if if_exists else (None, [], None)
+
+    @staticmethod
+    def _token(row, column: str) -> int:
+        """token(a, b) : Murmur3 de la clé de partition (sérialisation simplifiée, stable)."""
+        key = b""
+        for c in column[column.index("(") + 1:-1].split(","):
+            v = row.get(c.strip())
+            if isinstance(v, UUID):
+                key += v.bytes
+            elif isinstance(v, int):
+                key += v.to_bytes(8, "big", signed=True)
+            else:
+                key += str(v).encode()
+        return Murmur3Token.hash_fn(key)
+
+    @classmethod
+    def _matches(cls, row, conds) -> bool:
+        for c, op, v in conds:
+            x = cls._token(row, c) if c.startswith("token(") else row.get(c)
+            if op == "=" and x != v:
+                return False
+            if op == "IN" and x not in v:
+                return False
+            if op in ("<", "<=", ">", ">=") and x is None:
+                return False
+            if (op == "<" and not x < v) or (op == "<=" and not x <= v) \
+                    or (op == ">" and not x > v) or (op == ">=" and not x >= v):
+                return False
+        return True
+
+    def _select(self, parsed, meta, store, it, paging_state, fetch_size):
+        _, _, cols, where_clause, limit = parsed
+        conds = [(c, op, self._value(v, it)) for c, op, v in where_clause]
+        limit = next(it) if limit == "?" else (int(limit) if limit else None)
+        eq = {c: v for c, op, v in conds if op == "="}
+        in_pk = [(c, v) for c, op, v in conds if op == "IN" and c in meta["pk"]]
+        if all(c in eq for c in meta["pk"]):
+            keys = [tuple(eq[c] for c in meta["pk"])]
+        elif in_pk and all(c in eq or c == in_pk[0][0] for c in meta["pk"]):
+            keys = [tuple(v if c == in_pk[0][0] else eq[c] for c in meta["pk"]) for v in in_pk[0][1]]
+        else:
+            keys = list(store)  # scan complet (ALLOW FILTERING / compaction)
+
+        cols = meta["cols"] if cols == ["*"] else cols
+        with_static = any(c in meta["static"] for c in cols)
+        rows = []
+        for pk in keys:
+            part, static = store.get(pk, {}), meta["statics"].get(pk, {})
+            items = list(part.items())
+            for i, c in reversed(list(enumerate(meta["ck"]))):
+                items.sort(key=lambda kv: kv[0][i], reverse=c in meta["desc"])
+            if not items and static and with_static:
+                # Partition sans ligne : Cassandra renvoie une ligne portant les seules colonnes statiques
+                items = [(None, dict(zip(meta["pk"], pk)))]
+            rows.extend(dict(r, **static) if static else r for _, r in items if self._matches(r, conds))
+        if limit is not None:
+            rows = rows[:limit]
+
+        out = [tuple(r.get(c) for c in cols) for r in rows]
+        start = int(paging_state) if paging_state else 0
+        if fetch_size and len(out) - start > fetch_size:
+            return cols, out[start:start + fetch_size], str(start + fetch_size).encode()
+        return cols, out[start:], None
@@ -0,0 +1,517 @@
+import asyncio
+import math
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from models.book import Book, BookRepository
+from models.borrow import BorrowRepository
+from models.fulfilment import ReservationFulfiller
+from models.projection import Projector, library_handlers
+from models.reservation import ReservationRepository
+from models.statistics import StatisticsRepository
+from models.user import UserRepository
+
+SCENARIOS = ["add_book", "get_book_by_isbn", "get_books_by_isbns", "list_by_category",
+             "list_by_author", "user_borrows", "borrow_return", "borrow_contention", "reservation_queue",
+             "reservation_release", "stats_api"]
+
+CATEGORIES = ["Science Fiction", "Fantasy", "Thriller", "Romance",
+              "Histoire", "Science", "Biographie", "Philosophie"]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentile par rang le plus proche (valeurs déjà triées)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+@dataclass
+class OpStats:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    elapsed_s: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        values = sorted(self.latencies)
+        ops = len(values)
+        ms = lambda s: round(s * 1000, 3)
+        return {
+            "ops": ops,
+            "errors": self.errors,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "ops_per_sec": round(ops / self.elapsed_s, 1) if self.elapsed_s > 0 else 0.0,
+            "mean_ms": ms(sum(values) / ops) if ops else 0.0,
+            "p50_ms": ms(percentile(values, 50)),
+            "p95_ms": ms(percentile(values, 95)),
+            "p99_ms": ms(percentile(values, 99)),
+            "max_ms": ms(values[-1]) if values else 0.0,
+        }
+
+
+class Recorder:
+    """Latences par opération (thread-safe). Une opération qui renvoie False/None compte comme erreur."""
+
+    def __init__(self):
+        self.ops: Dict[str, OpStats] = {}
+        self._lock = threading.Lock()
+
+    def stats(self, name: str) -> OpStats:
+        with self._lock:
+            return self.ops.setdefault(name, OpStats())
+
+    def record(self, name: str, seconds: float, ok: bool):
+        stats = self.stats(name)
+        with self._lock:
+            stats.latencies.append(seconds)
+            if not ok:
+                stats.errors += 1
+
+    def timed(self, name: str, fn: Callable, *args):
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+            ok = result is not False and result is not None
+        except Exception as e:
+            logger.debug(f"{name}: {e}")
+            result, ok = None, False
+        self.record(name, time.perf_counter() - start, ok)
+        return result
+
+    async def atimed(self, name: str, coro_fn: Callable, *args):
+        start = time.perf_counter()
+        try:
+            result = await coro_fn(*args)
+            ok = result is not False and result is not None
+        except Exception as e:
+            logger.debug(f"{name}: {e}")
+            result, ok = None, False
+        self.record(name, time.perf_counter() - start, ok)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: stats.to_dict() for name, stats in self.ops.items()}
+
+
+def run_concurrently(recorder: Recorder, names: List[str], work: Callable[[int], None],
+                     n: int, concurrency: int):
+    """Exécute work(i) pour i in range(n) avec `concurrency` threads ; la durée est imputée à `names`."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(work, range(n)))
+    elapsed = time.perf_counter() - start
+    for name in names:
+        recorder.stats(name).elapsed_s += elapsed
+
+
+async def arun_concurrently(recorder: Recorder, names: List[str], work: Callable[[int], Any],
+                            n: int, concurrency: int):
+    """Variante asyncio : au plus `concurrency` coroutines work(i) en vol."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i):
+        async with semaphore:
+            await work(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(n)))
+    elapsed = time.perf_counter() - start
+    for name in names:
+        recorder.stats(name).elapsed_s += elapsed
+
+
+class Benchmark:
+    """Banc de charge des repositories et de l'API sur une session (FakeSession ou cluster réel)."""
+
+    def __init__(self, session, books: int = 1000, users: int = 200, ops: int = 2000,
+                 concurrency: int = 32, seed: int = 42, prefix: str = "BENCH",
+                 inventory: str = "lwt", hot_books: int = 4, hot_copies: int = 5, projection: str = "inline",
+                 fulfilment: str = "inline", holds: int = 2000):
+        self.session = session
+        self.books = books
+        self.users = users
+        self.ops = ops
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.inventory = inventory
+        self.hot_books = hot_books
+        self.hot_copies = hot_copies
+        self.projection = projection
+        self.fulfilment = fulfilment
+        self.holds = holds
+
+        self.book_repo = BookRepository(session, projection=projection)
+        self.user_repo = UserRepository(session)
+        self.borrow_repo = BorrowRepository(session, inventory=inventory, projection=projection,
+                                            fulfilment=fulfilment)
+        self.reservation_repo = ReservationRepository(session)
+        # Mode outbox : projecteur en arrière-plan pendant les scénarios, vidé avant les vérifications
+        self.projector = (Projector(session, library_handlers(self.book_repo, self.borrow_repo), poll_interval=0.05)
+                          if projection == "outbox" else None)
+        self.stats_repo = StatisticsRepository(session)
+        self.recorder = Recorder()
+        self.checks: Dict[str, Any] = {}   # invariants vérifiés par les scénarios (ex: sur-réservation)
+
+        self.catalogue: List[Book] = []
+        self.user_ids: List[Any] = []
+
+    # ========= Jeu de données =========
+
+    def _make_book(self, i: int) -> Book:
+        # ~20 livres par auteur, 8 catégories : des listings de taille réaliste
+        return Book(
+            isbn=f"{self.prefix}-{i:09d}",
+            title=f"Livre {i}",
+            author=f"{self.prefix} Auteur {i // 20}",
+            category=f"{self.prefix} {CATEGORIES[i % len(CATEGORIES)]}",
+            publisher="Bench",
+            publication_year=1950 + i % 75,
+            total_copies=1_000_000,   # le stock ne doit pas limiter borrow_return
+            available_copies=1_000_000,
+            description="",
+        )
+
+    def _ensure_users(self):
+        if self.user_ids:
+            return
+        for i in range(self.users):
+            user_id = self.user_repo.create_user(f"bench{i}@example.org", "Bench", f"User{i}")
+            if user_id:
+                self.user_ids.append(user_id)
+
+    def _ensure_books(self):
+        """Catalogue écrit sans mesure quand le scénario add_book n'a pas tourné."""
+        if not self.catalogue:
+            self.catalogue = [self._make_book(i) for i in range(self.books)]
+            for book in self.catalogue:
+                self.book_repo.add_book(book)
+
+    # ========= Scénarios =========
+
+    def add_book(self):
+        self.catalogue = [self._make_book(i) for i in range(self.books)]
+        run_concurrently(self.recorder, ["add_book"],
+                         lambda i: self.recorder.timed("add_book", self.book_repo.add_book, self.catalogue[i]),
+                         len(self.catalogue), self.concurrency)
+
+    def get_book_by_isbn(self):
+        self._ensure_books()
+        picks = [self.rng.choice(self.catalogue).isbn for _ in range(self.ops)]
+        run_concurrently(self.recorder, ["get_book_by_isbn"],
+                         lambda i: self.recorder.timed("get_book_by_isbn", self.book_repo.get_book_by_isbn, picks[i]),
+                         self.ops, self.concurrency)
+
+    def get_books_by_isbns(self, batch: int = 50):
+        """Une étagère de `batch` livres en une lecture groupée (vs `batch` get_book_by_isbn)."""
+        self._ensure_books()
+        picks = [[self.rng.choice(self.catalogue).isbn for _ in range(batch)] for _ in range(self.ops)]
+        run_concurrently(self.recorder, ["get_books_by_isbns"],
+                         lambda i: self.recorder.timed("get_books_by_isbns",
+                                                       self.book_repo.get_books_by_isbns, picks[i]),
+                         self.ops, self.concurrency)
+
+    def list_by_category(self):
+        self._ensure_books()
+        picks = [self.rng.choice(self.catalogue).category for _ in range(self.ops)]
+        run_concurrently(self.recorder, ["list_by_category"],
+                         lambda i: self.recorder.timed("list_by_category",
+                                                       self.book_repo.get_books_by_category_page, picks[i]),
+                         self.ops, self.concurrency)
+
+    def list_by_author(self):
+        self._ensure_books()
+        picks = [self.rng.choice(self.catalogue).author for _ in range(self.ops)]
+        run_concurrently(self.recorder, ["list_by_author"],
+                         lambda i: self.recorder.timed("list_by_author",
+                                                       self.book_repo.get_books_by_author_page, picks[i]),
+                         self.ops, self.concurrency)
+
+    def borrow_return(self):
+        """Chaque opération = un emprunt puis son retour (couple user/livre distinct par opération)."""
+        self._ensure_books()
+        self._ensure_users()
+        pairs = [(self.user_ids[i % len(self.user_ids)], self.catalogue[i % len(self.catalogue)])
+                 for i in range(self.ops)]
+
+        def work(i):
+            user_id, book = pairs[i]
+            if self.recorder.timed("borrow_book", self.borrow_repo.borrow_book,
+                                   user_id, book.isbn, book.title, "Bench"):
+                self.recorder.timed("return_book", self.borrow_repo.return_book, user_id, book.isbn)
+
+        # Un même couple (user, livre) ne doit pas être en vol deux fois : on découpe en vagues
+        # (les couples se répètent tous les lcm(users, livres) opérations)
+        wave = min(math.lcm(len(self.user_ids), len(self.catalogue)), self.ops) or 1
+        for start in range(0, self.ops, wave):
+            run_concurrently(self.recorder, ["borrow_book", "return_book"],
+                             lambda i, s=start: work(s + i), min(wave, self.ops - start), self.concurrency)
+
+    def borrow_contention(self):
+        """Emprunts simultanés de quelques livres « chauds » à `hot_copies` exemplaires, puis retours.
+
+        Vérifie l'invariant de stock : jamais plus d'emprunts réussis que d'exemplaires,
+        et stock (autoritaire et listings) revenu à hot_copies après les retours.
+        """
+        self._ensure_users()
+        hot = [replace(self._make_book(i), isbn=f"{self.prefix}-HOT-{i:03d}", title=f"Livre chaud {i}",
+                       total_copies=self.hot_copies, available_copies=self.hot_copies)
+               for i in range(self.hot_books)]
+        for book in hot:
+            self.book_repo.add_book(book)
+
+        users = len(self.user_ids)
+        n = min(self.ops, users * len(hot))   # couples (user, livre) tous distincts
+        pairs = [(self.user_ids[i % users], hot[(i // users) % len(hot)]) for i in range(n)]
+        won = [False] * n
+
+        def borrow(i):
+            user_id, book = pairs[i]
+            won[i] = bool(self.recorder.timed("borrow_hot", self.borrow_repo.borrow_book,
+                                              user_id, book.isbn, book.title, "Bench"))
+
+        run_concurrently(self.recorder, ["borrow_hot"], borrow, n, self.concurrency)
+        # Un refus (plus d'exemplaire) est le comportement attendu, pas une erreur
+        self.recorder.stats("borrow_hot").errors = 0
+
+        winners = [i for i in range(n) if won[i]]
+        successes = {book.isbn: 0 for book in hot}
+        for i in winners:
+            successes[pairs[i][1].isbn] += 1
+
+        run_concurrently(self.recorder, ["return_hot"],
+                         lambda k: self.recorder.timed("return_hot", self.borrow_repo.return_book,
+                                                       pairs[winners[k]][0], pairs[winners[k]][1].isbn),
+                         len(winners), self.concurrency)
+        self._settle()
+
+        drift = 0
+        for book in hot:
+            stored = self.book_repo.get_book_by_isbn(book.isbn)
+            drift += abs((stored.available_copies if stored else 0) - self.hot_copies)
+        self.checks["borrow_contention"] = {
+            "inventory": self.inventory,
+            "hot_books": len(hot),
+            "copies_per_book": self.hot_copies,
+            "borrows_attempted": n,
+            "borrows_succeeded": len(winners),
+            "oversold": sum(max(0, c - self.hot_copies) for c in successes.values()),
+            "stock_drift_after_returns": drift,
+        }
+
+    def reservation_queue(self):
+        """Un titre chaud avec `holds` réservations en attente : chaque retour sert la suivante.
+
+        Les retours s'enchaînent (le réservataire servi rend à son tour) : la latence de
+        `return_fulfil` ne doit pas grandir avec la part de la file déjà servie.
+        """
+        book = replace(self._make_book(0), isbn=f"{self.prefix}-QUEUE-000", title="Livre réservé",
+                       total_copies=self.hot_copies, available_copies=self.hot_copies)
+        self.book_repo.add_book(book)
+        holders = [uuid.uuid4() for _ in range(self.hot_copies)]
+        for user_id in holders:
+            self.borrow_repo.borrow_book(user_id, book.isbn, book.title, "Bench")
+
+        waiting = [uuid.uuid4() for _ in range(self.holds)]
+        run_concurrently(self.recorder, ["reserve"],
+                         lambda i: self.recorder.timed("reserve", self.reservation_repo.add_reservation,
+                                                       book.isbn, waiting[i], f"Waiter {i}"),
+                         len(waiting), self.concurrency)
+        queue = [r["user_id"] for r in self.reservation_repo.list_reservations(book.isbn)]
+
+        holders = deque(holders)
+        cycles = min(self.ops, len(queue))
+
+        def cycle(i):
+            self.recorder.timed("return_fulfil", self.borrow_repo.return_book, holders.popleft(), book.isbn)
+            if self.fulfilment == "worker":
+                self.borrow_repo.fulfiller.flush(timeout=30)
+            holders.append(queue[i])   # FIFO : le i-ème retour sert la i-ème réservation
+
+        # Séquentiel : le réservataire servi doit avoir son exemplaire avant de le rendre
+        run_concurrently(self.recorder, ["return_fulfil"], cycle, cycles, 1)
+
+        statuses = [r["status"] for r in self.reservation_repo.list_reservations(book.isbn)]
+        served = statuses.count("FULFILLED")
+        self.checks["reservation_queue"] = {
+            **self.borrow_repo.fulfiller.stats(),
+            "holds": len(queue),
+            "returns": cycles,
+            "served": served,
+            # servies = préfixe de la file, aucune réservation servie deux fois
+            "fifo": all(st != "PENDING" for st in statuses[:served]) and "FULFILLED" not in statuses[served:],
+            "stock_left": self.book_repo.get_book_by_isbn(book.isbn).available_copies,
+        }
+
+    def reservation_release(self):
+        """Deux retours simultanés sur un titre réservé deux fois ; l'écriture du premier échoue.
+
+        Pendant l'écriture du premier (réservation A), le second retour avance la tête et sert B :
+        le premier ne peut plus rendre la tête. A doit être remise en file et servie au retour
+        suivant, jamais rester PENDING derrière la tête.
+        """
+        book = replace(self._make_book(0), isbn=f"{self.prefix}-RELEASE-000", title="Livre réservé",
+                       total_copies=2, available_copies=2)
+        self.book_repo.add_book(book)
+        waiting = [uuid.uuid4() for _ in range(2)]
+        for i, user_id in enumerate(waiting):
+            self.reservation_repo.add_reservation(book.isbn, user_id, f"Waiter {i}")
+        fulfiller = ReservationFulfiller(self.borrow_repo, self.reservation_repo, mode="off")
+
+        repo = self.borrow_repo
+        write = repo._write_and_invalidate
+
+        def failing_write(user_id, isbn, plan):
+            repo._write_and_invalidate = write   # un seul échec
+            fulfiller.fulfil_one(isbn)           # second retour, pendant l'écriture du premier
+            raise RuntimeError("écriture refusée (simulée)")
+
+        repo._write_and_invalidate = failing_write
+        try:
+            fulfiller.fulfil_one(book.isbn)
+        except RuntimeError:
+            pass
+        finally:
+            repo._write_and_invalidate = write
+        fulfiller.fulfil(book.isbn)   # retour suivant
+
+        rows = self.reservation_repo.list_reservations(book.isbn)
+        served = [r["user_id"] for r in rows if r["status"] == "FULFILLED"]
+        self.checks["reservation_release"] = {
+            "requeued": fulfiller.requeued,
+            "served": len(served),
+            "served_twice": len(served) - len(set(served)),
+            "stuck_pending": sum(1 for r in rows if r["status"] == "PENDING"),
+            "stock_left": self.book_repo.get_book_by_isbn(book.isbn).available_copies,
+        }
+
+    def user_borrows(self):
+        self._ensure_users()
+        picks = [self.rng.choice(self.user_ids) for _ in range(self.ops)]
+        run_concurrently(self.recorder, ["user_borrows"],
+                         lambda i: self.recorder.timed("user_borrows",
+                                                       self.borrow_repo.get_user_borrows_page, picks[i]),
+                         self.ops, self.concurrency)
+
+    def stats_api(self):
+        """GET /stats à travers toute la pile FastAPI (ASGI en mémoire, sans serveur HTTP)."""
+        import api.main as api
+        from bench.asgi import asgi_get
+
+        self.borrow_repo.stats.flush()
+        self.stats_repo.rebuild_leaderboard()
+        api.init_repositories(self.session)
+
+        async def call():
+            status, _ = await asgi_get(api.app, "/stats", "top=10")
+            return status == 200
+
+        async def main():
+            await arun_concurrently(self.recorder, ["stats_api"],
+                                    lambda i: self.recorder.atimed("stats_api", call),
+                                    self.ops, self.concurrency)
+
+        asyncio.run(main())
+
+    # ========= Exécution =========
+
+    def _settle(self):
+        """Attend que les tables dénormalisées aient rattrapé les écritures (listings ou outbox)."""
+        if self.projector is not None:
+            return self.projector.drain(timeout=60)
+        return self.borrow_repo.listings.flush(timeout=30)
+
+    def _listing_drift(self) -> int:
+        """Livres absents des listings par catégorie ou dont le stock diffère de books_by_isbn."""
+        authoritative = self.book_repo.get_books_by_isbns([b.isbn for b in self.catalogue])
+        listed = {}
+        for category in {b.category for b in self.catalogue}:
+            listed.update((r["isbn"], r["available_copies"]) for r in self.book_repo.get_books_by_category(category))
+        return sum(1 for isbn, book in authoritative.items()
+                   if book is None or listed.get(isbn) != book.available_copies)
+
+    def run(self, scenarios: Optional[List[str]] = None) -> Dict[str, Any]:
+        if self.projector is not None:
+            self.projector.start()
+        for name in scenarios or SCENARIOS:
+            if name not in SCENARIOS:
+                raise ValueError(f"scénario inconnu: {name} ({', '.join(SCENARIOS)})")
+            logger.info(f"▶️  {name}")
+            getattr(self, name)()
+        if self.projector is not None:
+            drained = self._settle()
+            # Retard de projection mesuré pendant les scénarios + convergence des listings
+            self.checks["projection"] = {**self.projector.stats(), "drained": drained,
+                                         "listing_drift": self._listing_drift()}
+            self.projector.close()
+        self.borrow_repo.fulfiller.close()
+        self.borrow_repo.listings.close()
+        self.borrow_repo.stats.close()
+        if self.borrow_repo.stats.borrows_recorded:
+            # Coalescence write-behind : écritures counter envoyées pour N emprunts
+            self.checks["stats_aggregation"] = self.borrow_repo.stats.stats()
+        return {
+            "config": {"books": self.books, "users": self.users, "ops": self.ops,
+                       "concurrency": self.concurrency, "inventory": self.inventory,
+                       "projection": self.projection, "fulfilment": self.fulfilment},
+            "results": self.recorder.to_dict(),
+            "checks": self.checks,
+        }
+
+
+def failures(report: Dict[str, Any]) -> List[str]:
+    """Opérations en erreur et invariants violés : le rapport ne mesure alors rien d'exploitable."""
+    failed = [f"{name}: {r['errors']}/{r['ops']} opération(s) en erreur"
+              for name, r in report["results"].items() if r["errors"]]
+    checks = report["checks"]
+    contention = checks.get("borrow_contention")
+    if contention:
+        if contention["borrows_attempted"] and not contention["borrows_succeeded"]:
+            failed.append("borrow_contention: aucun emprunt réussi")
+        if contention["oversold"]:
+            failed.append(f"borrow_contention: {contention['oversold']} emprunt(s) au-delà du stock")
+        if contention["stock_drift_after_returns"]:
+            failed.append(f"borrow_contention: stock décalé de {contention['stock_drift_after_returns']} après retours")
+    queue = checks.get("reservation_queue")
+    if queue:
+        if queue["returns"] and not queue["served"] and report["config"]["fulfilment"] != "off":
+            failed.append("reservation_queue: aucune réservation servie")
+        if not queue["fifo"]:
+            failed.append("reservation_queue: ordre FIFO non respecté")
+    release = checks.get("reservation_release")
+    if release:
+        if release["stuck_pending"] or release["served"] != 2:
+            failed.append(f"reservation_release: {release['stuck_pending']} réservation(s) bloquée(s) "
+                          f"derrière la tête, {release['served']}/2 servie(s)")
+        if release["served_twice"]:
+            failed.append("reservation_release: réservation servie deux fois")
+    projection = checks.get("projection")
+    if projection:
+        if not projection["drained"]:
+            failed.append("projection: outbox non rattrapée")
+        if projection["listing_drift"]:
+            failed.append(f"projection: {projection['listing_drift']} listing(s) divergent(s)")
+    return failed
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float = 0.25) -> List[str]:
+    """Régressions par rapport à une référence : p95 plus lent ou débit plus faible de plus de max_regression."""
+    regressions = []
+    for name, current in report["results"].items():
+        ref = baseline.get("results", {}).get(name)
+        if not ref:
+            continue
+        if ref["p95_ms"] and current["p95_ms"] > ref["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {ref['p95_ms']}ms -> {current['p95_ms']}ms")
+        if ref["ops_per_sec"] and current["ops_per_sec"] < ref["ops_per_sec"] * (1 - max_regression):
+            regressions.append(f"{name}: {ref['ops_per_sec']} ops/s -> {current['ops_per_sec']} ops/s")
+    return regressions
@@ -1,13 +1,27 @@
+import json
+import os
+import time
+import urllib.request
+from datetime import datetime, timezone
+
 import click
+from functools import cached_property
 from uuid import UUID
 from tabulate import tabulate
 
 from config.database import CassandraConnection
 from models.book import BookRepository, Book
 from models.user import UserRepository
+from models.aggregator import StatsAggregator
 from models.borrow import BorrowRepository
 from models.reservation import ReservationRepository
-from models.statistics import StatisticsRepository
+from models.statistics import StatisticsRepository, LEADERBOARD_SIZE
+from models.importer import CatalogueImporter
+from models.migration import BucketMigrator
+from models.cache import LibraryCache, CachedBookRepository, CachedUserRepository
+from models.paging import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, json_default
+from models.projection import Projector, library_handlers
+from models.overdue import OverdueFilter, audit_scan
 
 
 @click.group()
@@ -15,16 +29,88 @@ def cli():
     """📚 Système de Gestion de Bibliothèque"""
     pass
 
-# Connexion globale
-db = CassandraConnection(keyspace="library_system")
-session = db.connect()
 
-book_repo = BookRepository(session)
-user_repo = UserRepository(session)
-borrow_repo = BorrowRepository(session)
-reservation_repo = ReservationRepository(session)
-stats_repo = StatisticsRepository(session)
+# Connexion paresseuse
+class Services:
+    """Connexion et repositories créés à la première commande qui en a besoin.
+
+    `--help` ou une option invalide ne contactent pas le cluster ; les requêtes préparées
+    ne le sont qu'au premier usage (cf. models/statements.py).
+    """
+
+    def __init__(self):
+        self.db = CassandraConnection(keyspace="library_system")
+        self.cache = LibraryCache()
+        # Même mode que l'API (cf. PROJECTION_MODE dans api/main.py)
+        self.projection = os.getenv("PROJECTION_MODE", "inline")
+        self.max_active = int(os.getenv("MAX_ACTIVE_LOANS", "0")) or None  # 0 = illimité
+        self.loan_days = int(os.getenv("LOAN_DAYS", "21"))
+        # Tables *_month (cf. HISTORY_BUCKETED dans api/main.py) : à activer après migrate-buckets
+        self.bucketed = os.getenv("HISTORY_BUCKETED", "0") == "1"
+
+    @cached_property
+    def session(self):
+        return self.db.connect()
+
+    @cached_property
+    def book_repo(self):
+        return CachedBookRepository(BookRepository(self.session, projection=self.projection), self.cache.books)
+
+    @cached_property
+    def user_repo(self):
+        return CachedUserRepository(UserRepository(self.session), self.cache.users)
+
+    @cached_property
+    def stats_repo(self):
+        return StatisticsRepository(self.session)
+
+    @cached_property
+    def borrow_repo(self):
+        # Process court : compteurs écrits à chaque emprunt, classement mis à jour aussitôt
+        stats_buffer = StatsAggregator(self.session, durability="sync", on_flush=self.stats_repo.refresh_leaderboard)
+        # Process court : réservation servie pendant le retour (pas de thread à vider avant de sortir)
+        return BorrowRepository(self.session, cache=self.cache, stats=stats_buffer, projection=self.projection,
+                                fulfilment="inline", max_active=self.max_active, loan_days=self.loan_days,
+                                bucketed=self.bucketed)
+
+    @cached_property
+    def projector(self):
+        return Projector(self.session, library_handlers(self.book_repo.repo, self.borrow_repo))
+
+    @cached_property
+    def reservation_repo(self):
+        return ReservationRepository(self.session, bucketed=self.bucketed)
+
+    def close(self):
+        if "session" in self.__dict__:
+            self.db.close()
+
+
+services = Services()
+
 
+# Options de pagination communes aux listings
+def paging_options(f):
+    f = click.option('--next', 'cursor', default=None, help="Curseur de la page suivante")(f)
+    f = click.option('--page-size', default=DEFAULT_PAGE_SIZE, show_default=True,
+                     type=click.IntRange(1, MAX_PAGE_SIZE), help="Lignes par page")(f)
+    return f
+
+def echo_next(page):
+    if page.next_cursor:
+        click.echo(click.style(f"➡️  Page suivante: --next {page.next_cursor}", fg='cyan'))
+
+# Export complet en NDJSON sur stdout (partition lue page par page, mémoire constante)
+ndjson_option = click.option('--ndjson', is_flag=True,
+                             help="Tout le listing en NDJSON (ignore --page-size / --next)")
+
+def echo_ndjson(items):
+    try:
+        for item in items:
+            click.echo(json.dumps(item, default=json_default, ensure_ascii=False))
+    except Exception as e:
+        click.echo(click.style(f"❌ Export interrompu: {e}", fg='red'), err=True)
+        raise SystemExit(1)
 
 # ========== BOOKS ==========
 
@@ -55,7 +141,7 @@ def add(isbn, title, author, category, publisher, year, copies, description):
         description=description
     )
 
-    if book_repo.add_book(book):
+    if services.book_repo.add_book(book):
         click.echo(click.style(f"✅ Livre ajouté: {title}", fg='green'))
     else:
         click.echo(click.style("❌ Erreur ajout livre", fg='red'))
@@ -63,7 +149,7 @@ def add(isbn, title, author, category, publisher, year, copies, description):
 @books.command()
 @click.option('--isbn', prompt='ISBN')
 def search(isbn):
-    book = book_repo.get_book_by_isbn(isbn)
+    book = services.book_repo.get_book_by_isbn(isbn)
     if book:
         data = [
             ["ISBN", book.isbn],
@@ -80,29 +166,96 @@ def search(isbn):
 
 @books.command(name="list-by-category")
 @click.option('--category', prompt='Catégorie')
-def list_by_category(category):
-    books = book_repo.get_books_by_category(category)
+@paging_options
+@ndjson_option
+def list_by_category(category, page_size, cursor, ndjson):
+    if ndjson:
+        return echo_ndjson(services.book_repo.iter_books_by_category(category))
+    page = services.book_repo.get_books_by_category_page(category, page_size, cursor)
+    books = page.items
     if books:
         data = [[b["isbn"], b["title"], b["author"], f"{b['available_copies']}/{b['total_copies']}"] for b in books]
         headers = ['ISBN', 'Titre', 'Auteur', 'Dispo']
         click.echo("\n" + tabulate(data, headers=headers, tablefmt="grid"))
+        echo_next(page)
     else:
         click.echo(click.style("Aucun livre trouvé", fg='yellow'))
 
 @books.command()
 @click.option('--author', prompt='Auteur', help='Nom de l’auteur')
-def list_by_author(author):
+@paging_options
+@ndjson_option
+def list_by_author(author, page_size, cursor, ndjson):
     """Lister les livres d'un auteur"""
-    books = book_repo.get_books_by_author(author)
+    if ndjson:
+        return echo_ndjson(services.book_repo.iter_books_by_author(author))
+    page = services.book_repo.get_books_by_author_page(author, page_size, cursor)
+    books = page.items
 
     if books:
         data = [[b['isbn'], b['title'], b['category'], f"{b['available_copies']}/{b['total_copies']}"]
                 for b in books]
         headers = ['ISBN', 'Titre', 'Catégorie', 'Dispo']
         click.echo("\n" + tabulate(data, headers=headers, tablefmt="grid"))
+        echo_next(page)
     else:
         click.echo(click.style("Aucun livre trouvé pour cet auteur", fg='yellow'))
 
+@books.command()
+@click.argument('query')
+@paging_options
+def find(query, page_size, cursor):
+    """Rechercher un livre (titre, auteur, description ; accents et mots partiels acceptés)"""
+    page = services.book_repo.search_books(query, page_size, cursor)
+    books = page.items
+
+    if books:
+        data = [[b['isbn'], b['title'], b['author'], f"{b['available_copies']}/{b['total_copies']}", b['score']]
+                for b in books]
+        headers = ['ISBN', 'Titre', 'Auteur', 'Dispo', 'Score']
+        click.echo("\n" + tabulate(data, headers=headers, tablefmt="grid"))
+        echo_next(page)
+    else:
+        click.echo(click.style("Aucun livre ne correspond", fg='yellow'))
+
+@books.command()
+@click.option('--page-size', default=1000, show_default=True, help="Livres lus par page du scan")
+def reindex(page_size):
+    """(Re)construire l'index de recherche depuis books_by_isbn (catalogue existant)"""
+    n = services.book_repo.index.rebuild(services.book_repo, page_size=page_size)
+    click.echo(click.style(f"✅ {n} livres indexés", fg='green'))
+
+@books.command(name="import")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help="Format du fichier (déduit de l'extension par défaut)")
+@click.option('--concurrency', default=64, show_default=True, help="Requêtes en vol simultanées")
+@click.option('--chunk-size', default=1000, show_default=True, help="Lignes par checkpoint")
+@click.option('--checkpoint', default=None, help="Fichier de checkpoint (défaut: <PATH>.checkpoint)")
+@click.option('--resume/--no-resume', default=True, show_default=True, help="Reprendre depuis le checkpoint")
+@click.option('--batch-mode', type=click.Choice(['logged', 'unlogged', 'none']), default='logged',
+              show_default=True, help="Écriture des 3 tables livres")
+def import_books(path, fmt, concurrency, chunk_size, checkpoint, resume, batch_mode):
+    """Importer un catalogue CSV/JSONL en masse"""
+    repo = BookRepository(services.session, batch_mode=None if batch_mode == 'none' else batch_mode)
+    importer = CatalogueImporter(repo, concurrency=concurrency, chunk_size=chunk_size,
+                                 checkpoint_path=checkpoint or f"{path}.checkpoint")
+    report = importer.run(path, fmt=fmt, resume=resume)
+
+    data = [
+        ["Lignes lues", report.rows_read],
+        ["Livres écrits", report.rows_written],
+        ["Échecs", report.rows_failed],
+        ["Déjà importées (checkpoint)", report.rows_skipped],
+        ["Durée (s)", f"{report.elapsed_s:.1f}"],
+        ["Débit (lignes/s)", f"{report.rows_per_sec:.0f}"],
+    ]
+    click.echo("\n" + tabulate(data, tablefmt="grid"))
+    if report.rows_failed:
+        click.echo(click.style(f"❌ {report.rows_failed} ligne(s) en échec : relancer pour reprendre à la première",
+                               fg='red'))
+        raise SystemExit(1)
+
 # ========== USERS ==========
 
 @cli.group()
@@ -117,13 +270,13 @@ def users():
 @click.option('--phone', prompt='Téléphone', default="")
 @click.option('--address', prompt='Adresse', default="")
 def register(email, first_name, last_name, phone, address):
-    user_id = user_repo.create_user(email, first_name, last_name, phone=phone, address=address)
+    user_id = services.user_repo.create_user(email, first_name, last_name, phone=phone, address=address)
     click.echo(click.style(f"✅ Utilisateur créé: {user_id}", fg='green'))
 
 @users.command()
 @click.option('--user-id', prompt='User ID')
 def profile(user_id):
-    user = user_repo.get_user(UUID(user_id))
+    user = services.user_repo.get_user(UUID(user_id))
     if user:
         data = [
             ["ID", user.user_id],
@@ -148,8 +301,8 @@ def borrows():
 @click.option('--user-id', prompt='User ID')
 @click.option('--isbn', prompt='ISBN')
 def borrow(user_id, isbn):
-    user = user_repo.get_user(UUID(user_id))
-    book = book_repo.get_book_by_isbn(isbn)
+    user = services.user_repo.get_user(UUID(user_id))
+    book = services.book_repo.get_book_by_isbn(isbn)
 
     if not user:
         click.echo(click.style("❌ Utilisateur introuvable", fg='red'))
@@ -159,7 +312,7 @@ def borrow(user_id, isbn):
         return
 
     user_name = f"{user.first_name} {user.last_name}"
-    if borrow_repo.borrow_book(user.user_id, isbn, book.title, user_name):
+    if services.borrow_repo.borrow_book(user.user_id, isbn, book.title, user_name):
         click.echo(click.style(f"✅ Emprunt réussi: {book.title}", fg='green'))
     else:
         click.echo(click.style("❌ Emprunt échoué", fg='red'))
@@ -168,16 +321,24 @@ def borrow(user_id, isbn):
 @click.option('--user-id', prompt='User ID')
 @click.option('--isbn', prompt='ISBN')
 def return_book(user_id, isbn):
-    if borrow_repo.return_book(UUID(user_id), isbn):
+    if services.borrow_repo.return_book(UUID(user_id), isbn):
         click.echo(click.style("✅ Livre retourné", fg='green'))
+        served = services.borrow_repo.fulfiller.fulfilled
+        if served:
+            click.echo(click.style(f"📬 Exemplaire attribué à la réservation suivante ({served})", fg='cyan'))
     else:
         click.echo(click.style("❌ Retour échoué", fg='red'))
 
 @borrows.command("who-borrowed")
 @click.option('--isbn', prompt='ISBN', help='ISBN du livre')
-def who_borrowed(isbn):
+@paging_options
+@ndjson_option
+def who_borrowed(isbn, page_size, cursor, ndjson):
     """Voir qui a emprunté un livre (historique par ISBN)"""
-    borrows = borrow_repo.get_borrows_by_book(isbn)
+    if ndjson:
+        return echo_ndjson(services.borrow_repo.iter_borrows_by_book(isbn))
+    page = services.borrow_repo.get_borrows_by_book_page(isbn, page_size, cursor)
+    borrows = page.items
 
     if borrows:
         data = [[
@@ -190,6 +351,7 @@ def who_borrowed(isbn):
 
         headers = ['Utilisateur', 'User ID', 'Date emprunt', 'Statut', 'Date retour']
         click.echo("\n" + tabulate(data, headers=headers, tablefmt="grid"))
+        echo_next(page)
     else:
         click.echo(click.style("Aucun emprunt trouvé pour cet ISBN", fg='yellow'))
 
@@ -198,8 +360,8 @@ def who_borrowed(isbn):
 @click.option('--isbn', prompt='ISBN', help='ISBN du livre')
 def reserve(user_id, isbn):
     """Réserver un livre (ajoute dans la file d'attente)"""
-    user = user_repo.get_user(UUID(user_id))
-    book = book_repo.get_book_by_isbn(isbn)
+    user = services.user_repo.get_user(UUID(user_id))
+    book = services.book_repo.get_book_by_isbn(isbn)
 
     if not user:
         click.echo(click.style("❌ Utilisateur introuvable", fg='red'))
@@ -211,7 +373,7 @@ def reserve(user_id, isbn):
 
     user_name = f"{user.first_name} {user.last_name}"
 
-    if reservation_repo.add_reservation(isbn, user.user_id, user_name):
+    if services.reservation_repo.add_reservation(isbn, user.user_id, user_name):
         click.echo(click.style(f"✅ Réservation ajoutée pour {book.title}", fg='green'))
     else:
         click.echo(click.style("❌ Erreur réservation", fg='red'))
@@ -221,7 +383,7 @@ def reserve(user_id, isbn):
 @click.option('--isbn', prompt='ISBN', help='ISBN du livre')
 def list_reservations(isbn):
     """Lister les réservations d'un livre (FIFO)"""
-    reservations = reservation_repo.list_reservations(isbn)
+    reservations = services.reservation_repo.list_reservations(isbn)
 
     if reservations:
         data = [[
@@ -236,12 +398,40 @@ def list_reservations(isbn):
     else:
         click.echo(click.style("Aucune réservation pour cet ISBN", fg='yellow'))
 
+def echo_perf(api_url: str, limit: int):
+    """Métriques des requêtes CQL de l'API en cours d'exécution (GET /metrics/queries)."""
+    try:
+        with urllib.request.urlopen(f"{api_url.rstrip('/')}/metrics/queries", timeout=5) as resp:
+            summary = json.load(resp)
+    except Exception as e:
+        click.echo(click.style(f"❌ Métriques indisponibles sur {api_url}: {e}", fg='red'))
+        return
+    kb = lambda n: f"{n / 1024:.1f}"
+    data = [[name, s["count"], s["errors"], s["timeouts"], s["mean_ms"], s["p95_ms"], s["p99_ms"], s["max_ms"],
+             s["rows"], kb(s["bytes"])] for name, s in list(summary["statements"].items())[:limit]]
+    click.echo(f"\n⏱️  Requêtes CQL depuis {summary['since']} (triées par temps total)\n")
+    click.echo(tabulate(data, headers=["Requête", "Nb", "Err.", "Timeouts", "Moy. ms", "p95 ms", "p99 ms",
+                                       "Max ms", "Lignes", "Ko"], tablefmt="grid"))
+    if summary["slow"]:
+        slow = [[q["at"], q["statement"], q["ms"], q["coordinator"], q["trace_id"] or "", q["error"] or ""]
+                for q in summary["slow"][-limit:]]
+        click.echo(f"\n🐢 Requêtes lentes (> {summary['slow_threshold_ms']} ms) ou tracées\n")
+        click.echo(tabulate(slow, headers=["Date", "Requête", "ms", "Coordinateur", "Trace", "Erreur"],
+                            tablefmt="grid"))
+
+
 @cli.command("stats")
-@click.option("--top", default=10, show_default=True, help="Nombre de livres dans le top")
-def stats(top):
+@click.option("--top", default=10, show_default=True, help="Nombre de livres dans le top (lignes avec --perf)")
+@click.option("--perf", is_flag=True, help="Latences par requête CQL de l'API (au lieu des statistiques)")
+@click.option("--api-url", default=lambda: os.getenv("LIBRARY_API_URL", "http://127.0.0.1:8000"),
+              show_default="LIBRARY_API_URL ou http://127.0.0.1:8000", help="API interrogée par --perf")
+def stats(top, perf, api_url):
     """Afficher les statistiques globales"""
-    total = stats_repo.get_total_borrows()
-    top_books = stats_repo.get_top_books(limit=top)
+    if perf:
+        echo_perf(api_url, top)
+        return
+    total = services.stats_repo.get_total_borrows()
+    top_books = services.stats_repo.get_top_books(limit=top)
 
     click.echo(f"\n📊 Total emprunts: {total}\n")
 
@@ -253,14 +443,163 @@ def stats(top):
         click.echo("Aucun livre dans les stats.")
 
 
+@cli.command("rebuild-leaderboard")
+@click.option("--k", default=LEADERBOARD_SIZE, show_default=True, help="Taille du classement matérialisé")
+@click.option("--page-size", default=5000, show_default=True, help="fetch_size du scan de book_popularity")
+def rebuild_leaderboard(k, page_size):
+    """Recalculer le classement top_books (scan paginé de book_popularity)"""
+    n = services.stats_repo.rebuild_leaderboard(k=k, page_size=page_size)
+    click.echo(click.style(f"✅ Classement reconstruit ({n} livres)", fg='green'))
+
+
+@cli.command("migrate-buckets")
+@click.option("--table", "tables", multiple=True,
+              type=click.Choice(["borrows_by_user", "borrows_by_book", "reservations_by_book"]),
+              help="Table(s) à migrer (défaut: toutes)")
+@click.option("--concurrency", default=64, show_default=True, help="Requêtes en vol simultanées")
+@click.option("--page-size", default=1000, show_default=True, help="fetch_size du scan des anciennes tables")
+def migrate_buckets(tables, concurrency, page_size):
+    """Réécrire les anciens historiques dans les tables bucketées par mois"""
+    migrator = BucketMigrator(services.session, concurrency=concurrency, page_size=page_size)
+    reports = migrator.run(tables or None)
+
+    data = [[r.table, r.rows_written, r.buckets, r.rows_failed, r.buckets_failed, f"{r.elapsed_s:.1f}s"]
+            for r in reports]
+    headers = ["Table", "Lignes", "Buckets", "Échecs", "Buckets en échec", "Durée"]
+    click.echo("\n" + tabulate(data, headers=headers, tablefmt="grid"))
+    if any(r.rows_failed or r.buckets_failed for r in reports):
+        click.echo(click.style("❌ Écritures en échec : relancer la migration (upserts idempotents)", fg='red'))
+        raise SystemExit(1)
+
+
+# ========== PROJECTION (outbox) ==========
+
+@cli.group()
+def projector():
+    """Projection des tables dénormalisées depuis l'outbox"""
+    pass
+
+
+def echo_projection(status):
+    data = [[k, v] for k, v in status.items()]
+    click.echo(tabulate(data, headers=["Métrique", "Valeur"], tablefmt="grid"))
+
+
+@projector.command("run")
+@click.option("--workers", default=4, show_default=True, help="Shards traités en parallèle")
+@click.option("--poll", default=0.2, show_default=True, help="Intervalle entre deux cycles (s)")
+@click.option("--report", default=10.0, show_default=True, help="Intervalle d'affichage de l'état (s)")
+def projector_run(workers, poll, report):
+    """Appliquer l'outbox en continu (un seul projecteur par cluster ; Ctrl-C pour arrêter)"""
+    proj = services.projector
+    proj.workers, proj.poll_interval = workers, poll
+    proj.start()
+    click.echo(click.style(f"▶️  Projecteur démarré ({proj.shards} shards)", fg='green'))
+    try:
+        while True:
+            time.sleep(report)
+            echo_projection(proj.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proj.close()
+        click.echo(click.style("⏹️  Projecteur arrêté (checkpoints sauvegardés)", fg='yellow'))
+
+
+@projector.command("status")
+def projector_status():
+    """Positions sauvegardées et retard de la projection"""
+    proj = services.projector
+    proj.load_positions()
+    echo_projection({"mode": services.projection, **proj.stats()})
+
+
+@borrows.command("active")
+@click.option('--user-id', prompt='User ID')
+def active(user_id):
+    """Livres détenus en ce moment par un utilisateur (retards en rouge)"""
+    items = services.borrow_repo.get_active_borrows(UUID(user_id))
+    if not items:
+        click.echo(click.style("Aucun emprunt en cours", fg='yellow'))
+        return
+    data = [[b["isbn"], b["book_title"], b["borrow_date"],
+             click.style(str(b["due_date"]), fg='red') if b["overdue"] else b["due_date"]] for b in items]
+    click.echo("\n" + tabulate(data, headers=['ISBN', 'Titre', 'Emprunté le', 'À rendre le'], tablefmt="grid"))
+    limit = f" / {services.max_active}" if services.max_active else ""
+    click.echo(f"📚 {len(items)}{limit} emprunt(s) en cours, {sum(b['overdue'] for b in items)} en retard")
+
+
+def as_of_option(f):
+    return click.option('--as-of', type=click.DateTime(), default=None,
+                        help="Date de référence en UTC (défaut: maintenant)")(f)
+
+
+def utc_or_now(as_of):
+    return as_of.replace(tzinfo=timezone.utc) if as_of else datetime.now(timezone.utc)
+
+
+def echo_overdue(b):
+    click.echo(f"{click.style(str(b['due_date']), fg='red')}  {b['user_id']}  {b['user_name'] or ''}  "
+               f"{b['isbn']}  {b['book_title'] or ''}")
+
+
+@borrows.command("overdue")
+@as_of_option
+@click.option('--limit', default=None, type=int, help="Arrêter après N retards")
+def overdue(as_of, limit):
+    """Emprunts en retard (index par jour d'échéance : seuls les jours passés sont lus)"""
+    count = 0
+    # Affichage au fil de l'eau : les pages sont lues pendant l'itération
+    for b in services.borrow_repo.iter_overdue(utc_or_now(as_of)):
+        echo_overdue(b)
+        count += 1
+        if limit and count >= limit:
+            break
+    click.echo(click.style(f"⏰ {count} emprunt(s) en retard", fg='yellow' if count else 'green'))
+
+
+@borrows.command("audit-overdue")
+@as_of_option
+@click.option('--processes', default=4, show_default=True, help="Process de scan (0 = dans ce process)")
+@click.option('--splits', default=None, type=int, help="Intervalles de tokens (défaut: 16 par process)")
+def audit_overdue(as_of, processes, splits):
+    """Audit ponctuel : scan complet des emprunts actifs par intervalles de tokens, en parallèle"""
+    scan = audit_scan(processes, splits, session=services.session if processes <= 0 else None)
+    missing = 0
+    for b in scan.run(OverdueFilter(utc_or_now(as_of), services.loan_days)):
+        echo_overdue(b)
+        missing += not b["indexed"]
+    report = scan.report.to_dict()
+    click.echo(tabulate(list(report.items()), headers=['Scan', 'Valeur'], tablefmt="simple"))
+    if missing:
+        click.echo(click.style(f"⚠️  {missing} retard(s) sans due_date (absents de l'index des échéances)",
+                               fg='yellow'))
+    if report["failed_ranges"]:
+        click.echo(click.style("❌ Intervalles en échec : résultat incomplet", fg='red'))
+
+
+@borrows.command("prune-due-index")
+@as_of_option
+def prune_due_index(as_of):
+    """Maintenance : retirer de l'index des échéances les jours passés vides (relus en QUORUM)"""
+    removed = services.borrow_repo.due.prune(utc_or_now(as_of))
+    click.echo(click.style(f"✅ {removed} jour(s) retiré(s) de l'index des échéances", fg='green'))
+
+
 @borrows.command()
 @click.option('--user-id', prompt='User ID')
-def history(user_id):
-    borrows = borrow_repo.get_user_borrows(UUID(user_id))
+@paging_options
+@ndjson_option
+def history(user_id, page_size, cursor, ndjson):
+    if ndjson:
+        return echo_ndjson(services.borrow_repo.iter_user_borrows(UUID(user_id)))
+    page = services.borrow_repo.get_user_borrows_page(UUID(user_id), page_size, cursor)
+    borrows = page.items
     if borrows:
         data = [[b["isbn"], b["book_title"], b["borrow_date"], b["status"]] for b in borrows]
         headers = ['ISBN', 'Titre', 'Date', 'Statut']
         click.echo("\n" + tabulate(data, headers=headers, tablefmt="grid"))
+        echo_next(page)
     else:
         click.echo(click.style("Aucun emprunt", fg='yellow'))
 
@@ -268,6 +607,6 @@ if __name__ == '__main__':
     try:
         cli()
     finally:
-        db.close()
+        services.close()
 
 
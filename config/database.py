@@ -1,17 +1,177 @@
-from cassandra.cluster import Cluster
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from cassandra import ConsistencyLevel
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.policies import (
+    DCAwareRoundRobinPolicy,
+    TokenAwarePolicy,
+    ConstantSpeculativeExecutionPolicy,
+    HostDistance,
+)
+from dotenv import load_dotenv
 from loguru import logger
 
+from models.rows import row_factory
+
+
+# Profils d'exécution nommés : session.execute(..., execution_profile=READ_PROFILE)
+READ_PROFILE = "read"
+WRITE_PROFILE = "write"
+
+
+def _env(name: str, default=None):
+    value = os.getenv(f"CASSANDRA_{name}")
+    return default if value in (None, "") else value
+
+
+def _env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = _env(name)
+    return int(value) if value is not None else default
+
+
+def _env_float(name: str, default: Optional[float] = None) -> Optional[float]:
+    value = _env(name)
+    return float(value) if value is not None else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = _env(name)
+    return default if value is None else value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class ConnectionProfile:
+    """Réglages de performance du driver (lus depuis l'environnement / .env via from_env)."""
+    hosts: List[str] = field(default_factory=lambda: ["127.0.0.1"])
+    port: int = 9042
+
+    # Load balancing : token-aware (on vise directement un réplica) au-dessus de DC-aware
+    local_dc: Optional[str] = None          # None -> DC du premier contact point
+    used_hosts_per_remote_dc: int = 0       # > 0 : failover vers les autres DC
+    token_aware: bool = True
+    shuffle_replicas: bool = True
+
+    protocol_version: Optional[int] = None  # None -> négocié avec le cluster
+    executor_threads: int = 2
+
+    # Pool de connexions (n'a d'effet qu'en protocole v1/v2 ; en v3+ le driver
+    # multiplexe jusqu'à 32k requêtes sur une seule connexion par hôte)
+    core_connections: Optional[int] = None
+    max_connections: Optional[int] = None
+
+    # Timeouts (secondes)
+    connect_timeout: float = 5.0
+    request_timeout: float = 10.0
+
+    # Consistance par défaut
+    read_consistency: str = "LOCAL_ONE"
+    write_consistency: str = "LOCAL_QUORUM"
+    serial_consistency: str = "LOCAL_SERIAL"
+
+    # Exécution spéculative (lectures) : relance sur un autre réplica après `delay` secondes.
+    # Ne s'applique qu'aux requêtes marquées is_idempotent=True.
+    speculative_delay: Optional[float] = None
+    speculative_max_attempts: int = 2
+
+    # Décodage des lignes : "cached" (classes Row réutilisées) ou "named_tuple" (factory du driver)
+    row_factory: str = "cached"
+
+    @classmethod
+    def from_env(cls) -> "ConnectionProfile":
+        """Construit le profil à partir des variables CASSANDRA_* (fichier .env pris en compte)."""
+        load_dotenv()
+        default = cls()
+        hosts = _env("HOSTS")
+        speculative_ms = _env_float("SPECULATIVE_DELAY_MS")
+        return cls(
+            hosts=[h.strip() for h in hosts.split(",") if h.strip()] if hosts else default.hosts,
+            port=_env_int("PORT", default.port),
+            local_dc=_env("LOCAL_DC", default.local_dc),
+            used_hosts_per_remote_dc=_env_int("USED_HOSTS_PER_REMOTE_DC", default.used_hosts_per_remote_dc),
+            token_aware=_env_bool("TOKEN_AWARE", default.token_aware),
+            shuffle_replicas=_env_bool("SHUFFLE_REPLICAS", default.shuffle_replicas),
+            protocol_version=_env_int("PROTOCOL_VERSION", default.protocol_version),
+            executor_threads=_env_int("EXECUTOR_THREADS", default.executor_threads),
+            core_connections=_env_int("CORE_CONNECTIONS", default.core_connections),
+            max_connections=_env_int("MAX_CONNECTIONS", default.max_connections),
+            connect_timeout=_env_float("CONNECT_TIMEOUT", default.connect_timeout),
+            request_timeout=_env_float("REQUEST_TIMEOUT", default.request_timeout),
+            read_consistency=_env("READ_CONSISTENCY", default.read_consistency).upper(),
+            write_consistency=_env("WRITE_CONSISTENCY", default.write_consistency).upper(),
+            serial_consistency=_env("SERIAL_CONSISTENCY", default.serial_consistency).upper(),
+            speculative_delay=speculative_ms / 1000 if speculative_ms is not None else default.speculative_delay,
+            speculative_max_attempts=_env_int("SPECULATIVE_MAX_ATTEMPTS", default.speculative_max_attempts),
+            row_factory=_env("ROW_FACTORY", default.row_factory).lower(),
+        )
+
+    # ========= Construction des objets driver =========
+
+    def load_balancing_policy(self):
+        policy = DCAwareRoundRobinPolicy(local_dc=self.local_dc,
+                                         used_hosts_per_remote_dc=self.used_hosts_per_remote_dc)
+        if self.token_aware:
+            policy = TokenAwarePolicy(policy, shuffle_replicas=self.shuffle_replicas)
+        return policy
+
+    def _execution_profile(self, consistency: str, speculative: bool) -> ExecutionProfile:
+        return ExecutionProfile(
+            load_balancing_policy=self.load_balancing_policy(),
+            consistency_level=ConsistencyLevel.name_to_value[consistency],
+            serial_consistency_level=ConsistencyLevel.name_to_value[self.serial_consistency],
+            request_timeout=self.request_timeout,
+            row_factory=row_factory(self.row_factory),
+            speculative_execution_policy=(
+                ConstantSpeculativeExecutionPolicy(self.speculative_delay, self.speculative_max_attempts)
+                if speculative and self.speculative_delay else None
+            ),
+        )
+
+    def execution_profiles(self):
+        # Le profil par défaut reprend les réglages lecture : les repositories n'en précisent pas pour
+        # lire, et passent execution_profile=WRITE_PROFILE à chaque écriture (batchs et LWT compris)
+        return {
+            EXEC_PROFILE_DEFAULT: self._execution_profile(self.read_consistency, speculative=True),
+            READ_PROFILE: self._execution_profile(self.read_consistency, speculative=True),
+            WRITE_PROFILE: self._execution_profile(self.write_consistency, speculative=False),
+        }
+
+
 class CassandraConnection:
-    def __init__(self, hosts=None, port=9042, keyspace="system"):
-        self.hosts = hosts or ["127.0.0.1"]
-        self.port = port
+    def __init__(self, hosts=None, port=None, keyspace="system", profile: Optional[ConnectionProfile] = None):
+        self.profile = profile or ConnectionProfile.from_env()
+        self.hosts = hosts or self.profile.hosts
+        self.port = port or self.profile.port
         self.keyspace = keyspace
         self.cluster = None
         self.session = None
 
+    def _build_cluster(self) -> Cluster:
+        kwargs = dict(
+            contact_points=self.hosts,
+            port=self.port,
+            execution_profiles=self.profile.execution_profiles(),
+            connect_timeout=self.profile.connect_timeout,
+            executor_threads=self.profile.executor_threads,
+        )
+        if self.profile.protocol_version:
+            kwargs["protocol_version"] = self.profile.protocol_version
+        cluster = Cluster(**kwargs)
+
+        if self.profile.core_connections or self.profile.max_connections:
+            if cluster.protocol_version and cluster.protocol_version <= 2:
+                if self.profile.max_connections:
+                    cluster.set_max_connections_per_host(HostDistance.LOCAL, self.profile.max_connections)
+                if self.profile.core_connections:
+                    cluster.set_core_connections_per_host(HostDistance.LOCAL, self.profile.core_connections)
+            else:
+                logger.info("Pool core/max ignoré : protocole v3+ (1 connexion multiplexée par hôte)")
+        return cluster
+
     def connect(self):
         try:
-            self.cluster = Cluster(contact_points=self.hosts, port=self.port)
+            self.cluster = self._build_cluster()
             self.session = self.cluster.connect()
             logger.success(f" Connecté à Cassandra: {self.hosts}:{self.port}")
 
@@ -0,0 +1,188 @@
+import asyncio
+import atexit
+import threading
+from collections import Counter
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from cassandra.query import PreparedStatement
+from loguru import logger
+
+from config.database import WRITE_PROFILE
+from models.aio import aexecute_all
+from models.statements import Statement
+
+DURABILITY_MODES = ("buffered", "sync")
+
+
+class StatsAggregator:
+    """Tampon write-behind des compteurs global_stats / book_popularity.
+
+    Les emprunts sont coalescés par ISBN en mémoire puis écrits en `UPDATE ... + n` :
+    mille emprunts d'un best-seller pendant un intervalle = une seule écriture counter.
+
+    Compromis durabilité / latence :
+    - durability="buffered" : flush toutes les `flush_interval` secondes, ou dès que
+      `max_pending` emprunts sont en attente ; un crash perd au plus cet intervalle.
+      Flush aussi à l'arrêt (close / atexit).
+    - durability="sync" : chaque emprunt écrit ses compteurs avant de rendre la main.
+    """
+
+    ps_add_total_borrows = Statement("""
+        UPDATE global_stats
+        SET total_borrows = total_borrows + ?
+        WHERE stat_name = 'GLOBAL'
+    """)
+
+    ps_add_book_popularity = Statement("""
+        UPDATE book_popularity
+        SET borrow_count = borrow_count + ?
+        WHERE isbn = ?
+    """)
+
+    def __init__(self, session, durability: str = "buffered", flush_interval: float = 1.0,
+                 max_pending: int = 1000, on_flush: Optional[Callable[[List[str]], None]] = None):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability inconnue: {durability} ({', '.join(DURABILITY_MODES)})")
+        self.session = session
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Appelé avec les ISBN écrits à chaque flush (ex: StatisticsRepository.refresh_leaderboard)
+        self.on_flush = on_flush
+
+        self._pending: Counter = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # un seul flush à la fois
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.flushes = 0
+        self.writes = 0
+        self.borrows_recorded = 0
+
+    # ========= Écritures =========
+
+    def _statements(self, counts: Counter) -> List[Tuple[PreparedStatement, tuple]]:
+        total = sum(counts.values())
+        return [(self.ps_add_total_borrows, (total,))] + [
+            (self.ps_add_book_popularity, (n, isbn)) for isbn, n in counts.items()
+        ]
+
+    def _write(self, counts: Counter):
+        futures = [self.session.execute_async(ps, params, execution_profile=WRITE_PROFILE)
+                   for ps, params in self._statements(counts)]
+        errors = []
+        for f in futures:
+            try:
+                f.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    # ========= API =========
+
+    def record_borrow(self, isbn: str, n: int = 1):
+        """Comptabilise n emprunts de `isbn`. Une erreur de compteur ne fait jamais échouer l'emprunt."""
+        if self.durability == "sync":
+            try:
+                self._write(Counter({isbn: n}))
+            except Exception as e:
+                logger.error(f"❌ stats write error: {e}")
+                return
+            self._notify([isbn])
+            return
+
+        with self._lock:
+            self._ensure_thread()
+            self._pending[isbn] += n
+            self._pending_total += n
+            self.borrows_recorded += n
+            full = self._pending_total >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    async def arecord_borrow(self, isbn: str, n: int = 1):
+        """Variante asyncio : en mode sync, les compteurs sont attendus sans bloquer la boucle."""
+        if self.durability == "sync":
+            try:
+                await aexecute_all(self.session, self._statements(Counter({isbn: n})))
+            except Exception as e:
+                logger.error(f"❌ stats write error: {e}")
+                return
+            if self.on_flush is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self._notify, [isbn])
+            return
+        self.record_borrow(isbn, n)
+
+    def flush(self) -> int:
+        """Écrit tout ce qui est en attente. Renvoie le nombre d'écritures counter envoyées."""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._pending = self._pending, Counter()
+                self._pending_total = 0
+            if not counts:
+                return 0
+            try:
+                self._write(counts)
+            except Exception as e:
+                # Remis en attente pour le flush suivant (un counter n'est pas idempotent :
+                # en cas de timeout l'incrément peut être compté deux fois)
+                logger.error(f"❌ stats flush error: {e}")
+                with self._lock:
+                    self._pending.update(counts)
+                    self._pending_total += sum(counts.values())
+                return 0
+            self.flushes += 1
+            self.writes += len(counts) + 1
+            self._notify(list(counts))
+            return len(counts) + 1
+
+    def _notify(self, isbns: Iterable[str]):
+        if self.on_flush is None:
+            return
+        try:
+            self.on_flush(list(isbns))
+        except Exception as e:
+            logger.error(f"❌ stats on_flush error: {e}")
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending_total
+
+    def stats(self):
+        with self._lock:
+            return {
+                "durability": self.durability,
+                "flush_interval_s": self.flush_interval,
+                "max_pending": self.max_pending,
+                "pending": self._pending_total,
+                "pending_isbns": len(self._pending),
+                "borrows_recorded": self.borrows_recorded,
+                "flushes": self.flushes,
+                "counter_writes": self.writes,
+            }
+
+    # ========= Thread de flush =========
+
+    def _ensure_thread(self):
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="stats-aggregator", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Arrête le thread et écrit ce qui reste en attente."""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
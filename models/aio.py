@@ -0,0 +1,96 @@
+import asyncio
+from typing import Any, Iterable, List, Optional, Tuple
+
+from cassandra.cluster import ResultSet
+
+from config.database import WRITE_PROFILE
+from models.metrics import reattach
+
+
+def _bridge(response_future) -> "asyncio.Future[ResultSet]":
+    """Transforme un ResponseFuture du driver (callbacks dans ses threads) en future asyncio."""
+    loop = asyncio.get_running_loop()
+    aio_future = loop.create_future()
+
+    def set_result(_):
+        if not aio_future.done():
+            aio_future.set_result(response_future.result())
+
+    def set_exception(exc):
+        if not aio_future.done():
+            aio_future.set_exception(exc)
+
+    response_future.add_callbacks(
+        callback=lambda rows: loop.call_soon_threadsafe(set_result, rows),
+        errback=lambda exc: loop.call_soon_threadsafe(set_exception, exc),
+    )
+    return aio_future
+
+
+async def aexecute(session, query, parameters=None, **kwargs) -> ResultSet:
+    """Équivalent awaitable de session.execute (aucun thread bloqué pendant l'aller-retour)."""
+    return await _bridge(session.execute_async(query, parameters, **kwargs))
+
+
+async def afetch_next_page(result: ResultSet) -> ResultSet:
+    """Récupère la page suivante d'un ResultSet sans bloquer la boucle d'événements."""
+    response_future = result.response_future
+    response_future.clear_callbacks()
+    response_future.start_fetching_next_page()
+    reattach(response_future)
+    return await _bridge(response_future)
+
+
+async def afetch_all(session, query, parameters=None, **kwargs) -> List[Any]:
+    """Toutes les lignes d'une requête, en suivant le paging du driver de façon asynchrone."""
+    result = await aexecute(session, query, parameters, **kwargs)
+    rows = list(result.current_rows)
+    while result.has_more_pages:
+        result = await afetch_next_page(result)
+        rows.extend(result.current_rows)
+    return rows
+
+
+async def afetch_one_all(session, queries: Iterable[Tuple[Any, Any]]) -> List[Any]:
+    """Lectures indépendantes en parallèle ; renvoie la 1re ligne de chacune (dans l'ordre)."""
+    results = await asyncio.gather(*(aexecute(session, ps, params) for ps, params in queries))
+    return [r.one() for r in results]
+
+
+async def afetch_rows_all(session, queries: Iterable[Tuple[Any, Any]]) -> List[List[Any]]:
+    """Lectures indépendantes en parallèle ; renvoie les lignes (1re page) de chacune, dans l'ordre."""
+    results = await asyncio.gather(*(aexecute(session, ps, params) for ps, params in queries))
+    return [list(r.current_rows) for r in results]
+
+
+async def aexecute_all(session, queries: Iterable[Tuple[Any, Any]]):
+    """Écritures indépendantes en parallèle ; attend TOUTES les réponses avant de remonter une erreur."""
+    results = await asyncio.gather(*(aexecute(session, ps, params, execution_profile=WRITE_PROFILE)
+                                     for ps, params in queries), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        raise errors[0]
+
+
+async def aexecute_concurrent(session, queries: Iterable[Tuple[Any, Any]],
+                              concurrency: int = 64) -> Tuple[int, int, Optional[BaseException]]:
+    """Écritures en flux : au plus `concurrency` requêtes en vol, tirées d'un itérable (même paresseux).
+
+    Les requêtes sont produites au fil des réponses (mémoire bornée) ; une erreur n'interrompt pas
+    les autres. Renvoie (réussies, en échec, première erreur).
+    """
+    queries = iter(queries)
+    done, failed, first_error = 0, 0, None
+
+    async def lane():
+        nonlocal done, failed, first_error
+        for ps, params in queries:
+            try:
+                await aexecute(session, ps, params, execution_profile=WRITE_PROFILE)
+                done += 1
+            except Exception as e:
+                failed += 1
+                first_error = first_error or e
+
+    await asyncio.gather(*(lane() for _ in range(concurrency)))
+    return done, failed, first_error
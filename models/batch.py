@@ -0,0 +1,32 @@
+from typing import Iterable, Optional, Tuple, Any, List
+from cassandra.query import BatchStatement, BatchType
+
+
+# logged   : atomique (batchlog côté coordinateur) -> les tables dénormalisées ne divergent pas
+# unlogged : un seul aller-retour mais sans garantie d'atomicité (ingestion rapide)
+BATCH_MODES = {
+    "logged": BatchType.LOGGED,
+    "unlogged": BatchType.UNLOGGED,
+}
+
+
+def check_batch_mode(mode: Optional[str]) -> Optional[str]:
+    """Valide un mode de batch (None = requêtes séparées, comportement historique)."""
+    if mode is not None and mode not in BATCH_MODES:
+        raise ValueError(f"batch_mode invalide: {mode!r} (attendu: {', '.join(BATCH_MODES)} ou None)")
+    return mode
+
+
+def build_batch(queries: Iterable[Tuple[Any, Any]], mode: str = "logged") -> BatchStatement:
+    """Construit un BatchStatement à partir de couples (prepared statement, paramètres)."""
+    batch = BatchStatement(batch_type=BATCH_MODES[mode])
+    for ps, params in queries:
+        batch.add(ps, params)
+    return batch
+
+
+def group_writes(queries: List[Tuple[Any, Any]], mode: Optional[str]) -> List[Tuple[Any, Any]]:
+    """Regroupe des écritures en un seul batch si un mode est actif, sinon les renvoie telles quelles."""
+    if mode is None:
+        return list(queries)
+    return [(build_batch(queries, mode), None)]
@@ -1,10 +1,22 @@
+import asyncio
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any
-from cassandra.query import PreparedStatement
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Iterable, Iterator
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
 from loguru import logger
 
+from config.database import WRITE_PROFILE
+from models.aio import aexecute, aexecute_all, afetch_all
+from models.batch import check_batch_mode, group_writes
+from models.outbox import BOOK, Outbox, check_projection_mode
+from models.paging import Page, DEFAULT_PAGE_SIZE, fetch_page, afetch_page, iter_rows, aiter_rows
+from models.search import SearchIndex
+from models.statements import Statement
 
-@dataclass
+# Nombre max. d'ISBN par lecture groupée (POST /books:batchGet)
+MAX_BATCH_GET = 100
+
+
+@dataclass(slots=True)
 class Book:
     isbn: str
     title: str
@@ -18,78 +30,102 @@ class Book:
 
 
 class BookRepository:
-    def __init__(self, session):
-        self.session = session
+    # ========= INSERTS =========
 
-        # ========= INSERTS =========
-
-        # Table lookup par ISBN
-        self.ps_insert_isbn: PreparedStatement = session.prepare("""
-            INSERT INTO books_by_isbn
-            (isbn, title, author, category, publisher, publication_year,
-             total_copies, available_copies, description)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """)
-
-        # Table liste par catégorie
-        self.ps_insert_category: PreparedStatement = session.prepare("""
-            INSERT INTO books_by_category
-            (category, title, isbn, author, publisher, publication_year,
-             available_copies, total_copies)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """)
-
-        # ✅ NOUVEAU : Table liste par auteur
-        self.ps_insert_author: PreparedStatement = session.prepare("""
-            INSERT INTO books_by_author
-            (author, title, isbn, category, publisher, publication_year,
-             available_copies, total_copies, description)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """)
-
-        # ========= SELECTS =========
-
-        self.ps_get_by_isbn: PreparedStatement = session.prepare("""
-            SELECT * FROM books_by_isbn
-            WHERE isbn = ?
-        """)
-
-        self.ps_list_by_category: PreparedStatement = session.prepare("""
-            SELECT isbn, title, author, available_copies, total_copies
-            FROM books_by_category
-            WHERE category = ?
-        """)
-
-        # ✅ NOUVEAU : liste des livres d’un auteur
-        self.ps_list_by_author: PreparedStatement = session.prepare("""
-            SELECT isbn, title, category, available_copies, total_copies
-            FROM books_by_author
-            WHERE author = ?
-        """)
+    # Table lookup par ISBN
+    ps_insert_isbn = Statement("""
+        INSERT INTO books_by_isbn
+        (isbn, title, author, category, publisher, publication_year,
+         total_copies, available_copies, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """)
 
-    def add_book(self, book: Book) -> bool:
-        """Ajoute un livre dans 3 tables (dénormalisation Cassandra)."""
-        try:
+    # Table liste par catégorie
+    ps_insert_category = Statement("""
+        INSERT INTO books_by_category
+        (category, title, isbn, author, publisher, publication_year,
+         available_copies, total_copies)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """)
+
+    # ✅ NOUVEAU : Table liste par auteur
+    ps_insert_author = Statement("""
+        INSERT INTO books_by_author
+        (author, title, isbn, category, publisher, publication_year,
+         available_copies, total_copies, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """)
+
+    # ========= SELECTS =========
+
+    ps_get_by_isbn = Statement("""
+        SELECT * FROM books_by_isbn
+        WHERE isbn = ?
+    """)
+
+    ps_list_by_category = Statement("""
+        SELECT isbn, title, author, available_copies, total_copies
+        FROM books_by_category
+        WHERE category = ?
+    """)
+
+    # ✅ NOUVEAU : liste des livres d’un auteur
+    ps_list_by_author = Statement("""
+        SELECT isbn, title, category, available_copies, total_copies
+        FROM books_by_author
+        WHERE author = ?
+    """)
+
+    def __init__(self, session, batch_mode: Optional[str] = "logged", index: Optional[SearchIndex] = None,
+                 projection: str = "inline"):
+        self.session = session
+        # "logged" (atomique), "unlogged" (rapide) ou None (3 écritures séparées)
+        self.batch_mode = check_batch_mode(batch_mode)
+        # Index de recherche plein texte (books_by_term), tenu à jour par add_book
+        self.index = index or SearchIndex(session)
+        # projection="outbox" : add_book n'écrit que books_by_isbn + un événement ; listings et index
+        # sont écrits en arrière-plan par le projecteur (models/projection.py)
+        self.projection = check_projection_mode(projection)
+        self.outbox = Outbox(session)
+
+    def insert_statements(self, book: Book):
+        """Les 3 INSERT (dénormalisation) d'un livre, sous forme (statement, paramètres)."""
+        return [
             # 1) table lookup par ISBN
-            self.session.execute(self.ps_insert_isbn, (
+            (self.ps_insert_isbn, (
                 book.isbn, book.title, book.author, book.category,
                 book.publisher, book.publication_year,
                 book.total_copies, book.available_copies, book.description
-            ))
+            )),
 
             # 2) table liste par catégorie
-            self.session.execute(self.ps_insert_category, (
+            (self.ps_insert_category, (
                 book.category, book.title, book.isbn, book.author,
                 book.publisher, book.publication_year,
                 book.available_copies, book.total_copies
-            ))
+            )),
 
             # 3) ✅ table liste par auteur
-            self.session.execute(self.ps_insert_author, (
+            (self.ps_insert_author, (
                 book.author, book.title, book.isbn, book.category,
                 book.publisher, book.publication_year,
                 book.available_copies, book.total_copies, book.description
-            ))
+            )),
+        ]
+
+    def _add_writes(self, book: Book):
+        if self.projection == "outbox":
+            # ligne autoritaire + événement, atomiquement (batch logged) : rien ne peut être perdu
+            return group_writes([self.insert_statements(book)[0], self.outbox.event(BOOK, book.isbn)], "logged")
+        return group_writes(self.insert_statements(book), self.batch_mode)
+
+    def add_book(self, book: Book) -> bool:
+        """Ajoute un livre dans 3 tables (dénormalisation Cassandra), en un seul BATCH si batch_mode."""
+        try:
+            for ps, params in self._add_writes(book):
+                self.session.execute(ps, params, execution_profile=WRITE_PROFILE)
+            if self.projection == "inline":
+                self.index.index_book(book)
 
             logger.success(f"✅ Livre ajouté: {book.isbn} - {book.title}")
             return True
@@ -98,40 +134,128 @@ class BookRepository:
             logger.error(f"❌ add_book error: {e}")
             return False
 
+    # ========= Décodage des lignes =========
+
+    @staticmethod
+    def _row_to_book(row) -> Book:
+        return Book(
+            isbn=row.isbn,
+            title=row.title,
+            author=row.author,
+            category=row.category,
+            publisher=row.publisher,
+            publication_year=row.publication_year,
+            total_copies=row.total_copies,
+            available_copies=row.available_copies,
+            description=row.description or ""
+        )
+
+    @staticmethod
+    def _category_item(r) -> Dict[str, Any]:
+        return {
+            "isbn": r.isbn,
+            "title": r.title,
+            "author": r.author,
+            "available_copies": r.available_copies,
+            "total_copies": r.total_copies
+        }
+
+    @staticmethod
+    def _author_item(r) -> Dict[str, Any]:
+        return {
+            "isbn": r.isbn,
+            "title": r.title,
+            "category": r.category,
+            "available_copies": r.available_copies,
+            "total_copies": r.total_copies
+        }
+
+    @staticmethod
+    def _search_item(book: Book, score: int) -> Dict[str, Any]:
+        return {
+            "isbn": book.isbn,
+            "title": book.title,
+            "author": book.author,
+            "category": book.category,
+            "available_copies": book.available_copies,
+            "total_copies": book.total_copies,
+            "score": score
+        }
+
+    @classmethod
+    def _search_page(cls, hits, next_cursor, books: Dict[str, Optional[Book]]) -> Page:
+        # un ISBN indexé mais absent de books_by_isbn est ignoré
+        return Page(items=[cls._search_item(books[isbn], score) for isbn, score in hits if books.get(isbn)],
+                    next_cursor=next_cursor)
+
     def get_book_by_isbn(self, isbn: str) -> Optional[Book]:
         try:
             row = self.session.execute(self.ps_get_by_isbn, (isbn,)).one()
-            if not row:
-                return None
-
-            return Book(
-                isbn=row.isbn,
-                title=row.title,
-                author=row.author,
-                category=row.category,
-                publisher=row.publisher,
-                publication_year=row.publication_year,
-                total_copies=row.total_copies,
-                available_copies=row.available_copies,
-                description=row.description or ""
-            )
+            return self._row_to_book(row) if row else None
         except Exception as e:
             logger.error(f"❌ get_book_by_isbn error: {e}")
             return None
 
+    # ========= Lecture groupée par ISBN =========
+
+    @staticmethod
+    def _unique(isbns: Iterable[str]) -> List[str]:
+        """ISBN dédoublonnés, dans l'ordre de première apparition."""
+        return list(dict.fromkeys(isbns))
+
+    def _collect(self, keys: List[str], results) -> Dict[str, Optional[Book]]:
+        """Associe chaque ISBN à son livre, None s'il n'existe pas.
+
+        Un ISBN dont la lecture a échoué (erreur, timeout) est absent du résultat : il n'est pas
+        confondu avec un livre inexistant (résultat partiel, cf. POST /books:batchGet `errors`).
+        """
+        books: Dict[str, Optional[Book]] = {}
+        for isbn, result in zip(keys, results):
+            if isinstance(result, BaseException):
+                logger.error(f"❌ get_books_by_isbns error ({isbn}): {result}")
+                continue
+            row = result.one()
+            books[isbn] = self._row_to_book(row) if row else None
+        return books
+
+    def get_books_by_isbns(self, isbns: Iterable[str], concurrency: int = 64) -> Dict[str, Optional[Book]]:
+        """Plusieurs livres en une fois : un point read par ISBN, envoyés en parallèle.
+
+        Pas de `IN` multi-partitions (un seul coordinateur qui attend tous les réplicas) :
+        chaque lecture préparée porte sa routing key et part directement vers un réplica
+        (TokenAwarePolicy). Ordre d'entrée conservé ; un ISBN inexistant vaut None,
+        un ISBN dont la lecture a échoué est omis.
+        """
+        keys = self._unique(isbns)
+        results = execute_concurrent_with_args(self.session, self.ps_get_by_isbn, [(k,) for k in keys],
+                                               concurrency=concurrency, raise_on_first_error=False)
+        # (success, ResultSet | exception) : l'ISBN d'une lecture en échec est omis
+        return self._collect(keys, (r for _, r in results))
+
+    # ========= Projection (événements BOOK de l'outbox) =========
+
+    def project_books(self, isbns: Iterable[str]):
+        """Recopie des livres dans books_by_category / books_by_author / l'index, depuis books_by_isbn.
+
+        Relit la ligne autoritaire : idempotent et indépendant de l'ordre des événements.
+        Lève une exception en cas d'échec (le projecteur réessaie).
+        """
+        futures = [self.session.execute_async(self.ps_get_by_isbn, (isbn,)) for isbn in self._unique(isbns)]
+        writes = []
+        for f in futures:
+            row = f.result().one()
+            if row:
+                book = self._row_to_book(row)
+                writes += self.insert_statements(book)[1:] + self.index.index_statements(book)
+        for ok, result in execute_concurrent(self.session, writes, concurrency=64, raise_on_first_error=False,
+                                             execution_profile=WRITE_PROFILE):
+            if not ok:
+                raise result
+
     def get_books_by_category(self, category: str) -> List[Dict[str, Any]]:
         try:
             rows = self.session.execute(self.ps_list_by_category, (category,))
-            return [
-                {
-                    "isbn": r.isbn,
-                    "title": r.title,
-                    "author": r.author,
-                    "available_copies": r.available_copies,
-                    "total_copies": r.total_copies
-                }
-                for r in rows
-            ]
+            return [self._category_item(r) for r in rows]
         except Exception as e:
             logger.error(f"❌ get_books_by_category error: {e}")
             return []
@@ -140,16 +264,138 @@ class BookRepository:
     def get_books_by_author(self, author: str) -> List[Dict[str, Any]]:
         try:
             rows = self.session.execute(self.ps_list_by_author, (author,))
-            return [
-                {
-                    "isbn": r.isbn,
-                    "title": r.title,
-                    "category": r.category,
-                    "available_copies": r.available_copies,
-                    "total_copies": r.total_copies
-                }
-                for r in rows
-            ]
+            return [self._author_item(r) for r in rows]
+        except Exception as e:
+            logger.error(f"❌ get_books_by_author error: {e}")
+            return []
+
+    # ========= Listings paginés (fetch_size + curseur opaque) =========
+
+    def get_books_by_category_page(self, category: str, page_size: int = DEFAULT_PAGE_SIZE,
+                                   cursor: Optional[str] = None, decode: Optional[Callable] = None) -> Page:
+        try:
+            return fetch_page(self.session, self.ps_list_by_category, (category,),
+                              page_size, cursor, decode or self._category_item)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ get_books_by_category_page error: {e}")
+            return Page()
+
+    def get_books_by_author_page(self, author: str, page_size: int = DEFAULT_PAGE_SIZE,
+                                 cursor: Optional[str] = None, decode: Optional[Callable] = None) -> Page:
+        try:
+            return fetch_page(self.session, self.ps_list_by_author, (author,),
+                              page_size, cursor, decode or self._author_item)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ get_books_by_author_page error: {e}")
+            return Page()
+
+    # ========= Itérateurs (partition complète, page par page du driver) =========
+    # Pas de try/except : une erreur remonte au consommateur (un flux HTTP doit pouvoir la signaler).
+    # `decode` (listings et itérateurs) remplace le dict par item, ex. RowModel(BookListItem) ou son .json
+
+    def iter_books_by_category(self, category: str, decode: Optional[Callable] = None) -> Iterator[Any]:
+        return iter_rows(self.session, self.ps_list_by_category, (category,), decode or self._category_item)
+
+    def iter_books_by_author(self, author: str, decode: Optional[Callable] = None) -> Iterator[Any]:
+        return iter_rows(self.session, self.ps_list_by_author, (author,), decode or self._author_item)
+
+    # ========= Recherche plein texte =========
+
+    def search_books(self, q: str, page_size: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Page:
+        """Recherche titre / auteur / description, sans accents ni casse (« etran » -> L'Étranger)."""
+        try:
+            hits, next_cursor = self.index.search(q, page_size, cursor)
+            return self._search_page(hits, next_cursor, self.get_books_by_isbns(isbn for isbn, _ in hits))
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ search_books error: {e}")
+            return Page()
+
+
+class AsyncBookRepository(BookRepository):
+    """Variante asyncio : mêmes requêtes préparées, réponses attendues via les futures du driver."""
+
+    async def add_book(self, book: Book) -> bool:
+        try:
+            await aexecute_all(self.session, self._add_writes(book))
+            if self.projection == "inline":
+                await self.index.aindex_book(book)
+            logger.success(f"✅ Livre ajouté: {book.isbn} - {book.title}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ add_book error: {e}")
+            return False
+
+    async def get_book_by_isbn(self, isbn: str) -> Optional[Book]:
+        try:
+            row = (await aexecute(self.session, self.ps_get_by_isbn, (isbn,))).one()
+            return self._row_to_book(row) if row else None
+        except Exception as e:
+            logger.error(f"❌ get_book_by_isbn error: {e}")
+            return None
+
+    async def get_books_by_isbns(self, isbns: Iterable[str]) -> Dict[str, Optional[Book]]:
+        keys = self._unique(isbns)
+        results = await asyncio.gather(*(aexecute(self.session, self.ps_get_by_isbn, (k,)) for k in keys),
+                                       return_exceptions=True)
+        return self._collect(keys, results)
+
+    async def get_books_by_category(self, category: str) -> List[Dict[str, Any]]:
+        try:
+            rows = await afetch_all(self.session, self.ps_list_by_category, (category,))
+            return [self._category_item(r) for r in rows]
+        except Exception as e:
+            logger.error(f"❌ get_books_by_category error: {e}")
+            return []
+
+    async def get_books_by_author(self, author: str) -> List[Dict[str, Any]]:
+        try:
+            rows = await afetch_all(self.session, self.ps_list_by_author, (author,))
+            return [self._author_item(r) for r in rows]
         except Exception as e:
             logger.error(f"❌ get_books_by_author error: {e}")
             return []
+
+    async def get_books_by_category_page(self, category: str, page_size: int = DEFAULT_PAGE_SIZE,
+                                         cursor: Optional[str] = None, decode: Optional[Callable] = None) -> Page:
+        try:
+            return await afetch_page(self.session, self.ps_list_by_category, (category,),
+                                     page_size, cursor, decode or self._category_item)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ get_books_by_category_page error: {e}")
+            return Page()
+
+    async def get_books_by_author_page(self, author: str, page_size: int = DEFAULT_PAGE_SIZE,
+                                       cursor: Optional[str] = None, decode: Optional[Callable] = None) -> Page:
+        try:
+            return await afetch_page(self.session, self.ps_list_by_author, (author,),
+                                     page_size, cursor, decode or self._author_item)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ get_books_by_author_page error: {e}")
+            return Page()
+
+    def iter_books_by_category(self, category: str, decode: Optional[Callable] = None) -> AsyncIterator[Any]:
+        return aiter_rows(self.session, self.ps_list_by_category, (category,), decode or self._category_item)
+
+    def iter_books_by_author(self, author: str, decode: Optional[Callable] = None) -> AsyncIterator[Any]:
+        return aiter_rows(self.session, self.ps_list_by_author, (author,), decode or self._author_item)
+
+    async def search_books(self, q: str, page_size: int = DEFAULT_PAGE_SIZE,
+                           cursor: Optional[str] = None) -> Page:
+        try:
+            hits, next_cursor = await self.index.asearch(q, page_size, cursor)
+            return self._search_page(hits, next_cursor, await self.get_books_by_isbns(isbn for isbn, _ in hits))
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ search_books error: {e}")
+            return Page()
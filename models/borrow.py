@@ -1,233 +1,784 @@
-from datetime import datetime, timezone
+import asyncio
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Iterable, Optional
 from uuid import UUID
-from cassandra.query import PreparedStatement
 from loguru import logger
 
+from config.database import WRITE_PROFILE
+from models.aggregator import StatsAggregator
+from models.aio import aexecute_all, afetch_all, afetch_one_all, afetch_rows_all
+from models.batch import check_batch_mode, group_writes
+from models.buckets import (BucketIndex, USER_HISTORY, BOOK_HISTORY, month_bucket,
+                            fetch_buckets, afetch_buckets, fetch_bucketed_page, afetch_bucketed_page,
+                            iter_buckets, aiter_buckets)
+from models.cache import LibraryCache
+from models.fulfilment import ReservationFulfiller
+from models.inventory import Inventory, ListingRefresher, check_inventory_mode
+from models.overdue import DueIndex
+from models.outbox import BORROW, STOCK, Outbox, check_projection_mode
+from models.paging import Page, DEFAULT_PAGE_SIZE, fetch_page, afetch_page, iter_rows, aiter_rows
+from models.statements import Statement
+
+# Durée de prêt par défaut : due_date = borrow_date + LOAN_DAYS
+LOAN_DAYS = 21
+# Lignes lues dans la partition des emprunts actifs quand aucune limite n'est configurée
+MAX_ACTIVE_SCAN = 1000
+
 
 class BorrowRepository:
-    def __init__(self, session):
+    # --- Inserts / Deletes borrow tables ---
+    ps_insert_borrow_history = Statement("""
+        INSERT INTO borrows_by_user
+        (user_id, borrow_date, isbn, book_title, user_name, status, return_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """)
+
+    ps_upsert_active = Statement("""
+        INSERT INTO active_borrow_by_user_book
+        (user_id, isbn, borrow_date, due_date, book_title, user_name)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """)
+
+    ps_delete_active = Statement("""
+        DELETE FROM active_borrow_by_user_book
+        WHERE user_id = ? AND isbn = ?
+    """)
+
+    ps_get_active = Statement("""
+        SELECT borrow_date, due_date, book_title, user_name
+        FROM active_borrow_by_user_book
+        WHERE user_id = ? AND isbn = ?
+    """)
+
+    # Emprunts en cours d'un user : une seule partition (user_id), quelques lignes
+    ps_list_active = Statement("""
+        SELECT isbn, borrow_date, due_date, book_title
+        FROM active_borrow_by_user_book
+        WHERE user_id = ?
+        LIMIT ?
+    """)
+
+    ps_list_borrows_by_user = Statement("""
+        SELECT isbn, book_title, borrow_date, status, return_date
+        FROM borrows_by_user
+        WHERE user_id = ?
+    """)
+
+    # --- Book reads / updates ---
+    ps_get_book_isbn = Statement("""
+        SELECT isbn, title, author, category, available_copies, total_copies
+        FROM books_by_isbn
+        WHERE isbn = ?
+    """)
+
+    ps_update_book_isbn = Statement("""
+        UPDATE books_by_isbn
+        SET available_copies = ?
+        WHERE isbn = ?
+    """)
+
+    ps_update_book_category = Statement("""
+        UPDATE books_by_category
+        SET available_copies = ?
+        WHERE category = ? AND title = ? AND isbn = ?
+    """)
+
+    # ✅ (recommandé) garder cohérent aussi books_by_author
+    ps_update_book_author = Statement("""
+        UPDATE books_by_author
+        SET available_copies = ?
+        WHERE author = ? AND title = ? AND isbn = ?
+    """)
+
+    # --- User counters (table counter : incréments à l'aveugle, aucune lecture préalable) ---
+    ps_inc_user_borrow = Statement("""
+        UPDATE user_counters
+        SET total_borrows = total_borrows + 1, active_borrows = active_borrows + 1
+        WHERE user_id = ?
+    """)
+
+    ps_dec_user_active = Statement("""
+        UPDATE user_counters
+        SET active_borrows = active_borrows - 1
+        WHERE user_id = ?
+    """)
+
+    # ✅ NOUVEAU : historique par livre (ISBN)
+    ps_insert_borrow_by_book = Statement("""
+        INSERT INTO borrows_by_book
+        (isbn, borrow_date, user_id, user_name, book_title, status, return_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """)
+
+    ps_list_borrows_by_book = Statement("""
+        SELECT borrow_date, user_id, user_name, status, return_date, book_title
+        FROM borrows_by_book
+        WHERE isbn = ?
+    """)
+
+    # --- Historiques bucketés par mois ---
+    ps_insert_user_month = Statement("""
+        INSERT INTO borrows_by_user_month
+        (user_id, month, borrow_date, isbn, book_title, user_name, status, return_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """)
+
+    ps_list_user_month = Statement("""
+        SELECT isbn, book_title, borrow_date, status, return_date
+        FROM borrows_by_user_month
+        WHERE user_id = ? AND month = ?
+    """)
+
+    ps_insert_book_month = Statement("""
+        INSERT INTO borrows_by_book_month
+        (isbn, month, borrow_date, user_id, user_name, book_title, status, return_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """)
+
+    ps_list_book_month = Statement("""
+        SELECT borrow_date, user_id, user_name, status, return_date, book_title
+        FROM borrows_by_book_month
+        WHERE isbn = ? AND month = ?
+    """)
+
+    def __init__(self, session, pipelined: bool = True, batch_mode: Optional[str] = "logged",
+                 cache: Optional[LibraryCache] = None, bucketed: bool = False, inventory: str = "lwt",
+                 listings: Optional[ListingRefresher] = None, stats: Optional[StatsAggregator] = None,
+                 projection: str = "inline", fulfilment: str = "inline", max_active: Optional[int] = None,
+                 loan_days: int = LOAN_DAYS):
         self.session = session
+        # inventory="lwt" : stock modifié par compare-and-set sur books_by_isbn (pas de sur-réservation
+        # sous contention), listings catégorie/auteur recopiés en arrière-plan par `listings`.
+        # "plain" : lecture puis écriture de la nouvelle valeur dans les 3 tables (ancien comportement).
+        self.inventory = check_inventory_mode(inventory)
+        self.stock = Inventory(session)
+        self.listings = listings or ListingRefresher(session)
+        # Compteurs global_stats / book_popularity coalescés par ISBN (write-behind, cf. models/aggregator.py)
+        self.stats = stats or StatsAggregator(session)
+        # bucketed=True : historiques dans les tables *_month (partitions (clé, mois)), à n'activer
+        # qu'après migrate-buckets ; False : anciennes tables borrows_by_user / borrows_by_book
+        self.bucketed = bucketed
+        self.buckets = BucketIndex(session)
+        # Cache livres/users partagé : invalidé dès qu'un emprunt/retour change le stock ou les compteurs
+        self.cache = cache
+        # pipelined=True : lectures indépendantes en parallèle puis écritures
+        # envoyées ensemble via execute_async (≈ 2-3 RTT au lieu de 11).
+        self.pipelined = pipelined
+        # Mise à jour du stock (3 tables livres) : "logged", "unlogged" ou None (3 UPDATE séparés)
+        self.batch_mode = check_batch_mode(batch_mode)
+        # projection="outbox" : listings et historique par livre ne sont plus écrits dans la requête ;
+        # un événement est ajouté au batch logged de l'emprunt et le projecteur les écrit ensuite
+        self.projection = check_projection_mode(projection)
+        self.outbox = Outbox(session)
+        # Un retour sert la plus ancienne réservation PENDING du livre : pendant le retour ("inline"),
+        # par un thread vidant la file des retours ("worker") ou jamais ("off")
+        self.fulfiller = ReservationFulfiller(self, mode=fulfilment)
+        # Nombre max. d'emprunts simultanés par user (None = illimité) ; vérifié sur la partition
+        # active_borrow_by_user_book lue de toute façon par l'emprunt : aucune lecture en plus
+        self.max_active = max_active
+        self.loan_days = loan_days
+        # Emprunts en cours par jour d'échéance (scan des retards sans parcourir les historiques)
+        self.due = DueIndex(session, buckets=self.buckets)
+
+    # ========= I/O (séquentiel ou pipeliné) =========
+
+    def _fetch_one_all(self, queries):
+        """Exécute des lectures indépendantes et renvoie la 1re ligne de chacune (dans l'ordre)."""
+        if not self.pipelined:
+            return [self.session.execute(ps, params).one() for ps, params in queries]
+
+        futures = [self.session.execute_async(ps, params) for ps, params in queries]
+        return [f.result().one() for f in futures]
+
+    def _fetch_rows_all(self, queries):
+        """Exécute des lectures indépendantes et renvoie les lignes de chacune (dans l'ordre)."""
+        if not self.pipelined:
+            return [list(self.session.execute(ps, params).current_rows) for ps, params in queries]
+
+        futures = [self.session.execute_async(ps, params) for ps, params in queries]
+        return [list(f.result().current_rows) for f in futures]
+
+    def _execute_all(self, queries):
+        """Exécute des écritures indépendantes : fan-out execute_async puis attente groupée."""
+        if not self.pipelined:
+            for ps, params in queries:
+                self.session.execute(ps, params, execution_profile=WRITE_PROFILE)
+            return
+
+        futures = [self.session.execute_async(ps, params, execution_profile=WRITE_PROFILE) for ps, params in queries]
+        # On attend TOUTES les écritures avant de remonter une éventuelle erreur
+        errors = []
+        for f in futures:
+            try:
+                f.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def _write_and_invalidate(self, user_id: UUID, isbn: str, plan):
+        """Écritures d'un emprunt/retour puis invalidation du cache (même si une écriture échoue).
+
+        Les compteurs user ne partent qu'une fois les autres écritures réussies : un emprunt en
+        échec (stock compensé par l'appelant) ne laisse pas de +1/-1 orphelin.
+        """
+        try:
+            self._execute_all(self._queries(plan))
+            self._write_counters(plan[1])
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate_borrow(user_id, isbn)
+
+    def _write_counters(self, counters):
+        # Non idempotents (jamais rejoués) : un échec ici n'annule pas l'emprunt déjà écrit
+        try:
+            self._execute_all(counters)
+        except Exception as e:
+            logger.error(f"❌ user_counters error: {e}")
+
+    def _stock_updates(self, book, new_available: int, grouped: bool = True):
+        """UPDATE available_copies sur les 3 tables livres (groupés en BATCH si batch_mode et grouped)."""
+        return group_writes([
+            (self.ps_update_book_isbn, (new_available, book.isbn)),
+            (self.ps_update_book_category, (new_available, book.category, book.title, book.isbn)),
+            (self.ps_update_book_author, (new_available, book.author, book.title, book.isbn)),
+        ], self.batch_mode if grouped else None)
+
+    def _stock_writes(self, book, new_available: int, grouped: bool = True):
+        """Écritures de stock du plan : aucune en mode lwt (compare-and-set séparé, cf. Inventory)."""
+        if self.projection == "outbox":
+            # books_by_isbn seulement (si pas de CAS) ; les listings suivent via l'événement STOCK
+            own = [] if self.inventory == "lwt" else [(self.ps_update_book_isbn, (new_available, book.isbn))]
+            return own + [self.outbox.event(STOCK, book.isbn)]
+        return [] if self.inventory == "lwt" else self._stock_updates(book, new_available, grouped)
+
+    def _user_history_writes(self, user_id: UUID, event_date, isbn: str, book_title: str,
+                             user_name: str, status: str, return_date):
+        """Événement de l'historique user (+ entrée d'index du bucket si bucketé)."""
+        if not self.bucketed:
+            return [(self.ps_insert_borrow_history, (
+                user_id, event_date, isbn, book_title, user_name, status, return_date
+            ))]
+        month = month_bucket(event_date)
+        return [
+            (self.ps_insert_user_month, (
+                user_id, month, event_date, isbn, book_title, user_name, status, return_date
+            )),
+            self.buckets.entry(USER_HISTORY, user_id, month),
+        ]
+
+    def _book_history_writes(self, isbn: str, borrow_date, user_id: UUID, user_name: str,
+                             book_title: str, status: str, return_date):
+        """Événement de l'historique livre ; le bucket suit borrow_date (le retour ré-écrit la même ligne)."""
+        if self.projection == "outbox":
+            return [self.outbox.event(BORROW, isbn, {
+                "borrow_date": borrow_date, "user_id": user_id, "user_name": user_name,
+                "book_title": book_title, "status": status, "return_date": return_date,
+            })]
+        return self._book_history_rows(isbn, borrow_date, user_id, user_name, book_title, status, return_date)
+
+    def _book_history_rows(self, isbn: str, borrow_date, user_id: UUID, user_name: str,
+                           book_title: str, status: str, return_date):
+        if not self.bucketed:
+            return [(self.ps_insert_borrow_by_book, (
+                isbn, borrow_date, user_id, user_name, book_title, status, return_date
+            ))]
+        month = month_bucket(borrow_date)
+        return [
+            (self.ps_insert_book_month, (
+                isbn, month, borrow_date, user_id, user_name, book_title, status, return_date
+            )),
+            self.buckets.entry(BOOK_HISTORY, isbn, month),
+        ]
+
+    def _atomic(self, writes, counters, logged: bool = False):
+        """Plan d'écriture (écritures, compteurs, batch logged ?) ; les requêtes sont construites à l'envoi."""
+        return writes, counters, logged or self.projection == "outbox"
+
+    def _queries(self, plan):
+        """Écritures d'un plan, au moment de l'envoi (après le CAS du stock) : événements de l'outbox
+        horodatés maintenant, puis écritures + événements en un batch logged si demandé (les compteurs,
+        interdits en batch mixte, sont envoyés après, cf. _write_and_invalidate)."""
+        writes, _, logged = plan
+        if self.projection == "outbox":
+            writes = self.outbox.stamp(writes)
+        return group_writes(writes, "logged") if logged else list(writes)
+
+    def _take_copy(self, book, delta: int, compensate: bool = False) -> bool:
+        """Mode lwt : compare-and-set du stock autoritaire puis rafraîchissement différé des listings.
+
+        compensate=True annule un ajustement précédent dont les autres écritures ont échoué
+        (la valeur attendue est relue par le CAS lui-même).
+        """
+        if self.inventory != "lwt":
+            return True
+        expected = None if compensate else book.available_copies
+        if expected is None:
+            expected = self.stock.current(book.isbn)
+        if self.stock.adjust(book.isbn, delta, expected, book.total_copies if delta > 0 else None) is None:
+            return False
+        if self.projection == "inline":
+            self.listings.mark(book.isbn)
+        return True
+
+    # ========= Logique métier (indépendante du mode d'I/O, partagée avec la variante async) =========
+
+    def _borrow_reads(self, user_id: UUID, isbn: str):
+        # Lectures indépendantes : livre + emprunts actifs du user (max_active + 1 lignes suffisent :
+        # au-delà, l'emprunt est refusé de toute façon)
+        limit = self.max_active + 1 if self.max_active is not None else MAX_ACTIVE_SCAN
+        return [
+            (self.ps_get_book_isbn, (isbn,)),
+            (self.ps_list_active, (user_id, limit)),
+        ]
+
+    @staticmethod
+    def _borrow_state(rows):
+        """Lignes de _borrow_reads -> (livre ou None, emprunts actifs du user)."""
+        book_rows, held = rows
+        return (book_rows[0] if book_rows else None), held
+
+    def _refusal(self, held, isbn: str) -> Optional[str]:
+        """Motif de refus côté user (déjà emprunté, limite atteinte), None si l'emprunt est permis."""
+        if any(r.isbn == isbn for r in held):
+            return "Déjà emprunté par cet utilisateur"
+        if self.max_active is not None and len(held) >= self.max_active:
+            return f"Limite d'emprunts simultanés atteinte ({self.max_active})"
+        return None
+
+    def _plan_borrow(self, reads, user_id: UUID, isbn: str, book_title: str, user_name: str, extra=()):
+        """Vérifie les préconditions et renvoie les écritures de l'emprunt (None si refusé).
+
+        `extra` : écritures à appliquer atomiquement avec l'emprunt (batch logged), ex. le statut
+        de la réservation servie par le moteur de satisfaction.
+        """
+        book, held = reads
+
+        # 1) Vérifier livre + stock
+        if not book:
+            logger.warning("Livre introuvable")
+            return None
+
+        if book.available_copies is None or book.available_copies <= 0:
+            logger.warning("Plus de copies disponibles")
+            return None
+
+        # 2) Vérifier les emprunts en cours du user (déjà emprunté, limite)
+        refusal = self._refusal(held, isbn)
+        if refusal:
+            logger.warning(refusal)
+            return None
+
+        borrow_date = datetime.now(timezone.utc)
+        due_date = borrow_date + timedelta(days=self.loan_days)
+        new_available = book.available_copies - 1
+
+        return self._atomic([
+            # 3) Mettre à jour stock (3 tables) ; déjà dans le batch de l'emprunt si `extra`
+            *self._stock_writes(book, new_available, grouped=not extra),
+
+            # 4) Écrire emprunt (historique + actif)
+            *self._user_history_writes(user_id, borrow_date, isbn, book_title, user_name, "BORROWED", None),
+            (self.ps_upsert_active, (user_id, isbn, borrow_date, due_date, book_title, user_name)),
+            *self.due.entry(user_id, isbn, due_date, borrow_date, book_title, user_name),
+
+            # ✅ 4bis) Écrire aussi dans l’historique par livre
+            *self._book_history_writes(isbn, borrow_date, user_id, user_name, book_title, "BORROWED", None),
+            *extra,
+        ], [
+            # 5) Compteurs user (+1 total, +1 actifs)
+            (self.ps_inc_user_borrow, (user_id,)),
+        ], logged=bool(extra))
+
+    def _return_reads(self, user_id: UUID, isbn: str):
+        # Lectures indépendantes : emprunt actif + livre (category/title/author + stock)
+        return [
+            (self.ps_get_active, (user_id, isbn)),
+            (self.ps_get_book_isbn, (isbn,)),
+        ]
+
+    def _plan_return(self, reads, user_id: UUID, isbn: str):
+        """Vérifie l'emprunt actif et renvoie les écritures du retour (None si impossible)."""
+        active, book = reads
+
+        if not active:
+            logger.warning("Aucun emprunt actif pour ce user/livre")
+            return None
+
+        borrow_date = active.borrow_date  # ✅ super important (clé primaire de l’event)
+        return_date = datetime.now(timezone.utc)
 
-        # --- Inserts / Deletes borrow tables ---
-        self.ps_insert_borrow_history: PreparedStatement = session.prepare("""
-            INSERT INTO borrows_by_user
-            (user_id, borrow_date, isbn, book_title, user_name, status, return_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """)
-
-        self.ps_upsert_active: PreparedStatement = session.prepare("""
-            INSERT INTO active_borrow_by_user_book
-            (user_id, isbn, borrow_date, book_title, user_name)
-            VALUES (?, ?, ?, ?, ?)
-        """)
-
-        self.ps_delete_active: PreparedStatement = session.prepare("""
-            DELETE FROM active_borrow_by_user_book
-            WHERE user_id = ? AND isbn = ?
-        """)
-
-        self.ps_get_active: PreparedStatement = session.prepare("""
-            SELECT borrow_date, book_title, user_name
-            FROM active_borrow_by_user_book
-            WHERE user_id = ? AND isbn = ?
-        """)
-
-        self.ps_list_borrows_by_user: PreparedStatement = session.prepare("""
-            SELECT isbn, book_title, borrow_date, status, return_date
-            FROM borrows_by_user
-            WHERE user_id = ?
-        """)
-
-        # --- Book reads / updates ---
-        self.ps_get_book_isbn: PreparedStatement = session.prepare("""
-            SELECT isbn, title, author, category, available_copies, total_copies
-            FROM books_by_isbn
-            WHERE isbn = ?
-        """)
-
-        self.ps_update_book_isbn: PreparedStatement = session.prepare("""
-            UPDATE books_by_isbn
-            SET available_copies = ?
-            WHERE isbn = ?
-        """)
-
-        self.ps_update_book_category: PreparedStatement = session.prepare("""
-            UPDATE books_by_category
-            SET available_copies = ?
-            WHERE category = ? AND title = ? AND isbn = ?
-        """)
-
-        # ✅ (recommandé) garder cohérent aussi books_by_author
-        self.ps_update_book_author: PreparedStatement = session.prepare("""
-            UPDATE books_by_author
-            SET available_copies = ?
-            WHERE author = ? AND title = ? AND isbn = ?
-        """)
-
-        # --- User counters ---
-        self.ps_get_user_counters: PreparedStatement = session.prepare("""
-            SELECT total_borrows, active_borrows
-            FROM users_by_id
-            WHERE user_id = ?
-        """)
-
-        self.ps_update_user_counters: PreparedStatement = session.prepare("""
-            UPDATE users_by_id
-            SET total_borrows = ?, active_borrows = ?
-            WHERE user_id = ?
-        """)
-
-        # ✅ NOUVEAU : historique par livre (ISBN)
-        self.ps_insert_borrow_by_book: PreparedStatement = session.prepare("""
-            INSERT INTO borrows_by_book
-            (isbn, borrow_date, user_id, user_name, book_title, status, return_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """)
-        
-        # --- Stats counters ---
-        self.ps_inc_total_borrows: PreparedStatement = session.prepare("""
-            UPDATE global_stats
-            SET total_borrows = total_borrows + 1
-            WHERE stat_name = 'GLOBAL'
-        """)
-
-        self.ps_inc_book_popularity: PreparedStatement = session.prepare("""
-            UPDATE book_popularity
-            SET borrow_count = borrow_count + 1
-            WHERE isbn = ?
-        """)
-
-
-        self.ps_list_borrows_by_book: PreparedStatement = session.prepare("""
-            SELECT borrow_date, user_id, user_name, status, return_date, book_title
-            FROM borrows_by_book
-            WHERE isbn = ?
-        """)
+        if not book:
+            logger.warning("Livre introuvable")
+            return None
+
+        new_available = (book.available_copies or 0) + 1
+        if book.total_copies is not None:
+            new_available = min(new_available, book.total_copies)
+
+        return self._atomic([
+            # 2) Mettre à jour stock (3 tables)
+            *self._stock_writes(book, new_available),
+
+            # 3) Supprimer de la table active (et de l'index des échéances)
+            (self.ps_delete_active, (user_id, isbn)),
+            *self.due.removal(user_id, isbn, active.due_date),
+
+            # 4) Ajouter une ligne RETURNED dans l'historique user (nouvel event)
+            *self._user_history_writes(
+                user_id, return_date, isbn, active.book_title, active.user_name, "RETURNED", return_date
+            ),
+
+            # ✅ 4bis) Mettre à jour l’event borrows_by_book (même PK : isbn + borrow_date + user_id)
+            # Upsert Cassandra : on ré-écrit la même ligne avec status RETURNED + return_date
+            *self._book_history_writes(
+                isbn, borrow_date, user_id, active.user_name, active.book_title, "RETURNED", return_date
+            ),
+        ], [
+            # 5) Compteurs user (active_borrows - 1)
+            (self.ps_dec_user_active, (user_id,)),
+        ])
+
+    # ========= Projection (événements BORROW de l'outbox) =========
+
+    def project_borrows(self, isbn: str, events: Iterable[dict]):
+        """Écrit dans l'historique par livre les événements BORROW d'un ISBN, dans l'ordre de l'outbox.
+
+        Lève une exception en cas d'échec (le projecteur réessaie : les écritures sont des upserts).
+        """
+        for e in events:
+            rows = self._book_history_rows(
+                isbn, datetime.fromisoformat(e["borrow_date"]), UUID(e["user_id"]), e["user_name"],
+                e["book_title"], e["status"],
+                datetime.fromisoformat(e["return_date"]) if e["return_date"] else None,
+            )
+            self._execute_all(rows)
+
+    def _active_item(self, r, now: datetime):
+        # Anciennes lignes sans due_date : échéance recalculée depuis borrow_date
+        due = r.due_date or r.borrow_date + timedelta(days=self.loan_days)
+        return {
+            "isbn": r.isbn,
+            "book_title": r.book_title,
+            "borrow_date": r.borrow_date,
+            "due_date": due,
+            "overdue": due < now.replace(tzinfo=due.tzinfo),
+        }
+
+    def _active_items(self, rows):
+        now = datetime.now(timezone.utc)
+        return sorted((self._active_item(r, now) for r in rows), key=lambda b: b["due_date"])
+
+    @staticmethod
+    def _user_borrow_item(r):
+        return {
+            "isbn": r.isbn,
+            "book_title": r.book_title,
+            "borrow_date": r.borrow_date,
+            "status": r.status,
+            "return_date": r.return_date
+        }
+
+    @staticmethod
+    def _book_borrow_item(r):
+        return r._asdict()
+
+    # ========= API publique =========
 
     def borrow_book(self, user_id: UUID, isbn: str, book_title: str, user_name: str) -> bool:
         """Emprunter un livre (logique simple, sans transaction ACID)."""
         try:
-            # 1) Vérifier livre + stock
-            book = self.session.execute(self.ps_get_book_isbn, (isbn,)).one()
-            if not book:
-                logger.warning("Livre introuvable")
+            reads = self._borrow_state(self._fetch_rows_all(self._borrow_reads(user_id, isbn)))
+            writes = self._plan_borrow(reads, user_id, isbn, book_title, user_name)
+            if writes is None:
                 return False
 
-            if book.available_copies is None or book.available_copies <= 0:
+            book = reads[0]
+            if not self._take_copy(book, -1):
                 logger.warning("Plus de copies disponibles")
                 return False
+            try:
+                self._write_and_invalidate(user_id, isbn, writes)
+            except Exception:
+                self._take_copy(book, +1, compensate=True)
+                raise
+
+            self.stats.record_borrow(isbn)
+            logger.success(f"✅ Emprunt OK: {isbn} par {user_id}")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ borrow_book error: {e}")
+            return False
 
-            # 2) Vérifier si déjà emprunté par cet user (table active)
-            active = self.session.execute(self.ps_get_active, (user_id, isbn)).one()
-            if active:
-                logger.warning("Déjà emprunté par cet utilisateur")
+    def return_book(self, user_id: UUID, isbn: str) -> bool:
+        """Retourner un livre."""
+        try:
+            reads = self._fetch_one_all(self._return_reads(user_id, isbn))
+            writes = self._plan_return(reads, user_id, isbn)
+            if writes is None:
                 return False
 
-            borrow_date = datetime.now(timezone.utc)
-            new_available = book.available_copies - 1
+            book = reads[1]
+            if not self._take_copy(book, +1):
+                logger.warning("Remise en stock impossible (stock déjà complet ou conflit persistant)")
+                return False
+            try:
+                self._write_and_invalidate(user_id, isbn, writes)
+            except Exception:
+                self._take_copy(book, -1, compensate=True)
+                raise
 
-            # 3) Mettre à jour stock (3 tables)
-            self.session.execute(self.ps_update_book_isbn, (new_available, isbn))
-            self.session.execute(self.ps_update_book_category, (new_available, book.category, book.title, isbn))
-            self.session.execute(self.ps_update_book_author, (new_available, book.author, book.title, isbn))
+            logger.success(f"✅ Retour OK: {isbn} par {user_id}")
+            self.fulfiller.on_return(isbn)
+            return True
 
-            # 4) Écrire emprunt (historique + actif)
-            self.session.execute(self.ps_insert_borrow_history, (
-                user_id, borrow_date, isbn, book_title, user_name, "BORROWED", None
-            ))
-            self.session.execute(self.ps_upsert_active, (user_id, isbn, borrow_date, book_title, user_name))
+        except Exception as e:
+            logger.error(f"❌ return_book error: {e}")
+            return False
 
-            # ✅ 4bis) Écrire aussi dans l’historique par livre
-            self.session.execute(self.ps_insert_borrow_by_book, (
-                isbn, borrow_date, user_id, user_name, book_title, "BORROWED", None
-            ))
+    def get_active_borrows(self, user_id: UUID):
+        """Livres actuellement empruntés par le user (lecture de sa seule partition), échéance la plus proche d'abord."""
+        try:
+            return self._active_items(self.session.execute(self.ps_list_active, (user_id, MAX_ACTIVE_SCAN)))
+        except Exception as e:
+            logger.error(f"❌ get_active_borrows error: {e}")
+            return []
 
-            # 5) Mettre à jour compteurs user
-            counters = self.session.execute(self.ps_get_user_counters, (user_id,)).one()
-            total = (counters.total_borrows or 0) + 1 if counters else 1
-            active_count = (counters.active_borrows or 0) + 1 if counters else 1
-            self.session.execute(self.ps_update_user_counters, (total, active_count, user_id))
+    def iter_overdue(self, as_of: Optional[datetime] = None):
+        """Emprunts en retard, du plus ancien jour d'échéance au plus récent (générateur, lu page par page)."""
+        try:
+            yield from self.due.overdue(as_of)
+        except Exception as e:
+            logger.error(f"❌ iter_overdue error: {e}")
+
+    def get_user_borrows(self, user_id: UUID, limit: Optional[int] = None):
+        """Historique du plus récent au plus ancien ; avec `limit`, les vieux buckets ne sont pas lus."""
+        if self.bucketed:
+            months = self.buckets.months(USER_HISTORY, user_id)
+            return fetch_buckets(self.session, self.ps_list_user_month, user_id, months,
+                                 self._user_borrow_item, limit)
+        rows = self.session.execute(self.ps_list_borrows_by_user, (user_id,))
+        return [self._user_borrow_item(r) for r in islice(rows, limit)]
+
+    # ✅ NOUVEAU : query pattern “Qui a emprunté un livre spécifique ?”
+    def get_borrows_by_book(self, isbn: str, limit: Optional[int] = None):
+        if self.bucketed:
+            months = self.buckets.months(BOOK_HISTORY, isbn)
+            return fetch_buckets(self.session, self.ps_list_book_month, isbn, months,
+                                 self._book_borrow_item, limit)
+        rows = self.session.execute(self.ps_list_borrows_by_book, (isbn,))
+        return [self._book_borrow_item(r) for r in islice(rows, limit)]
+
+    # ========= Itérateurs (historique complet, page par page du driver) =========
+    # Pas de try/except : une erreur remonte au consommateur (un flux HTTP doit pouvoir la signaler)
+
+    def iter_user_borrows(self, user_id: UUID):
+        """Tout l'historique du user, du plus récent au plus ancien (au plus deux pages en mémoire)."""
+        if self.bucketed:
+            months = self.buckets.months(USER_HISTORY, user_id)
+            yield from iter_buckets(self.session, self.ps_list_user_month, user_id, months, self._user_borrow_item)
+        else:
+            yield from iter_rows(self.session, self.ps_list_borrows_by_user, (user_id,), self._user_borrow_item)
+
+    def iter_borrows_by_book(self, isbn: str):
+        if self.bucketed:
+            months = self.buckets.months(BOOK_HISTORY, isbn)
+            yield from iter_buckets(self.session, self.ps_list_book_month, isbn, months, self._book_borrow_item)
+        else:
+            yield from iter_rows(self.session, self.ps_list_borrows_by_book, (isbn,), self._book_borrow_item)
+
+    # ========= Listings paginés (fetch_size + curseur opaque) =========
+
+    def get_user_borrows_page(self, user_id: UUID, page_size: int = DEFAULT_PAGE_SIZE,
+                              cursor: Optional[str] = None) -> Page:
+        try:
+            if self.bucketed:
+                months = self.buckets.months(USER_HISTORY, user_id)
+                return fetch_bucketed_page(self.session, self.ps_list_user_month, user_id, months,
+                                           page_size, cursor, self._user_borrow_item)
+            return fetch_page(self.session, self.ps_list_borrows_by_user, (user_id,),
+                              page_size, cursor, self._user_borrow_item)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ get_user_borrows_page error: {e}")
+            return Page()
+
+    def get_borrows_by_book_page(self, isbn: str, page_size: int = DEFAULT_PAGE_SIZE,
+                                 cursor: Optional[str] = None) -> Page:
+        try:
+            if self.bucketed:
+                months = self.buckets.months(BOOK_HISTORY, isbn)
+                return fetch_bucketed_page(self.session, self.ps_list_book_month, isbn, months,
+                                           page_size, cursor, self._book_borrow_item)
+            return fetch_page(self.session, self.ps_list_borrows_by_book, (isbn,),
+                              page_size, cursor, self._book_borrow_item)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ get_borrows_by_book_page error: {e}")
+            return Page()
 
-            logger.success(f"✅ Emprunt OK: {isbn} par {user_id}")
-            return True
 
-            # 6) Stats (counters)
-            self.session.execute(self.ps_inc_total_borrows)
-            self.session.execute(self.ps_inc_book_popularity, (isbn,))
+class AsyncBorrowRepository(BorrowRepository):
+    """Variante asyncio : lectures puis écritures lancées ensemble et attendues sans bloquer de thread."""
 
+    async def _awrite_and_invalidate(self, user_id: UUID, isbn: str, plan):
+        try:
+            await aexecute_all(self.session, self._queries(plan))
+            await self._awrite_counters(plan[1])
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate_borrow(user_id, isbn)
 
+    async def _awrite_counters(self, counters):
+        try:
+            await aexecute_all(self.session, counters)
         except Exception as e:
-            logger.error(f"❌ borrow_book error: {e}")
+            logger.error(f"❌ user_counters error: {e}")
+
+    async def _atake_copy(self, book, delta: int, compensate: bool = False) -> bool:
+        if self.inventory != "lwt":
+            return True
+        expected = None if compensate else book.available_copies
+        if expected is None:
+            expected = await self.stock.acurrent(book.isbn)
+        if await self.stock.aadjust(book.isbn, delta, expected, book.total_copies if delta > 0 else None) is None:
             return False
+        if self.projection == "inline":
+            self.listings.mark(book.isbn)
+        return True
 
-    def return_book(self, user_id: UUID, isbn: str) -> bool:
-        """Retourner un livre."""
+    async def borrow_book(self, user_id: UUID, isbn: str, book_title: str, user_name: str) -> bool:
         try:
-            # 1) Vérifier emprunt actif
-            active = self.session.execute(self.ps_get_active, (user_id, isbn)).one()
-            if not active:
-                logger.warning("Aucun emprunt actif pour ce user/livre")
+            reads = self._borrow_state(await afetch_rows_all(self.session, self._borrow_reads(user_id, isbn)))
+            writes = self._plan_borrow(reads, user_id, isbn, book_title, user_name)
+            if writes is None:
                 return False
 
-            borrow_date = active.borrow_date  # ✅ super important (clé primaire de l’event)
-            return_date = datetime.now(timezone.utc)
-
-            # 2) Lire livre pour category/title/author + stock
-            book = self.session.execute(self.ps_get_book_isbn, (isbn,)).one()
-            if not book:
-                logger.warning("Livre introuvable")
+            book = reads[0]
+            if not await self._atake_copy(book, -1):
+                logger.warning("Plus de copies disponibles")
                 return False
+            try:
+                await self._awrite_and_invalidate(user_id, isbn, writes)
+            except Exception:
+                await self._atake_copy(book, +1, compensate=True)
+                raise
 
-            new_available = (book.available_copies or 0) + 1
-            if book.total_copies is not None:
-                new_available = min(new_available, book.total_copies)
-
-            # 3) Mettre à jour stock (3 tables)
-            self.session.execute(self.ps_update_book_isbn, (new_available, isbn))
-            self.session.execute(self.ps_update_book_category, (new_available, book.category, book.title, isbn))
-            self.session.execute(self.ps_update_book_author, (new_available, book.author, book.title, isbn))
-
-            # 4) Supprimer de la table active
-            self.session.execute(self.ps_delete_active, (user_id, isbn))
+            await self.stats.arecord_borrow(isbn)
+            logger.success(f"✅ Emprunt OK: {isbn} par {user_id}")
+            return True
 
-            # 5) Ajouter une ligne RETURNED dans l'historique user (nouvel event)
-            self.session.execute(self.ps_insert_borrow_history, (
-                user_id, return_date, isbn, active.book_title, active.user_name, "RETURNED", return_date
-            ))
+        except Exception as e:
+            logger.error(f"❌ borrow_book error: {e}")
+            return False
 
-            # ✅ 5bis) Mettre à jour l’event borrows_by_book (même PK : isbn + borrow_date + user_id)
-            # Upsert Cassandra : on ré-écrit la même ligne avec status RETURNED + return_date
-            self.session.execute(self.ps_insert_borrow_by_book, (
-                isbn, borrow_date, user_id, active.user_name, active.book_title, "RETURNED", return_date
-            ))
+    async def return_book(self, user_id: UUID, isbn: str) -> bool:
+        try:
+            reads = await afetch_one_all(self.session, self._return_reads(user_id, isbn))
+            writes = self._plan_return(reads, user_id, isbn)
+            if writes is None:
+                return False
 
-            # 6) Mettre à jour compteurs user (active_borrows - 1)
-            counters = self.session.execute(self.ps_get_user_counters, (user_id,)).one()
-            total = (counters.total_borrows or 0) if counters else 0
-            active_count = max((counters.active_borrows or 0) - 1, 0) if counters else 0
-            self.session.execute(self.ps_update_user_counters, (total, active_count, user_id))
+            book = reads[1]
+            if not await self._atake_copy(book, +1):
+                logger.warning("Remise en stock impossible (stock déjà complet ou conflit persistant)")
+                return False
+            try:
+                await self._awrite_and_invalidate(user_id, isbn, writes)
+            except Exception:
+                await self._atake_copy(book, -1, compensate=True)
+                raise
 
             logger.success(f"✅ Retour OK: {isbn} par {user_id}")
+            if self.fulfiller.mode == "inline":
+                # Le moteur est synchrone (claims LWT séquentiels) : exécuté hors de la boucle
+                await asyncio.get_running_loop().run_in_executor(None, self.fulfiller.on_return, isbn)
+            else:
+                self.fulfiller.on_return(isbn)
             return True
 
         except Exception as e:
             logger.error(f"❌ return_book error: {e}")
             return False
 
-    def get_user_borrows(self, user_id: UUID):
-        rows = self.session.execute(self.ps_list_borrows_by_user, (user_id,))
-        return [
-            {
-                "isbn": r.isbn,
-                "book_title": r.book_title,
-                "borrow_date": r.borrow_date,
-                "status": r.status,
-                "return_date": r.return_date
-            }
-            for r in rows
-        ]
+    async def get_active_borrows(self, user_id: UUID):
+        try:
+            return self._active_items(await afetch_all(self.session, self.ps_list_active, (user_id, MAX_ACTIVE_SCAN)))
+        except Exception as e:
+            logger.error(f"❌ get_active_borrows error: {e}")
+            return []
 
-    # ✅ NOUVEAU : query pattern “Qui a emprunté un livre spécifique ?”
-    def get_borrows_by_book(self, isbn: str):
-        rows = self.session.execute(self.ps_list_borrows_by_book, (isbn,))
-        return [dict(r._asdict()) for r in rows]
+    async def iter_overdue(self, as_of: Optional[datetime] = None):
+        try:
+            async for item in self.due.aoverdue(as_of):
+                yield item
+        except Exception as e:
+            logger.error(f"❌ iter_overdue error: {e}")
+
+    async def get_user_borrows(self, user_id: UUID, limit: Optional[int] = None):
+        if self.bucketed:
+            months = await self.buckets.amonths(USER_HISTORY, user_id)
+            return await afetch_buckets(self.session, self.ps_list_user_month, user_id, months,
+                                        self._user_borrow_item, limit)
+        rows = await afetch_all(self.session, self.ps_list_borrows_by_user, (user_id,))
+        return [self._user_borrow_item(r) for r in islice(rows, limit)]
+
+    async def get_borrows_by_book(self, isbn: str, limit: Optional[int] = None):
+        if self.bucketed:
+            months = await self.buckets.amonths(BOOK_HISTORY, isbn)
+            return await afetch_buckets(self.session, self.ps_list_book_month, isbn, months,
+                                        self._book_borrow_item, limit)
+        rows = await afetch_all(self.session, self.ps_list_borrows_by_book, (isbn,))
+        return [self._book_borrow_item(r) for r in islice(rows, limit)]
+
+    async def iter_user_borrows(self, user_id: UUID):
+        if self.bucketed:
+            months = await self.buckets.amonths(USER_HISTORY, user_id)
+            rows = aiter_buckets(self.session, self.ps_list_user_month, user_id, months, self._user_borrow_item)
+        else:
+            rows = aiter_rows(self.session, self.ps_list_borrows_by_user, (user_id,), self._user_borrow_item)
+        async for item in rows:
+            yield item
+
+    async def iter_borrows_by_book(self, isbn: str):
+        if self.bucketed:
+            months = await self.buckets.amonths(BOOK_HISTORY, isbn)
+            rows = aiter_buckets(self.session, self.ps_list_book_month, isbn, months, self._book_borrow_item)
+        else:
+            rows = aiter_rows(self.session, self.ps_list_borrows_by_book, (isbn,), self._book_borrow_item)
+        async for item in rows:
+            yield item
+
+    async def get_user_borrows_page(self, user_id: UUID, page_size: int = DEFAULT_PAGE_SIZE,
+                                    cursor: Optional[str] = None) -> Page:
+        try:
+            if self.bucketed:
+                months = await self.buckets.amonths(USER_HISTORY, user_id)
+                return await afetch_bucketed_page(self.session, self.ps_list_user_month, user_id, months,
+                                                  page_size, cursor, self._user_borrow_item)
+            return await afetch_page(self.session, self.ps_list_borrows_by_user, (user_id,),
+                                     page_size, cursor, self._user_borrow_item)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ get_user_borrows_page error: {e}")
+            return Page()
+
+    async def get_borrows_by_book_page(self, isbn: str, page_size: int = DEFAULT_PAGE_SIZE,
+                                       cursor: Optional[str] = None) -> Page:
+        try:
+            if self.bucketed:
+                months = await self.buckets.amonths(BOOK_HISTORY, isbn)
+                return await afetch_bucketed_page(self.session, self.ps_list_book_month, isbn, months,
+                                                  page_size, cursor, self._book_borrow_item)
+            return await afetch_page(self.session, self.ps_list_borrows_by_book, (isbn,),
+                                     page_size, cursor, self._book_borrow_item)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ get_borrows_by_book_page error: {e}")
+            return Page()
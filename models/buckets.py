@@ -0,0 +1,181 @@
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from cassandra.query import PreparedStatement
+
+from config.database import WRITE_PROFILE
+from models.aio import aexecute, afetch_next_page
+from models.paging import (
+    STREAM_FETCH_SIZE, Page, aiter_rows, check_page_size, decode_cursor, encode_cursor, iter_rows,
+)
+from models.statements import Statement
+
+# Tables d'historique bucketées par mois : (clé, month) -> partitions bornées dans le temps
+USER_HISTORY = "borrows_by_user_month"
+BOOK_HISTORY = "borrows_by_book_month"
+BOOK_RESERVATIONS = "reservations_by_book_month"
+
+
+def month_bucket(dt: datetime) -> int:
+    """Bucket mensuel d'une date : 2024-03-17 -> 202403."""
+    return dt.year * 100 + dt.month
+
+
+class BucketIndex:
+    """Index des buckets existants par (table, clé) : évite de sonder des mois vides."""
+
+    ps_add_bucket = Statement("""
+        INSERT INTO history_buckets (table_name, key, month)
+        VALUES (?, ?, ?)
+    """)
+
+    ps_remove_bucket = Statement("""
+        DELETE FROM history_buckets
+        WHERE table_name = ? AND key = ? AND month = ?
+    """)
+
+    # Partition minuscule (1 ligne par mois), déjà triée du plus récent au plus ancien
+    ps_list_buckets = Statement("""
+        SELECT month FROM history_buckets
+        WHERE table_name = ? AND key = ?
+    """)
+
+    def __init__(self, session):
+        self.session = session
+
+    def entry(self, table: str, key, month: int) -> Tuple[PreparedStatement, tuple]:
+        """Écriture idempotente à joindre à celles de l'événement."""
+        return self.ps_add_bucket, (table, str(key), month)
+
+    def remove(self, table: str, key, month: int, consistency_level=None):
+        """Retire un bucket devenu vide (l'appelant garantit qu'il ne sera plus écrit)."""
+        bound = self.ps_remove_bucket.bind((table, str(key), month))
+        bound.consistency_level = consistency_level  # None : celle du profil d'écriture
+        self.session.execute(bound, execution_profile=WRITE_PROFILE)
+
+    def months(self, table: str, key, newest_first: bool = True) -> List[int]:
+        months = [r.month for r in self.session.execute(self.ps_list_buckets, (table, str(key)))]
+        return months if newest_first else months[::-1]
+
+    async def amonths(self, table: str, key, newest_first: bool = True) -> List[int]:
+        rows = await aexecute(self.session, self.ps_list_buckets, (table, str(key)))
+        months = [r.month for r in rows]
+        return months if newest_first else months[::-1]
+
+
+# ========= Lectures multi-buckets =========
+
+def _bind(ps, key, month: int, fetch_size: Optional[int]):
+    bound = ps.bind((key, month))
+    if fetch_size:
+        bound.fetch_size = fetch_size
+    return bound
+
+
+def fetch_buckets(session, ps, key, months: List[int], decode: Callable[[Any], Any],
+                  limit: Optional[int] = None) -> List[Any]:
+    """Lit les buckets dans l'ordre donné et s'arrête dès que `limit` lignes sont lues."""
+    items: List[Any] = []
+    for month in months:
+        remaining = limit - len(items) if limit else None
+        for row in session.execute(_bind(ps, key, month, remaining)):
+            items.append(decode(row))
+            if limit and len(items) >= limit:
+                return items
+    return items
+
+
+async def afetch_buckets(session, ps, key, months: List[int], decode: Callable[[Any], Any],
+                         limit: Optional[int] = None) -> List[Any]:
+    """Variante asyncio de fetch_buckets."""
+    items: List[Any] = []
+    for month in months:
+        remaining = limit - len(items) if limit else None
+        result = await aexecute(session, _bind(ps, key, month, remaining))
+        while True:
+            for row in result.current_rows:
+                items.append(decode(row))
+                if limit and len(items) >= limit:
+                    return items
+            if not result.has_more_pages:
+                break
+            result = await afetch_next_page(result)
+    return items
+
+
+def iter_buckets(session, ps, key, months: List[int], decode: Callable[[Any], Any],
+                 fetch_size: int = STREAM_FETCH_SIZE) -> Iterator[Any]:
+    """Toutes les lignes des buckets, dans l'ordre donné, page par page (voir iter_rows)."""
+    for month in months:
+        yield from iter_rows(session, ps, (key, month), decode, fetch_size)
+
+
+async def aiter_buckets(session, ps, key, months: List[int], decode: Callable[[Any], Any],
+                        fetch_size: int = STREAM_FETCH_SIZE) -> AsyncIterator[Any]:
+    """Variante asyncio de iter_buckets."""
+    for month in months:
+        async for item in aiter_rows(session, ps, (key, month), decode, fetch_size):
+            yield item
+
+
+# Curseur d'une page multi-buckets : mois courant (4 octets) + paging_state du driver dans ce mois
+
+def _encode_bucket_cursor(month: Optional[int], paging_state: Optional[bytes]) -> Optional[str]:
+    if month is None:
+        return None
+    return encode_cursor(month.to_bytes(4, "big") + (paging_state or b""))
+
+
+def _pending_months(months: List[int], cursor: Optional[str]) -> Tuple[List[int], Optional[bytes]]:
+    raw = decode_cursor(cursor)
+    if not raw:
+        return months, None
+    if len(raw) < 4:
+        raise ValueError("cursor invalide")
+    month = int.from_bytes(raw[:4], "big")
+    if month not in months:
+        raise ValueError("cursor invalide")
+    return months[months.index(month):], raw[4:] or None
+
+
+def _page_step(items, month, result, pending, i, page_size) -> Optional[Page]:
+    """Page terminée après ce bucket ? (None = continuer avec le bucket suivant)."""
+    if result.has_more_pages:
+        return Page(items=items, next_cursor=_encode_bucket_cursor(month, result.paging_state))
+    if len(items) >= page_size:
+        nxt = pending[i + 1] if i + 1 < len(pending) else None
+        return Page(items=items, next_cursor=_encode_bucket_cursor(nxt, None))
+    return None
+
+
+def fetch_bucketed_page(session, ps, key, months: List[int], page_size: int, cursor: Optional[str],
+                        decode: Callable[[Any], Any]) -> Page:
+    """Une page qui enjambe les buckets (du 1er de `months` au dernier) sans lire au-delà de page_size."""
+    check_page_size(page_size)
+    pending, paging_state = _pending_months(months, cursor)
+    items: List[Any] = []
+    for i, month in enumerate(pending):
+        result = session.execute(_bind(ps, key, month, page_size - len(items)), paging_state=paging_state)
+        paging_state = None
+        items.extend(decode(r) for r in result.current_rows)
+        page = _page_step(items, month, result, pending, i, page_size)
+        if page is not None:
+            return page
+    return Page(items=items)
+
+
+async def afetch_bucketed_page(session, ps, key, months: List[int], page_size: int, cursor: Optional[str],
+                               decode: Callable[[Any], Any]) -> Page:
+    """Variante asyncio de fetch_bucketed_page."""
+    check_page_size(page_size)
+    pending, paging_state = _pending_months(months, cursor)
+    items: List[Any] = []
+    for i, month in enumerate(pending):
+        result = await aexecute(session, _bind(ps, key, month, page_size - len(items)),
+                                paging_state=paging_state)
+        paging_state = None
+        items.extend(decode(r) for r in result.current_rows)
+        page = _page_step(items, month, result, pending, i, page_size)
+        if page is not None:
+            return page
+    return Page(items=items)
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """Cache LRU borné en taille, avec TTL par entrée et compteurs hit/miss (thread-safe)."""
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Renvoie (trouvé, valeur). Une entrée expirée compte comme un miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class LibraryCache:
+    """Caches partagés (un par entité, chacun avec son TTL) utilisés par l'API et le CLI."""
+
+    def __init__(self, book_maxsize: int = 10_000, book_ttl: float = 30.0,
+                 user_maxsize: int = 10_000, user_ttl: float = 60.0):
+        self.books = LRUCache(book_maxsize, book_ttl)
+        self.users = LRUCache(user_maxsize, user_ttl)
+
+    def invalidate_borrow(self, user_id, isbn: str):
+        """Un emprunt/retour change available_copies du livre et les compteurs du user."""
+        self.books.invalidate(isbn)
+        self.users.invalidate(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"books": self.books.stats(), "users": self.users.stats()}
+
+
+class CachedBookRepository:
+    """Read-through devant BookRepository (les autres méthodes sont déléguées telles quelles)."""
+
+    def __init__(self, repo, cache: LRUCache):
+        self.repo = repo
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.repo, name)
+
+    def get_book_by_isbn(self, isbn: str):
+        found, book = self.cache.get(isbn)
+        if found:
+            return book
+        book = self.repo.get_book_by_isbn(isbn)
+        if book is not None:  # pas de cache négatif : un livre ajouté ailleurs doit apparaître
+            self.cache.set(isbn, book)
+        return book
+
+    def add_book(self, book) -> bool:
+        ok = self.repo.add_book(book)
+        self.cache.invalidate(book.isbn)
+        return ok
+
+    def _cached_many(self, isbns):
+        """(livres trouvés en cache, ISBN à lire en base), ordre d'entrée conservé."""
+        books, misses = {}, []
+        for isbn in dict.fromkeys(isbns):
+            found, book = self.cache.get(isbn)
+            books[isbn] = book
+            if not found:
+                misses.append(isbn)
+        return books, misses
+
+    def _store_many(self, books, fetched):
+        # Lecture en échec : l'ISBN est absent de `fetched`, on le retire aussi du résultat
+        for isbn in [i for i, book in books.items() if book is None and i not in fetched]:
+            del books[isbn]
+        for isbn, book in fetched.items():
+            books[isbn] = book
+            if book is not None:
+                self.cache.set(isbn, book)
+        return books
+
+    def get_books_by_isbns(self, isbns):
+        books, misses = self._cached_many(isbns)
+        return self._store_many(books, self.repo.get_books_by_isbns(misses) if misses else {})
+
+
+class CachedUserRepository:
+    """Read-through devant UserRepository."""
+
+    def __init__(self, repo, cache: LRUCache):
+        self.repo = repo
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.repo, name)
+
+    def get_user(self, user_id):
+        found, user = self.cache.get(user_id)
+        if found:
+            return user
+        user = self.repo.get_user(user_id)
+        if user is not None:
+            self.cache.set(user_id, user)
+        return user
+
+
+class AsyncCachedBookRepository(CachedBookRepository):
+    """Read-through devant AsyncBookRepository."""
+
+    async def get_book_by_isbn(self, isbn: str):
+        found, book = self.cache.get(isbn)
+        if found:
+            return book
+        book = await self.repo.get_book_by_isbn(isbn)
+        if book is not None:
+            self.cache.set(isbn, book)
+        return book
+
+    async def get_books_by_isbns(self, isbns):
+        books, misses = self._cached_many(isbns)
+        return self._store_many(books, await self.repo.get_books_by_isbns(misses) if misses else {})
+
+    async def add_book(self, book) -> bool:
+        ok = await self.repo.add_book(book)
+        self.cache.invalidate(book.isbn)
+        return ok
+
+
+class AsyncCachedUserRepository(CachedUserRepository):
+    """Read-through devant AsyncUserRepository."""
+
+    async def get_user(self, user_id):
+        found, user = self.cache.get(user_id)
+        if found:
+            return user
+        user = await self.repo.get_user(user_id)
+        if user is not None:
+            self.cache.set(user_id, user)
+        return user
+
+
+def cached_repositories(book_repo, user_repo, cache: Optional[LibraryCache] = None):
+    """Enveloppe les repositories livres/users avec le cache (créé si absent)."""
+    cache = cache or LibraryCache()
+    return CachedBookRepository(book_repo, cache.books), CachedUserRepository(user_repo, cache.users), cache
@@ -0,0 +1,260 @@
+import atexit
+import threading
+import time
+from typing import Optional, Set, Tuple
+
+from loguru import logger
+
+from config.database import WRITE_PROFILE
+from models.batch import group_writes
+from models.reservation import Reservation, ReservationRepository
+from models.rows import was_applied
+from models.statements import Statement
+
+# "inline" : la réservation est servie pendant le retour ; "worker" : file de retours vidée par un thread ;
+# "off" : aucune satisfaction automatique (comportement historique)
+FULFILMENT_MODES = ("inline", "worker", "off")
+
+# Bornes par ISBN et par passage : claims perdus consécutifs, réservations servies
+MAX_CLAIM_RETRIES = 8
+MAX_PER_PASS = 100
+
+
+def check_fulfilment_mode(mode: str) -> str:
+    if mode not in FULFILMENT_MODES:
+        raise ValueError(f"fulfilment inconnu: {mode} ({', '.join(FULFILMENT_MODES)})")
+    return mode
+
+
+class ReservationFulfiller:
+    """Attribue les exemplaires rendus aux réservations PENDING, dans l'ordre de la file.
+
+    Une tête de file par ISBN (reservation_heads : dernière réservation traitée + version)
+    évite de relire le début de la partition : la suivante est lue à partir de cette position.
+    Servir une réservation =
+    1. claim de la tête par compare-and-set sur `version` (deux retours simultanés ne servent
+       jamais la même réservation) ;
+    2. emprunt au nom du réservataire (stock par CAS en mode lwt) et statut FULFILLED écrits
+       dans le même batch logged ;
+    3. en cas d'échec (plus d'exemplaire, écriture refusée), la tête est rendue et l'exemplaire
+       remis en stock : la réservation reste PENDING pour le retour suivant. Si un autre retour a
+       déplacé la tête entre-temps, la réservation est remise en fin de file (cf. _release).
+    """
+
+    ps_get_head = Statement("""
+        SELECT version, reservation_date, user_id
+        FROM reservation_heads
+        WHERE isbn = ?
+    """)
+
+    ps_create_head = Statement("""
+        INSERT INTO reservation_heads (isbn, version, reservation_date, user_id)
+        VALUES (?, ?, ?, ?)
+        IF NOT EXISTS
+    """)
+
+    ps_move_head = Statement("""
+        UPDATE reservation_heads
+        SET version = ?, reservation_date = ?, user_id = ?
+        WHERE isbn = ?
+        IF version = ?
+    """)
+
+    def __init__(self, borrow_repo, reservations: Optional[ReservationRepository] = None,
+                 mode: str = "inline", interval: float = 0.05):
+        self.session = borrow_repo.session
+        self.borrows = borrow_repo
+        self.reservations = reservations or ReservationRepository(self.session)
+        self.mode = check_fulfilment_mode(mode)
+        self.interval = interval
+
+        self._dirty: Set[str] = set()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.fulfilled = 0
+        self.skipped = 0
+        self.claim_conflicts = 0
+        self.requeued = 0
+
+    # ========= Tête de file =========
+
+    def _head(self, isbn: str):
+        row = self.session.execute(self.ps_get_head, (isbn,)).one()
+        if row is None:
+            return 0, None
+        after = (row.reservation_date, row.user_id) if row.reservation_date is not None else None
+        return row.version, after
+
+    def _move(self, isbn: str, version: int, to: Optional[Reservation]) -> bool:
+        """Avance la tête de `version` à version + 1 (False si un autre retour l'a déplacée)."""
+        date, user_id = (to.reservation_date, to.user_id) if to else (None, None)
+        if version == 0:
+            result = self.session.execute(self.ps_create_head, (isbn, 1, date, user_id),
+                                          execution_profile=WRITE_PROFILE)
+        else:
+            result = self.session.execute(self.ps_move_head, (version + 1, date, user_id, isbn, version),
+                                          execution_profile=WRITE_PROFILE)
+        return was_applied(result)
+
+    def _release(self, isbn: str, version: int, previous, reservation: Reservation):
+        """Annule un claim : la tête revient à sa position précédente (nouvelle version).
+
+        Si un autre retour a déjà avancé la tête (CAS perdu), la réservation resterait PENDING derrière
+        elle sans plus jamais être lue ; reculer la tête rouvrirait au contraire la réservation que cet
+        autre retour est en train de servir (servie deux fois). Elle est donc remise en fin de file.
+        """
+        date, user_id = previous or (None, None)
+        result = self.session.execute(self.ps_move_head, (version + 2, date, user_id, isbn, version + 1),
+                                      execution_profile=WRITE_PROFILE)
+        if was_applied(result):
+            return
+        for ps, params in group_writes(self.reservations.requeue_writes(reservation), "logged"):
+            self.session.execute(ps, params, execution_profile=WRITE_PROFILE)
+        self.requeued += 1
+        logger.warning(f"Réservation remise en fin de file: {isbn} pour {reservation.user_id}")
+
+    # ========= Satisfaction =========
+
+    def fulfil_one(self, isbn: str) -> Optional[Reservation]:
+        """Sert la plus ancienne réservation PENDING si un exemplaire est disponible. None sinon."""
+        return self._fulfil_next(isbn)[0]
+
+    def _fulfil_next(self, isbn: str) -> Tuple[Optional[Reservation], int]:
+        """(réservation servie ou None, exemplaires restants après elle)."""
+        repo = self.borrows
+        for _ in range(MAX_CLAIM_RETRIES):
+            version, after = self._head(isbn)
+            reservation = self.reservations.next_pending(isbn, after)
+            if reservation is None:
+                return None, 0
+
+            book, held = repo._borrow_state(repo._fetch_rows_all(repo._borrow_reads(reservation.user_id, isbn)))
+            if not book or not book.available_copies or book.available_copies <= 0:
+                return None, 0
+
+            if repo._refusal(held, isbn):
+                # Déjà emprunté par ce réservataire ou limite d'emprunts atteinte :
+                # réservation sautée, la tête avance quand même
+                if self._move(isbn, version, reservation):
+                    self.session.execute(*self.reservations.status_write(reservation, "SKIPPED"),
+                                         execution_profile=WRITE_PROFILE)
+                    self.skipped += 1
+                else:
+                    self.claim_conflicts += 1
+                continue
+
+            if not self._move(isbn, version, reservation):
+                self.claim_conflicts += 1
+                continue
+
+            writes = repo._plan_borrow(
+                (book, held), reservation.user_id, isbn, book.title, reservation.user_name,
+                extra=[self.reservations.status_write(reservation, "FULFILLED")],
+            )
+            if not repo._take_copy(book, -1):
+                self._release(isbn, version, after, reservation)
+                return None, 0
+            try:
+                repo._write_and_invalidate(reservation.user_id, isbn, writes)
+            except Exception:
+                repo._take_copy(book, +1, compensate=True)
+                self._release(isbn, version, after, reservation)
+                raise
+
+            repo.stats.record_borrow(isbn)
+            self.fulfilled += 1
+            logger.success(f"✅ Réservation servie: {isbn} pour {reservation.user_id}")
+            return reservation, book.available_copies - 1
+        return None, 0
+
+    def fulfil(self, isbn: str) -> int:
+        """Sert les réservations de `isbn` tant qu'il reste des exemplaires. Renvoie le nombre servi."""
+        served = 0
+        while served < MAX_PER_PASS:
+            reservation, left = self._fulfil_next(isbn)
+            if reservation is None:
+                break
+            served += 1
+            if left <= 0:
+                break   # dernier exemplaire attribué : inutile de relire la file
+        return served
+
+    def on_return(self, isbn: str):
+        """Appelé après un retour réussi. Une erreur ne fait jamais échouer le retour."""
+        if self.mode == "off":
+            return
+        if self.mode == "worker":
+            self.mark(isbn)
+            return
+        try:
+            self.fulfil(isbn)
+        except Exception as e:
+            logger.error(f"❌ fulfil {isbn} error: {e}")
+
+    # ========= File de retours (mode worker) =========
+
+    def mark(self, isbn: str):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="reservation-fulfiller", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._dirty.add(isbn)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if not self._dirty and self._closed:
+                    return
+                batch, self._dirty = self._dirty, set()
+                self._busy = True
+            failed = set()
+            for isbn in batch:
+                try:
+                    self.fulfil(isbn)
+                except Exception as e:
+                    logger.error(f"❌ fulfil {isbn} error: {e}")
+                    failed.add(isbn)
+            with self._cond:
+                if not self._closed:
+                    self._dirty |= failed  # réessayé au cycle suivant (abandonné à l'arrêt)
+                self._busy = False
+                self._cond.notify_all()
+            time.sleep(self.interval)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Attend que tous les retours en file soient traités. False si timeout."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._dirty or self._busy:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Vide la file puis arrête le thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._dirty)
+        return {
+            "mode": self.mode,
+            "queued_isbns": pending,
+            "fulfilled": self.fulfilled,
+            "skipped": self.skipped,
+            "claim_conflicts": self.claim_conflicts,
+            "requeued": self.requeued,
+        }
@@ -0,0 +1,190 @@
+import csv
+import json
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Iterator, List, Optional, Dict, Any
+
+from cassandra.concurrent import execute_concurrent
+from loguru import logger
+
+from config.database import WRITE_PROFILE
+from models.batch import group_writes
+from models.book import Book, BookRepository
+
+
+@dataclass
+class ImportReport:
+    rows_read: int = 0
+    rows_written: int = 0
+    rows_failed: int = 0
+    rows_skipped: int = 0   # déjà importées lors d'un run précédent (checkpoint)
+    elapsed_s: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_written / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["rows_per_sec"] = round(self.rows_per_sec, 1)
+        return data
+
+
+def row_to_book(row: Dict[str, Any]) -> Book:
+    """Convertit une ligne CSV/JSONL en Book (available_copies = total_copies par défaut)."""
+    isbn = (row.get("isbn") or "").strip()
+    if not isbn:
+        raise ValueError("isbn manquant")
+
+    total = int(row.get("total_copies") or 1)
+    available = row.get("available_copies")
+    return Book(
+        isbn=isbn,
+        title=row.get("title") or "",
+        author=row.get("author") or "",
+        category=row.get("category") or "",
+        publisher=row.get("publisher") or "",
+        publication_year=int(row["publication_year"]) if row.get("publication_year") else None,
+        total_copies=total,
+        available_copies=int(available) if available not in (None, "") else total,
+        description=row.get("description") or "",
+    )
+
+
+def iter_source(path: str, fmt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Lit un fichier CSV (avec en-tête) ou JSONL en streaming, une ligne à la fois."""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        elif fmt == "jsonl":
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            raise ValueError(f"format inconnu: {fmt} (csv ou jsonl)")
+
+
+class CatalogueImporter:
+    """Import massif du catalogue : N livres en vol en parallèle, checkpoint après chaque chunk.
+
+    Le checkpoint ne dépasse jamais la première ligne en échec (rejetée ou non écrite) : une reprise
+    la retente, ainsi que les suivantes (réécriture idempotente). Un import complet sans échec
+    supprime le checkpoint : relancer le même fichier le réimporte entièrement.
+    """
+
+    def __init__(self, book_repo: BookRepository, concurrency: int = 64, chunk_size: int = 1000,
+                 checkpoint_path: Optional[str] = None):
+        self.book_repo = book_repo
+        self.session = book_repo.session
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+
+    # ========= CHECKPOINT =========
+
+    def _load_checkpoint(self, source: str) -> int:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("source") != os.path.abspath(source):
+            logger.warning(f"Checkpoint ignoré (autre fichier source): {data.get('source')}")
+            return 0
+        return int(data.get("rows_done", 0))
+
+    def _save_checkpoint(self, source: str, rows_done: int):
+        if not self.checkpoint_path:
+            return
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"source": os.path.abspath(source), "rows_done": rows_done}, f)
+        os.replace(tmp, self.checkpoint_path)  # écriture atomique
+
+    def _clear_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    # ========= IMPORT =========
+
+    def _write_chunk(self, books) -> List[int]:
+        """Écrit un chunk de livres (3 tables + index de recherche) avec au plus `concurrency` requêtes en vol.
+
+        Renvoie les indices (dans `books`) des livres en échec.
+        """
+        statements, owners = [], []
+        for i, book in enumerate(books):
+            for query in group_writes(self.book_repo.insert_statements(book), self.book_repo.batch_mode):
+                statements.append(query)
+                owners.append(i)
+            for query in self.book_repo.index.index_statements(book):   # termes de recherche
+                statements.append(query)
+                owners.append(i)
+
+        results = execute_concurrent(self.session, statements, concurrency=self.concurrency,
+                                     raise_on_first_error=False, execution_profile=WRITE_PROFILE)
+
+        failed = set()
+        for owner, (success, result) in zip(owners, results):
+            if not success and owner not in failed:
+                failed.add(owner)
+                logger.error(f"❌ import {books[owner].isbn}: {result}")
+        return sorted(failed)
+
+    def run(self, source: str, fmt: Optional[str] = None, resume: bool = True) -> ImportReport:
+        report = ImportReport()
+        skip = self._load_checkpoint(source) if resume else 0
+        if skip:
+            logger.info(f"↩️  Reprise après {skip} lignes déjà importées")
+
+        start = time.perf_counter()
+        chunk, lines = [], []   # livres du chunk et leur numéro de ligne
+        rows_done = 0
+        first_failed = None     # première ligne en échec du run : le checkpoint s'arrête juste avant
+
+        def fail(line: int):
+            nonlocal first_failed
+            report.rows_failed += 1
+            first_failed = line if first_failed is None else min(first_failed, line)
+
+        def flush():
+            failed = self._write_chunk(chunk)
+            report.rows_written += len(chunk) - len(failed)
+            for i in failed:
+                fail(lines[i])
+            chunk.clear()
+            lines.clear()
+            self._save_checkpoint(source, rows_done if first_failed is None else first_failed - 1)
+            elapsed = time.perf_counter() - start
+            logger.info(f"  ✅ {rows_done} lignes traitées ({report.rows_written / elapsed:.0f} lignes/s)")
+
+        for row in iter_source(source, fmt):
+            rows_done += 1
+            report.rows_read += 1
+            if rows_done <= skip:
+                report.rows_skipped += 1
+                continue
+
+            try:
+                chunk.append(row_to_book(row))
+                lines.append(rows_done)
+            except (ValueError, TypeError, KeyError) as e:
+                fail(rows_done)
+                logger.warning(f"Ligne {rows_done} ignorée: {e}")
+
+            if len(chunk) >= self.chunk_size:
+                flush()
+
+        if chunk or rows_done > skip:
+            flush()
+        if first_failed is None:
+            self._clear_checkpoint()   # import complet
+
+        report.elapsed_s = time.perf_counter() - start
+        logger.success(
+            f"✅ Import terminé: {report.rows_written} livres en {report.elapsed_s:.1f}s "
+            f"({report.rows_per_sec:.0f} lignes/s, {report.rows_failed} échecs)"
+        )
+        return report
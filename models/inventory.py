@@ -0,0 +1,208 @@
+import asyncio
+import atexit
+import random
+import threading
+import time
+from typing import Optional, Set
+
+from loguru import logger
+
+from config.database import WRITE_PROFILE
+from models.aio import aexecute
+from models.rows import was_applied
+from models.statements import Statement
+
+INVENTORY_MODES = ("lwt", "plain")
+
+
+class InventoryConflict(Exception):
+    """Le compare-and-set du stock a échoué `max_retries` fois (ISBN très contendu)."""
+
+
+def check_inventory_mode(mode: str) -> str:
+    if mode not in INVENTORY_MODES:
+        raise ValueError(f"inventory inconnu: {mode} ({', '.join(INVENTORY_MODES)})")
+    return mode
+
+
+class Inventory:
+    """Stock autoritaire = books_by_isbn.available_copies, modifié par compare-and-set (LWT).
+
+    `UPDATE ... IF available_copies = ?` : en cas de conflit, Cassandra renvoie la valeur
+    courante, on recalcule et on réessaie (backoff exponentiel + jitter) sans relire la ligne.
+    """
+
+    ps_cas_stock = Statement("""
+        UPDATE books_by_isbn
+        SET available_copies = ?
+        WHERE isbn = ?
+        IF available_copies = ?
+    """)
+
+    ps_get_stock = Statement("""
+        SELECT available_copies FROM books_by_isbn WHERE isbn = ?
+    """)
+
+    def __init__(self, session, max_retries: int = 8, backoff: float = 0.002, max_backoff: float = 0.1):
+        self.session = session
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def current(self, isbn: str) -> Optional[int]:
+        return self._current(self.session.execute(self.ps_get_stock, (isbn,)))
+
+    async def acurrent(self, isbn: str) -> Optional[int]:
+        return self._current(await aexecute(self.session, self.ps_get_stock, (isbn,)))
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    @staticmethod
+    def _target(current: Optional[int], delta: int, total: Optional[int]) -> Optional[int]:
+        if current is None:
+            return None
+        new = current + delta
+        if new < 0:
+            return None  # rupture de stock
+        return min(new, total) if total is not None else new
+
+    @staticmethod
+    def _current(result) -> Optional[int]:
+        row = result.one()
+        return getattr(row, "available_copies", None)
+
+    def adjust(self, isbn: str, delta: int, expected: Optional[int], total: Optional[int] = None) -> Optional[int]:
+        """Applique delta au stock (valeur lue `expected`). Renvoie le nouveau stock, None si rupture."""
+        current = expected
+        for attempt in range(self.max_retries + 1):
+            new = self._target(current, delta, total)
+            if new is None:
+                return None
+            result = self.session.execute(self.ps_cas_stock, (new, isbn, current), execution_profile=WRITE_PROFILE)
+            if was_applied(result):
+                return new
+            current = self._current(result)
+            time.sleep(self._delay(attempt))
+        raise InventoryConflict(f"stock {isbn}: {self.max_retries} conflits consécutifs")
+
+    async def aadjust(self, isbn: str, delta: int, expected: Optional[int],
+                      total: Optional[int] = None) -> Optional[int]:
+        current = expected
+        for attempt in range(self.max_retries + 1):
+            new = self._target(current, delta, total)
+            if new is None:
+                return None
+            result = await aexecute(self.session, self.ps_cas_stock, (new, isbn, current),
+                                    execution_profile=WRITE_PROFILE)
+            if was_applied(result):
+                return new
+            current = self._current(result)
+            await asyncio.sleep(self._delay(attempt))
+        raise InventoryConflict(f"stock {isbn}: {self.max_retries} conflits consécutifs")
+
+
+class ListingRefresher:
+    """Recopie en arrière-plan le stock autoritaire vers books_by_category / books_by_author.
+
+    Les ISBN modifiés sont marqués « sales » et coalescés : un livre emprunté 100 fois
+    pendant un cycle n'est recopié qu'une fois, avec la valeur lue dans books_by_isbn
+    (les listings convergent donc vers la valeur autoritaire, quel que soit l'ordre).
+    """
+
+    ps_get_book = Statement("""
+        SELECT isbn, title, author, category, available_copies
+        FROM books_by_isbn
+        WHERE isbn = ?
+    """)
+
+    ps_update_category = Statement("""
+        UPDATE books_by_category
+        SET available_copies = ?
+        WHERE category = ? AND title = ? AND isbn = ?
+    """)
+
+    ps_update_author = Statement("""
+        UPDATE books_by_author
+        SET available_copies = ?
+        WHERE author = ? AND title = ? AND isbn = ?
+    """)
+
+    def __init__(self, session, interval: float = 0.05):
+        self.session = session
+        self.interval = interval
+        self._dirty: Set[str] = set()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def mark(self, isbn: str):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="listing-refresher", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)  # le CLI sort juste après l'emprunt : on vide la file avant
+            self._dirty.add(isbn)
+            self._cond.notify()
+
+    def refresh(self, isbns):
+        """Recopie immédiate (synchrone) du stock autoritaire des ISBN donnés."""
+        futures = [self.session.execute_async(self.ps_get_book, (isbn,)) for isbn in isbns]
+        writes = []
+        for f in futures:
+            book = f.result().one()
+            if book:
+                writes.append(self.session.execute_async(
+                    self.ps_update_category, (book.available_copies, book.category, book.title, book.isbn),
+                    execution_profile=WRITE_PROFILE))
+                writes.append(self.session.execute_async(
+                    self.ps_update_author, (book.available_copies, book.author, book.title, book.isbn),
+                    execution_profile=WRITE_PROFILE))
+        for f in writes:
+            f.result()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if not self._dirty and self._closed:
+                    return
+                batch, self._dirty = self._dirty, set()
+                self._busy = True
+            try:
+                self.refresh(batch)
+            except Exception as e:
+                logger.error(f"❌ listing refresh error: {e}")
+                with self._cond:
+                    if not self._closed:
+                        self._dirty |= batch  # réessayé au cycle suivant (abandonné à l'arrêt)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+            time.sleep(self.interval)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Attend que tous les ISBN marqués soient recopiés. False si timeout."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._dirty or self._busy:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Vide la file puis arrête le thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._dirty)
@@ -0,0 +1,304 @@
+import random
+import re
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from cassandra import OperationTimedOut, Timeout
+from cassandra.query import BatchStatement
+
+from models.statements import statement_name
+
+# Bornes des histogrammes de latence (secondes)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Requêtes lentes / tracées gardées pour inspection (les plus récentes)
+SLOW_LOG_SIZE = 100
+DEFAULT_SLOW_THRESHOLD = 0.5
+
+# Taille approximative d'une valeur non textuelle (uuid 16 octets, timestamp/bigint 8...)
+_FIXED_SIZES = {"UUID": 16, "datetime": 8, "int": 8, "float": 8, "bool": 1, "Decimal": 16}
+
+_CQL_TARGET = re.compile(r"^\s*(?:(SELECT)\b.*?\bFROM|(INSERT)\s+INTO|(UPDATE)|(DELETE)\b.*?\bFROM)\s+(\w+)",
+                         re.I | re.S)
+
+
+def _cql_label(query: str) -> str:
+    """Libellé d'une requête ad hoc : "SELECT books_by_isbn"."""
+    m = _CQL_TARGET.match(query)
+    if m is None:
+        return " ".join(query.split())[:60]
+    verb = next(g for g in m.groups()[:4] if g)
+    return f"{verb.upper()} {m.group(5)}"
+
+
+def _row_bytes(rows) -> int:
+    """Taille estimée des valeurs renvoyées (le driver n'expose pas la taille des réponses)."""
+    total = 0
+    for row in rows:
+        for v in (row.values() if isinstance(row, dict) else row):
+            if v is None:
+                continue
+            if isinstance(v, (str, bytes)):
+                total += len(v)
+            else:
+                total += _FIXED_SIZES.get(type(v).__name__, 8)
+    return total
+
+
+def _percentile(buckets: List[int], count: int, q: float) -> Optional[float]:
+    """Borne haute du bucket contenant le quantile q (estimation, en secondes)."""
+    if not count:
+        return None
+    rank, seen = q * count, 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= rank:
+            return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+    return None
+
+
+class StatementStats:
+    __slots__ = ("count", "errors", "timeouts", "rows", "bytes", "pages", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rows = 0
+        self.bytes = 0
+        self.pages = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        ms = lambda s: round(s * 1000, 3) if s is not None else None
+        # Borne haute du bucket, plafonnée au maximum observé
+        pct = lambda q: min(_percentile(self.buckets, self.count, q), self.max) if self.count else None
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "pages": self.pages,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(pct(0.50)),
+            "p95_ms": ms(pct(0.95)),
+            "p99_ms": ms(pct(0.99)),
+            "max_ms": ms(self.max),
+            "total_ms": ms(self.total),
+        }
+
+
+class _Request:
+    """État d'une requête suivie (callbacks posés sur son ResponseFuture)."""
+    __slots__ = ("metrics", "label", "start", "first", "traced", "future", "__weakref__")
+
+    def __init__(self, metrics, label: str, traced: bool, future):
+        self.metrics = metrics
+        self.label = label
+        self.start = time.perf_counter()
+        self.first = True
+        self.traced = traced
+        # Référence faible : le future garde déjà ses callbacks (pas de cycle)
+        self.future = weakref.ref(future)
+
+    def attach(self, future):
+        future.add_callbacks(self.on_result, self.on_error)
+
+    def on_result(self, rows):
+        self.metrics._record(self, rows)
+
+    def on_error(self, exc):
+        self.metrics._record_error(self, exc)
+
+
+class QueryMetrics:
+    """Métriques par requête préparée, collectées pour toute la session via un request init listener.
+
+    Chaque requête envoyée par le driver (execute, execute_async, execute_concurrent, asyncio,
+    BATCH) est suivie par des callbacks sur son ResponseFuture : latence (histogramme, première
+    page), lignes, octets estimés et pages reçus, erreurs et timeouts. Le libellé est l'attribut
+    de déclaration (`BorrowRepository.ps_get_active`), sinon "VERBE table" pour une requête ad hoc.
+
+    Une fraction `trace_rate` des requêtes est tracée par le coordinateur (system_traces) ; leurs
+    trace_id, comme les requêtes plus lentes que `slow_threshold`, sont gardés dans `slow_log`.
+    Coût : une dizaine de µs de CPU client par requête (un objet, un lock, une recherche dichotomique),
+    négligeable devant l'aller-retour réseau : laissé actif en production.
+    """
+
+    def __init__(self, trace_rate: float = 0.0, slow_threshold: float = DEFAULT_SLOW_THRESHOLD,
+                 measure_bytes: bool = True):
+        if not 0.0 <= trace_rate <= 1.0:
+            raise ValueError("trace_rate doit être entre 0 et 1")
+        self.trace_rate = trace_rate
+        self.slow_threshold = slow_threshold
+        self.measure_bytes = measure_bytes
+        self.started_at = datetime.now(timezone.utc)
+        self.slow_log = deque(maxlen=SLOW_LOG_SIZE)
+        self._stats: Dict[str, StatementStats] = {}
+        self._labels: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def install(self, session) -> "QueryMetrics":
+        session.add_request_init_listener(self._on_request)
+        return self
+
+    # ========= Collecte (threads du driver) =========
+
+    def _label(self, query) -> str:
+        if isinstance(query, BatchStatement):
+            return "BATCH"
+        ps = getattr(query, "prepared_statement", None)
+        text = (ps or query).query_string
+        label = self._labels.get(text)
+        if label is None:
+            label = self._labels[text] = statement_name(text) or _cql_label(text)
+        return label
+
+    def _on_request(self, future):
+        traced = self.trace_rate > 0 and random.random() < self.trace_rate
+        if traced:
+            message = getattr(future, "message", None)
+            if message is not None:
+                message.tracing = True
+        request = _Request(self, self._label(future.query), traced, future)
+        # Retrouvée par reattach() quand un appelant efface les callbacks (pages suivantes asyncio)
+        future._query_metrics = request
+        request.attach(future)
+
+    def _stats_for(self, label: str) -> StatementStats:
+        stats = self._stats.get(label)
+        if stats is None:
+            stats = self._stats.setdefault(label, StatementStats())
+        return stats
+
+    def _record(self, request: _Request, rows):
+        n = len(rows) if rows is not None else 0
+        size = _row_bytes(rows) if self.measure_bytes and n else 0
+        first, request.first = request.first, False
+        elapsed = time.perf_counter() - request.start if first else None
+        with self._lock:
+            stats = self._stats_for(request.label)
+            stats.rows += n
+            stats.bytes += size
+            stats.pages += 1
+            if first:
+                # Latence de la première page seulement (les suivantes dépendent du rythme de l'appelant)
+                stats.count += 1
+                stats.total += elapsed
+                stats.max = max(stats.max, elapsed)
+                stats.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        if first and (request.traced or elapsed >= self.slow_threshold):
+            self._log(request, elapsed, None)
+
+    def _record_error(self, request: _Request, exc):
+        elapsed = time.perf_counter() - request.start
+        with self._lock:
+            stats = self._stats_for(request.label)
+            stats.errors += 1
+            if isinstance(exc, (Timeout, OperationTimedOut)):
+                stats.timeouts += 1
+        self._log(request, elapsed, exc)
+
+    def _log(self, request: _Request, elapsed: float, exc):
+        future = request.future()
+        trace_id = None
+        if request.traced and future is not None:
+            try:
+                ids = future.get_query_trace_ids()
+                trace_id = str(ids[-1]) if ids else None
+            except Exception:
+                pass
+        self.slow_log.append({
+            "at": datetime.now(timezone.utc).isoformat(),
+            "statement": request.label,
+            "ms": round(elapsed * 1000, 3),
+            "coordinator": str(getattr(future, "coordinator_host", None)) if future is not None else None,
+            "trace_id": trace_id,
+            "error": f"{type(exc).__name__}: {exc}" if exc is not None else None,
+        })
+
+    # ========= Lecture =========
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Statistiques par requête, triées par temps total décroissant."""
+        with self._lock:
+            data = {label: s.to_dict() for label, s in self._stats.items()}
+        return dict(sorted(data.items(), key=lambda kv: -(kv[1]["total_ms"] or 0)))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "since": self.started_at.isoformat(),
+            "trace_rate": self.trace_rate,
+            "slow_threshold_ms": round(self.slow_threshold * 1000, 3),
+            "statements": self.snapshot(),
+            "slow": list(self.slow_log),
+        }
+
+    def prometheus(self, prefix: str = "library_cql") -> str:
+        """Format texte Prometheus (exposition 0.0.4)."""
+        with self._lock:
+            stats = [(label, s.count, s.errors, s.timeouts, s.rows, s.bytes, s.pages, s.total, list(s.buckets))
+                     for label, s in sorted(self._stats.items())]
+        esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        h = f"{prefix}_request_duration_seconds"
+        lines = [f"# HELP {h} Latence des requêtes CQL (première page), par requête préparée.",
+                 f"# TYPE {h} histogram"]
+        counters = {
+            "errors": ("Requêtes en erreur.", 2),
+            "timeouts": ("Requêtes en timeout (client ou coordinateur).", 3),
+            "rows": ("Lignes reçues.", 4),
+            "bytes": ("Octets de valeurs reçus (estimation).", 5),
+            "pages": ("Pages reçues.", 6),
+        }
+        for label, count, *_, total, buckets in stats:
+            tag = f'statement="{esc(label)}"'
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'{h}_bucket{{{tag},le="{bound}"}} {cumulative}')
+            lines.append(f'{h}_bucket{{{tag},le="+Inf"}} {count}')
+            lines.append(f"{h}_sum{{{tag}}} {total:.6f}")
+            lines.append(f"{h}_count{{{tag}}} {count}")
+        for name, (help_text, i) in counters.items():
+            metric = f"{prefix}_{name}_total"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{statement="{esc(row[0])}"}} {row[i]}' for row in stats]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.slow_log.clear()
+            self.started_at = datetime.now(timezone.utc)
+
+
+def reattach(future):
+    """À appeler après clear_callbacks() sur un future suivi : les pages suivantes restent comptées."""
+    request = getattr(future, "_query_metrics", None)
+    if request is not None:
+        request.attach(future)
+
+
+_instrumented: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_instrumented_lock = threading.Lock()
+
+
+def instrument(session, **options) -> QueryMetrics:
+    """Installe (une seule fois par session) la collecte des métriques et la renvoie."""
+    with _instrumented_lock:
+        metrics = _instrumented.get(session)
+        if metrics is None:
+            metrics = _instrumented[session] = QueryMetrics(**options).install(session)
+        return metrics
+
+
+def query_metrics(session) -> Optional[QueryMetrics]:
+    """Les métriques de la session, None si elle n'est pas instrumentée."""
+    return _instrumented.get(session)
@@ -0,0 +1,170 @@
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from cassandra.concurrent import execute_concurrent
+from loguru import logger
+
+from config.database import WRITE_PROFILE
+from models.borrow import BorrowRepository
+from models.buckets import BucketIndex, USER_HISTORY, BOOK_HISTORY, BOOK_RESERVATIONS, month_bucket
+from models.reservation import ReservationRepository
+from models.statements import statements
+
+
+@dataclass
+class MigrationReport:
+    table: str
+    rows_read: int = 0
+    rows_written: int = 0
+    rows_failed: int = 0
+    buckets: int = 0        # entrées history_buckets créées
+    buckets_failed: int = 0  # entrées history_buckets en échec : leurs lignes restent invisibles (relancer)
+    elapsed_s: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_written / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["rows_per_sec"] = round(self.rows_per_sec, 1)
+        return data
+
+
+@dataclass
+class _Source:
+    select: str                 # scan de l'ancienne table
+    target: str                 # table bucketée (nom utilisé dans history_buckets)
+    insert: Any                 # prepared statement de la table bucketée
+    key: Callable[[Any], Any]   # clé de partition d'origine
+    date: Callable[[Any], Any]  # date qui détermine le bucket
+    params: Callable[[Any, int], tuple]
+
+
+class BucketMigrator:
+    """Réécrit les anciens historiques (partition unique par clé) dans les tables *_month.
+
+    Le scan est paginé (page_size lignes en mémoire) et chaque page est écrite avec au plus
+    `concurrency` requêtes en vol. Les écritures sont des upserts : relancer la migration est sans risque.
+    """
+
+    def __init__(self, session, concurrency: int = 64, page_size: int = 1000):
+        self.session = session
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.buckets = BucketIndex(session)
+
+        borrows = BorrowRepository(session)
+        reservations = ReservationRepository(session)
+        self.sources: Dict[str, _Source] = {
+            "borrows_by_user": _Source(
+                select="SELECT user_id, borrow_date, isbn, book_title, user_name, status, return_date "
+                       "FROM borrows_by_user",
+                target=USER_HISTORY,
+                insert=borrows.ps_insert_user_month,
+                key=lambda r: r.user_id,
+                date=lambda r: r.borrow_date,
+                params=lambda r, m: (r.user_id, m, r.borrow_date, r.isbn, r.book_title,
+                                     r.user_name, r.status, r.return_date),
+            ),
+            "borrows_by_book": _Source(
+                select="SELECT isbn, borrow_date, user_id, user_name, book_title, status, return_date "
+                       "FROM borrows_by_book",
+                target=BOOK_HISTORY,
+                insert=borrows.ps_insert_book_month,
+                key=lambda r: r.isbn,
+                date=lambda r: r.borrow_date,
+                params=lambda r, m: (r.isbn, m, r.borrow_date, r.user_id, r.user_name,
+                                     r.book_title, r.status, r.return_date),
+            ),
+            "reservations_by_book": _Source(
+                select="SELECT isbn, reservation_date, user_id, user_name, status FROM reservations_by_book",
+                target=BOOK_RESERVATIONS,
+                insert=reservations.ps_insert_reservation_month,
+                key=lambda r: r.isbn,
+                date=lambda r: r.reservation_date,
+                params=lambda r, m: (r.isbn, m, r.reservation_date, r.user_id, r.user_name, r.status),
+            ),
+        }
+
+    def _iter_pages(self, query: str) -> Iterable[List[Any]]:
+        stmt = statements(self.session).get(query).bind(())
+        stmt.fetch_size = self.page_size
+        result = self.session.execute(stmt)
+        while True:
+            yield list(result.current_rows)
+            if not result.has_more_pages:
+                return
+            result.fetch_next_page()
+
+    def _execute(self, source: _Source, writes: List[Tuple[Any, tuple]]) -> List[bool]:
+        """Écritures concurrentes ; succès de chacune, dans l'ordre de `writes`."""
+        results = execute_concurrent(self.session, writes, concurrency=self.concurrency,
+                                     raise_on_first_error=False, execution_profile=WRITE_PROFILE)
+        outcomes = []
+        for (_, params), (success, result) in zip(writes, results):
+            if not success:
+                logger.error(f"❌ migration {source.target} {params[:2]}: {result}")
+            outcomes.append(success)
+        return outcomes
+
+    @staticmethod
+    def _indexed(keys: List[Tuple[Any, str]], outcomes: List[bool], seen: set, unindexed: set) -> int:
+        """Un (clé, mois) n'entre dans `seen` qu'une fois son entrée d'index écrite. Renvoie le nombre créé."""
+        for key, ok in zip(keys, outcomes):
+            if ok:
+                seen.add(key)
+                unindexed.discard(key)
+            else:
+                unindexed.add(key)   # réessayé par la prochaine page du même bucket, sinon en fin de run
+        return sum(outcomes)
+
+    def _write_page(self, source: _Source, rows, seen: set, unindexed: set) -> Tuple[int, int, int]:
+        writes: List[Tuple[Any, tuple]] = []
+        entries: Dict[Tuple[Any, str], None] = {}   # (clé, mois) à indexer, une fois par page
+        for r in rows:
+            month = month_bucket(source.date(r))
+            writes.append((source.insert, source.params(r, month)))
+            if (source.key(r), month) not in seen:
+                entries[(source.key(r), month)] = None
+        keys = list(entries)
+        writes += [self.buckets.entry(source.target, key, month) for key, month in keys]
+
+        outcomes = self._execute(source, writes)
+        failed = outcomes[:len(rows)].count(False)
+        return len(rows), failed, self._indexed(keys, outcomes[len(rows):], seen, unindexed)
+
+    def migrate(self, table: str) -> MigrationReport:
+        if table not in self.sources:
+            raise ValueError(f"table inconnue: {table} ({', '.join(self.sources)})")
+        source = self.sources[table]
+        report = MigrationReport(table=table)
+        seen: set = set()        # (clé, mois) déjà indexés pendant ce run
+        unindexed: set = set()   # (clé, mois) dont l'entrée d'index a échoué
+        start = time.perf_counter()
+
+        for rows in self._iter_pages(source.select):
+            read, failed, new_buckets = self._write_page(source, rows, seen, unindexed)
+            report.rows_read += read
+            report.rows_failed += failed
+            report.rows_written = report.rows_read - report.rows_failed
+            report.buckets += new_buckets
+            logger.info(f"  ✅ {table}: {report.rows_read} lignes migrées")
+
+        if unindexed:
+            # Entrées d'index en échec qu'aucune page suivante n'a réécrites : dernier essai
+            keys = list(unindexed)
+            outcomes = self._execute(source, [self.buckets.entry(source.target, k, m) for k, m in keys])
+            report.buckets += self._indexed(keys, outcomes, seen, unindexed)
+        report.buckets_failed = len(unindexed)
+
+        report.elapsed_s = time.perf_counter() - start
+        logger.success(
+            f"✅ {table} -> {source.target}: {report.rows_written} lignes, {report.buckets} buckets "
+            f"en {report.elapsed_s:.1f}s ({report.rows_failed} échecs, {report.buckets_failed} buckets non indexés)"
+        )
+        return report
+
+    def run(self, tables: Optional[Iterable[str]] = None) -> List[MigrationReport]:
+        return [self.migrate(t) for t in (tables or self.sources)]
@@ -0,0 +1,73 @@
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Tuple
+from uuid import uuid4
+
+from cassandra.query import PreparedStatement
+
+from models.statements import Statement
+
+# "inline" : tables secondaires écrites dans la requête (comportement historique)
+# "outbox" : ligne autoritaire + événement de changement ; tables secondaires par le projecteur
+PROJECTION_MODES = ("inline", "outbox")
+
+OUTBOX_SHARDS = 16
+
+# Types d'événements
+BOOK = "book"       # livre ajouté : books_by_category / books_by_author / index de recherche
+STOCK = "stock"     # available_copies changé : listings catégorie / auteur
+BORROW = "borrow"   # emprunt / retour : historique par livre (payload = la ligne)
+
+
+def check_projection_mode(mode: str) -> str:
+    if mode not in PROJECTION_MODES:
+        raise ValueError(f"projection inconnue: {mode} ({', '.join(PROJECTION_MODES)})")
+    return mode
+
+
+def outbox_bucket(dt: datetime) -> int:
+    """Minute de l'événement : borne la taille d'une partition de l'outbox."""
+    return int(dt.timestamp()) // 60
+
+
+def utc(dt: datetime) -> datetime:
+    """Le driver renvoie des timestamps naïfs (UTC) : on les rend comparables à datetime.now(timezone.utc)."""
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+class Outbox:
+    """Journal des changements à projeter : projection_outbox ((shard, minute), event_time, event_id).
+
+    `event()` renvoie l'INSERT à placer dans le même batch logged que la ligne autoritaire :
+    soit les deux sont appliqués, soit aucun. Un même `key` va toujours dans le même shard,
+    donc ses événements sont projetés dans l'ordre.
+    """
+
+    ps_append = Statement("""
+        INSERT INTO projection_outbox (shard, bucket, event_time, event_id, kind, key, payload)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """)
+
+    def __init__(self, session, shards: int = OUTBOX_SHARDS):
+        self.session = session
+        self.shards = shards
+
+    def shard(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % self.shards
+
+    def event(self, kind: str, key: str, payload: Optional[Any] = None) -> Tuple[PreparedStatement, tuple]:
+        now = datetime.now(timezone.utc)
+        data = json.dumps(payload, default=str) if payload is not None else None
+        return self.ps_append, (self.shard(key), outbox_bucket(now), now, uuid4(), kind, key, data)
+
+    def stamp(self, queries: List[Tuple[Any, Any]]) -> List[Tuple[Any, Any]]:
+        """Ré-horodate les événements d'un plan juste avant son envoi.
+
+        Un plan est construit avant le CAS du stock (essais, backoff) : sans cela, event_time
+        précéderait le commit de bien plus qu'une écriture et le projecteur, dont la position
+        suit `maintenant - overlap`, pourrait être déjà passé au-delà.
+        """
+        now = datetime.now(timezone.utc)
+        return [(ps, (params[0], outbox_bucket(now), now, *params[3:])) if ps is self.ps_append else (ps, params)
+                for ps, params in queries]
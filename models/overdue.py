@@ -0,0 +1,191 @@
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from cassandra import ConsistencyLevel
+from cassandra.query import PreparedStatement
+
+from models.aio import aexecute, afetch_next_page
+from models.buckets import BucketIndex
+from models.scan import TokenRangeScan
+from models.statements import Statement
+
+# Emprunts en cours rangés par jour d'échéance : (due_day, shard) -> partitions bornées dans le temps
+DUE_LOANS = "loans_by_due_day"
+# Tous les emprunts d'une journée tombent le même jour d'échéance : répartis sur plusieurs partitions
+DUE_SHARDS = 8
+# Lignes lues par page lors d'un scan des retards
+OVERDUE_FETCH_SIZE = 500
+
+
+def due_day(dt: datetime) -> int:
+    """Bucket journalier d'une échéance : 2024-03-17 -> 20240317."""
+    return dt.year * 10000 + dt.month * 100 + dt.day
+
+
+def due_shard(user_id: UUID, shards: int = DUE_SHARDS) -> int:
+    return zlib.crc32(user_id.bytes) % shards
+
+
+class DueIndex:
+    """Index des emprunts en cours par jour d'échéance (loans_by_due_day).
+
+    Une ligne est écrite avec l'emprunt et supprimée au retour. Les jours existants sont
+    référencés dans history_buckets (une clé par shard) : le scan des retards ne lit que les
+    jours <= aujourd'hui, jamais la table entière. Le scan n'écrit rien : les jours passés vidés
+    par les retours sont retirés de l'index par `prune` (maintenance, en QUORUM).
+    """
+
+    ps_add_due = Statement("""
+        INSERT INTO loans_by_due_day
+        (due_day, shard, due_date, user_id, isbn, borrow_date, book_title, user_name)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """)
+
+    ps_delete_due = Statement("""
+        DELETE FROM loans_by_due_day
+        WHERE due_day = ? AND shard = ? AND due_date = ? AND user_id = ? AND isbn = ?
+    """)
+
+    ps_list_due = Statement("""
+        SELECT due_date, user_id, isbn, borrow_date, book_title, user_name
+        FROM loans_by_due_day
+        WHERE due_day = ? AND shard = ? AND due_date < ?
+    """)
+
+    ps_probe_due = Statement("""
+        SELECT due_date FROM loans_by_due_day
+        WHERE due_day = ? AND shard = ?
+        LIMIT 1
+    """)
+
+    def __init__(self, session, shards: int = DUE_SHARDS, buckets: Optional[BucketIndex] = None):
+        self.session = session
+        self.shards = shards
+        self.buckets = buckets or BucketIndex(session)
+
+    # ========= Écritures (jointes à celles de l'emprunt / du retour) =========
+
+    def entry(self, user_id: UUID, isbn: str, due_date: datetime, borrow_date: datetime,
+              book_title: str, user_name: str) -> List[Tuple[PreparedStatement, tuple]]:
+        day, shard = due_day(due_date), due_shard(user_id, self.shards)
+        return [
+            (self.ps_add_due, (day, shard, due_date, user_id, isbn, borrow_date, book_title, user_name)),
+            self.buckets.entry(DUE_LOANS, shard, day),
+        ]
+
+    def removal(self, user_id: UUID, isbn: str, due_date: Optional[datetime]):
+        # Anciens emprunts sans due_date : jamais indexés, rien à supprimer
+        if due_date is None:
+            return []
+        return [(self.ps_delete_due, (due_day(due_date), due_shard(user_id, self.shards), due_date, user_id, isbn))]
+
+    # ========= Scan des retards =========
+
+    @staticmethod
+    def _item(row) -> Dict[str, Any]:
+        return {
+            "user_id": row.user_id,
+            "isbn": row.isbn,
+            "book_title": row.book_title,
+            "user_name": row.user_name,
+            "borrow_date": row.borrow_date,
+            "due_date": row.due_date,
+        }
+
+    def _plan(self, shard_days: List[List[int]], today: int) -> List[Tuple[int, int]]:
+        """(jour, shard) à lire, du plus ancien jour à aujourd'hui."""
+        return sorted((day, shard) for shard, days in enumerate(shard_days) for day in days if day <= today)
+
+    def _bind(self, day: int, shard: int, as_of: datetime, fetch_size: int):
+        bound = self.ps_list_due.bind((day, shard, as_of))
+        bound.fetch_size = fetch_size
+        return bound
+
+    def overdue(self, as_of: Optional[datetime] = None,
+                fetch_size: int = OVERDUE_FETCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """Emprunts en retard à `as_of` (défaut : maintenant), du plus ancien jour d'échéance au plus récent.
+
+        Générateur : les pages sont lues au fil de l'itération (au plus `fetch_size` lignes en mémoire).
+        """
+        as_of = as_of or datetime.now(timezone.utc)
+        today = due_day(as_of)
+        shard_days = [self.buckets.months(DUE_LOANS, s, newest_first=False) for s in range(self.shards)]
+        for day, shard in self._plan(shard_days, today):
+            for row in self.session.execute(self._bind(day, shard, as_of, fetch_size)):
+                yield self._item(row)
+
+    async def aoverdue(self, as_of: Optional[datetime] = None,
+                       fetch_size: int = OVERDUE_FETCH_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        """Variante asyncio de overdue (générateur asynchrone)."""
+        as_of = as_of or datetime.now(timezone.utc)
+        today = due_day(as_of)
+        shard_days = [await self.buckets.amonths(DUE_LOANS, s, newest_first=False) for s in range(self.shards)]
+        for day, shard in self._plan(shard_days, today):
+            result = await aexecute(self.session, self._bind(day, shard, as_of, fetch_size))
+            while True:
+                for row in result.current_rows:
+                    yield self._item(row)
+                if not result.has_more_pages:
+                    break
+                result = await afetch_next_page(result)
+
+    # ========= Maintenance =========
+
+    def _empty(self, day: int, shard: int) -> bool:
+        bound = self.ps_probe_due.bind((day, shard))
+        bound.consistency_level = ConsistencyLevel.QUORUM
+        return self.session.execute(bound).one() is None
+
+    def prune(self, as_of: Optional[datetime] = None) -> int:
+        """Retire de l'index les jours passés dont le shard ne contient plus aucun emprunt.
+
+        Aucun emprunt ne peut plus y être écrit (l'échéance est toujours future). Chaque jour est
+        relu en QUORUM juste avant d'être retiré (QUORUM aussi) : un réplica en retard ne fait pas
+        disparaître des retards de l'index. Renvoie le nombre de jours retirés.
+        """
+        today = due_day(as_of or datetime.now(timezone.utc))
+        removed = 0
+        for shard in range(self.shards):
+            for day in self.buckets.months(DUE_LOANS, shard, newest_first=False):
+                if day >= today:
+                    break
+                if self._empty(day, shard):
+                    self.buckets.remove(DUE_LOANS, shard, day, ConsistencyLevel.QUORUM)
+                    removed += 1
+        return removed
+
+
+# ========= Audit : scan complet de la table des emprunts actifs =========
+
+ACTIVE_COLUMNS = ("user_id", "isbn", "borrow_date", "due_date", "book_title", "user_name")
+
+
+class OverdueFilter:
+    """Ligne de active_borrow_by_user_book -> retard (dict) ou None. Exécuté dans les process du scan."""
+
+    def __init__(self, as_of: datetime, loan_days: int):
+        self.as_of = as_of
+        self.loan_days = loan_days
+
+    def __call__(self, row) -> Optional[Dict[str, Any]]:
+        # Anciennes lignes sans due_date : échéance recalculée, et absentes de loans_by_due_day
+        due = row.due_date or row.borrow_date + timedelta(days=self.loan_days)
+        if due >= self.as_of.replace(tzinfo=due.tzinfo):
+            return None
+        return {
+            "user_id": row.user_id,
+            "isbn": row.isbn,
+            "book_title": row.book_title,
+            "user_name": row.user_name,
+            "borrow_date": row.borrow_date,
+            "due_date": due,
+            "indexed": row.due_date is not None,
+        }
+
+
+def audit_scan(processes: int = 4, splits: Optional[int] = None, **kwargs) -> TokenRangeScan:
+    """Scan par intervalles de tokens des emprunts actifs (ne dépend pas de l'index des échéances)."""
+    return TokenRangeScan("active_borrow_by_user_book", ["user_id"], ACTIVE_COLUMNS,
+                          processes=processes, splits=splits, **kwargs)
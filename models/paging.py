@@ -0,0 +1,132 @@
+import asyncio
+import base64
+import binascii
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+from uuid import UUID
+
+from models.aio import aexecute, afetch_next_page
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+# Lignes par page des itérateurs (flux complets : NDJSON, exports) ; au plus 2 pages en mémoire
+STREAM_FETCH_SIZE = 500
+
+
+@dataclass(slots=True)
+class Page:
+    """Une page de résultats + curseur opaque vers la suivante (None = dernière page)."""
+    items: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+    def to_dict(self):
+        return {"items": self.items, "next_cursor": self.next_cursor}
+
+
+def encode_cursor(paging_state: Optional[bytes]) -> Optional[str]:
+    """paging_state du driver -> curseur URL-safe (sans padding)."""
+    if not paging_state:
+        return None
+    return base64.urlsafe_b64encode(paging_state).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[bytes]:
+    """Curseur -> paging_state. ValueError si le curseur n'est pas décodable."""
+    if not cursor:
+        return None
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("cursor invalide")
+
+
+def check_page_size(page_size: int) -> int:
+    if page_size < 1 or page_size > MAX_PAGE_SIZE:
+        raise ValueError(f"page_size doit être entre 1 et {MAX_PAGE_SIZE}")
+    return page_size
+
+
+def _bind(ps, params, page_size: int):
+    bound = ps.bind(params)
+    bound.fetch_size = check_page_size(page_size)  # le serveur ne renvoie qu'une page de cette taille
+    return bound
+
+
+def fetch_page(session, ps, params, page_size: int, cursor: Optional[str],
+               decode: Callable[[Any], Any]) -> Page:
+    """Lit UNE page (fetch_size) à partir du curseur, sans matérialiser la partition entière."""
+    paging_state = decode_cursor(cursor)
+    result = session.execute(_bind(ps, params, page_size), paging_state=paging_state)
+    return Page(
+        items=[decode(r) for r in result.current_rows],
+        next_cursor=encode_cursor(result.paging_state) if result.has_more_pages else None,
+    )
+
+
+async def afetch_page(session, ps, params, page_size: int, cursor: Optional[str],
+                      decode: Callable[[Any], Any]) -> Page:
+    """Variante asyncio de fetch_page."""
+    paging_state = decode_cursor(cursor)
+    result = await aexecute(session, _bind(ps, params, page_size), paging_state=paging_state)
+    return Page(
+        items=[decode(r) for r in result.current_rows],
+        next_cursor=encode_cursor(result.paging_state) if result.has_more_pages else None,
+    )
+
+
+# ========= Itérateurs : toute la partition, page par page =========
+
+def _stream_bind(ps, params, fetch_size: int):
+    bound = ps.bind(params)
+    bound.fetch_size = fetch_size
+    return bound
+
+
+def iter_rows(session, ps, params, decode: Callable[[Any], Any],
+              fetch_size: int = STREAM_FETCH_SIZE) -> Iterator[Any]:
+    """Toutes les lignes d'une requête, décodées au fil de l'eau.
+
+    La page suivante est demandée avant de rendre la page courante (recouvrement réseau / traitement) :
+    au plus deux pages en mémoire, quelle que soit la taille de la partition. Les erreurs remontent
+    à l'appelant (le flux s'interrompt).
+    """
+    result = session.execute(_stream_bind(ps, params, fetch_size))
+    while True:
+        rows, more = result.current_rows, result.has_more_pages
+        if more:
+            result.response_future.start_fetching_next_page()
+        for row in rows:
+            yield decode(row)
+        if not more:
+            return
+        result = result.response_future.result()
+
+
+async def aiter_rows(session, ps, params, decode: Callable[[Any], Any],
+                     fetch_size: int = STREAM_FETCH_SIZE) -> AsyncIterator[Any]:
+    """Variante asyncio de iter_rows (générateur asynchrone)."""
+    result = await aexecute(session, _stream_bind(ps, params, fetch_size))
+    pending = None
+    try:
+        while True:
+            rows, more = result.current_rows, result.has_more_pages
+            pending = asyncio.ensure_future(afetch_next_page(result)) if more else None
+            for row in rows:
+                yield decode(row)
+            if pending is None:
+                return
+            result = await pending
+    finally:
+        # Flux interrompu (client déconnecté) : la page demandée d'avance est abandonnée
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+
+def json_default(value):
+    """Sérialisation JSON des types renvoyés par le driver (mêmes formats que FastAPI)."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} non sérialisable en JSON")
@@ -0,0 +1,277 @@
+import atexit
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+
+from config.database import WRITE_PROFILE, ConnectionProfile
+from models.outbox import BOOK, BORROW, OUTBOX_SHARDS, STOCK, outbox_bucket, utc
+from models.statements import Statement
+
+# Un handler reçoit {key: [payloads dans l'ordre de l'outbox]} pour un type d'événement
+Handler = Callable[[Dict[str, List[Any]]], None]
+
+# Ordre d'application au sein d'un cycle (un livre est projeté avant son stock / ses emprunts)
+KINDS = (BOOK, STOCK, BORROW)
+# Ajoutée au délai d'écriture dans la fenêtre de recouvrement (décalage d'horloge entre clients)
+OVERLAP_MARGIN = 2.0
+
+
+def write_window(session, margin: float = OVERLAP_MARGIN) -> float:
+    """Plus long délai entre l'horodatage d'un événement (à l'envoi, cf. Outbox.stamp) et son commit.
+
+    Une écriture dure au plus request_timeout côté client, et le driver peut renvoyer une fois
+    un batch logged (écriture du batchlog en timeout) : 2 x request_timeout + marge.
+    """
+    cluster = getattr(session, "cluster", None)
+    profiles = getattr(getattr(cluster, "profile_manager", None), "profiles", {})
+    profile = profiles.get(WRITE_PROFILE) or profiles.get(EXEC_PROFILE_DEFAULT)
+    timeout = profile.request_timeout if profile is not None else ConnectionProfile.request_timeout
+    return 2 * timeout + margin
+
+
+class Projector:
+    """Applique les événements de projection_outbox aux tables dénormalisées.
+
+    Chaque shard de l'outbox a une position (checkpoint persistant dans projection_checkpoints).
+    Un cycle relit les événements depuis la position, les coalesce par type et par clé, les
+    applique, puis avance la position à `maintenant - overlap` : un événement écrit avec un
+    léger retard (horloge, latence) est relu au cycle suivant, et les identifiants déjà vus
+    dans cette fenêtre ne sont pas réappliqués. `overlap` doit couvrir la plus longue écriture
+    (défaut : write_window, d'après le request_timeout du profil d'écriture) ; la position ne
+    dépasse jamais `maintenant - overlap`, même quand un cycle est limité à `batch_size`
+    événements. En cas d'erreur la position ne bouge pas et le shard est réessayé avec un
+    backoff exponentiel (livraison « au moins une fois » : les handlers sont des upserts
+    idempotents).
+
+    Un seul projecteur doit tourner par cluster (l'ordre par clé n'est garanti qu'ainsi).
+    """
+
+    ps_read = Statement("""
+        SELECT event_time, event_id, kind, key, payload
+        FROM projection_outbox
+        WHERE shard = ? AND bucket = ? AND event_time >= ?
+    """)
+
+    ps_get_checkpoints = Statement("""
+        SELECT shard, position FROM projection_checkpoints
+    """)
+
+    ps_save_checkpoint = Statement("""
+        INSERT INTO projection_checkpoints (shard, position, updated_at)
+        VALUES (?, ?, ?)
+    """)
+
+    def __init__(self, session, handlers: Dict[str, Handler], shards: int = OUTBOX_SHARDS,
+                 workers: int = 4, poll_interval: float = 0.2, overlap: Optional[float] = None,
+                 batch_size: int = 1000, max_backoff: float = 30.0, bootstrap: float = 3600.0,
+                 checkpoint_interval: float = 5.0):
+        self.session = session
+        self.handlers = handlers
+        self.shards = shards
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.overlap = timedelta(seconds=overlap if overlap is not None else write_window(session))
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        # Sans checkpoint (premier démarrage), on reprend les événements de la dernière heure
+        self.bootstrap = timedelta(seconds=bootstrap)
+        self.checkpoint_interval = checkpoint_interval
+
+        self._positions: Dict[int, datetime] = {}
+        self._seen: Dict[int, Set] = defaultdict(set)
+        self._saved_at: Dict[int, float] = defaultdict(float)
+        self._failures: Dict[int, int] = defaultdict(int)
+        self._retry_at: Dict[int, float] = defaultdict(float)
+        self._lock = threading.Lock()
+        self._cycle = threading.Lock()   # un seul cycle à la fois (thread de fond / drain)
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+        self.polls = 0
+        self.applied = 0
+        self.retries = 0
+        self.max_delay = 0.0
+        self._delay_total = 0.0
+
+    # ========= Positions =========
+
+    def load_positions(self):
+        """Positions des shards : checkpoints sauvegardés, sinon `maintenant - bootstrap`."""
+        if self._positions:
+            return
+        saved = {r.shard: utc(r.position) for r in self.session.execute(self.ps_get_checkpoints)
+                 if r.position is not None}
+        start = datetime.now(timezone.utc) - self.bootstrap
+        with self._lock:
+            self._positions = {s: saved.get(s, start) for s in range(self.shards)}
+
+    def _save(self, shard: int, position: datetime, force: bool):
+        now = time.monotonic()
+        if force or now - self._saved_at[shard] >= self.checkpoint_interval:
+            self.session.execute(self.ps_save_checkpoint, (shard, position, datetime.now(timezone.utc)),
+                                 execution_profile=WRITE_PROFILE)
+            self._saved_at[shard] = now
+
+    # ========= Cycle =========
+
+    def _read(self, shard: int, start: datetime, now: datetime, seen: Set) -> Tuple[List, List, bool]:
+        """Événements du shard depuis `start`, minute par minute, paginés par le driver.
+
+        Renvoie (lus, nouveaux, limite atteinte) : au plus `batch_size` nouveaux par cycle ; les
+        événements déjà vus de la fenêtre sont relus mais ne comptent pas dans la limite.
+        """
+        events, fresh = [], []
+        for bucket in range(outbox_bucket(start), outbox_bucket(now) + 1):
+            bound = self.ps_read.bind((shard, bucket, start))
+            bound.fetch_size = self.batch_size
+            for e in self.session.execute(bound):
+                events.append(e)
+                if e.event_id not in seen:
+                    fresh.append(e)
+                    if len(fresh) >= self.batch_size:
+                        return events, fresh, True
+        return events, fresh, False
+
+    def _apply(self, events):
+        groups: Dict[str, Dict[str, List[Any]]] = defaultdict(dict)
+        for e in events:
+            groups[e.kind].setdefault(e.key, []).append(json.loads(e.payload) if e.payload else None)
+        for kind in sorted(groups, key=lambda k: KINDS.index(k) if k in KINDS else len(KINDS)):
+            handler = self.handlers.get(kind)
+            if handler is None:
+                logger.warning(f"Événement de projection ignoré (type inconnu): {kind}")
+                continue
+            handler(groups[kind])
+
+    def poll_shard(self, shard: int) -> int:
+        """Un cycle sur un shard. Renvoie le nombre d'événements appliqués ; lève en cas d'échec."""
+        self.load_positions()
+        start = self._positions[shard]
+        now = datetime.now(timezone.utc)
+        events, fresh, full = self._read(shard, start, now, self._seen[shard])
+        self._apply(fresh)
+
+        # Jamais au-delà de `maintenant - overlap` (une écriture encore en vol peut y être commitée) ;
+        # limite atteinte : pas au-delà du dernier événement lu non plus (les suivants n'ont pas été vus)
+        horizon = now - self.overlap
+        position = max(start, min(utc(fresh[-1].event_time), horizon) if full else horizon)
+        applied_at = datetime.now(timezone.utc)
+        with self._lock:
+            self._positions[shard] = position
+            self._seen[shard] = {e.event_id for e in events if utc(e.event_time) >= position}
+            self.polls += 1
+            self.applied += len(fresh)
+            for e in fresh:
+                delay = (applied_at - utc(e.event_time)).total_seconds()
+                self._delay_total += delay
+                self.max_delay = max(self.max_delay, delay)
+        self._save(shard, position, force=bool(fresh))
+        return len(fresh)
+
+    def _poll_safe(self, shard: int) -> int:
+        if time.monotonic() < self._retry_at[shard]:
+            return 0
+        try:
+            applied = self.poll_shard(shard)
+        except Exception as e:
+            with self._lock:
+                self._failures[shard] += 1
+                self.retries += 1
+                failures = self._failures[shard]
+            delay = min(self.max_backoff, self.poll_interval * (2 ** failures))
+            self._retry_at[shard] = time.monotonic() + delay
+            logger.error(f"❌ projection shard {shard} (essai {failures}, nouvel essai dans {delay:.1f}s): {e}")
+            return 0
+        self._failures[shard] = 0
+        return applied
+
+    def run_once(self) -> int:
+        """Un cycle sur tous les shards (synchrone). Renvoie le nombre d'événements appliqués."""
+        with self._cycle:
+            self.load_positions()
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="projector")
+            return sum(self._pool.map(self._poll_safe, range(self.shards)))
+
+    def drain(self, timeout: float = 30.0) -> bool:
+        """Applique tout ce qui est en attente (bench / tests). False si timeout."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.run_once() == 0 and not any(self._failures.values()):
+                return True
+            time.sleep(self.poll_interval)
+        return False
+
+    # ========= Thread =========
+
+    def start(self):
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="projector", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def _run(self):
+        while not self._closed:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"❌ projector error: {e}")
+            self._wakeup.wait(self.poll_interval)
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Arrête le thread (les événements restants seront repris depuis le checkpoint)."""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        with self._lock:
+            positions = dict(self._positions)
+        for shard, position in positions.items():
+            try:
+                self._save(shard, position, force=True)
+            except Exception as e:
+                logger.error(f"❌ projector checkpoint error: {e}")
+
+    def stats(self):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            oldest = min(self._positions.values()) if self._positions else None
+            return {
+                "shards": self.shards,
+                "running": self._thread is not None and not self._closed,
+                "polls": self.polls,
+                "applied": self.applied,
+                "retries": self.retries,
+                "failing_shards": sum(1 for n in self._failures.values() if n),
+                # retard du shard le plus en retard, hors fenêtre de recouvrement
+                "lag_s": round(max(0.0, (now - self.overlap - oldest).total_seconds()), 3) if oldest else None,
+                "avg_apply_delay_s": round(self._delay_total / self.applied, 3) if self.applied else None,
+                "max_apply_delay_s": round(self.max_delay, 3),
+            }
+
+
+def library_handlers(book_repo, borrow_repo) -> Dict[str, Handler]:
+    """Handlers des tables de la bibliothèque (repositories en mode projection="outbox" ou non)."""
+
+    def project_borrows(batch: Dict[str, List[Any]]):
+        for isbn, events in batch.items():
+            borrow_repo.project_borrows(isbn, events)
+
+    return {
+        BOOK: book_repo.project_books,
+        STOCK: borrow_repo.listings.refresh,
+        BORROW: project_borrows,
+    }
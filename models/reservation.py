@@ -1,11 +1,20 @@
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from itertools import islice
+from typing import Optional, Tuple
 from uuid import UUID
-from cassandra.query import PreparedStatement
 from loguru import logger
 
+from config.database import WRITE_PROFILE
+from models.aio import aexecute_all, afetch_all
+from models.buckets import BucketIndex, BOOK_RESERVATIONS, month_bucket, fetch_buckets, afetch_buckets
+from models.statements import Statement
 
-@dataclass
+# Début de la file quand aucune réservation n'a encore été servie
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass(slots=True)
 class Reservation:
     isbn: str
     reservation_date: datetime
@@ -15,45 +24,161 @@ class Reservation:
 
 
 class ReservationRepository:
-    def __init__(self, session):
+    # Insert reservation (queue by ISBN)
+    ps_insert_reservation = Statement("""
+        INSERT INTO reservations_by_book
+        (isbn, reservation_date, user_id, user_name, status)
+        VALUES (?, ?, ?, ?, ?)
+    """)
+
+    # List reservations for a book (FIFO thanks to clustering order)
+    ps_list_reservations = Statement("""
+        SELECT reservation_date, user_id, user_name, status
+        FROM reservations_by_book
+        WHERE isbn = ?
+    """)
+
+    ps_insert_reservation_month = Statement("""
+        INSERT INTO reservations_by_book_month
+        (isbn, month, reservation_date, user_id, user_name, status)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """)
+
+    ps_list_reservations_month = Statement("""
+        SELECT reservation_date, user_id, user_name, status
+        FROM reservations_by_book_month
+        WHERE isbn = ? AND month = ?
+    """)
+
+    # Lecture de la file à partir d'une position (moteur de satisfaction, cf. models/fulfilment.py)
+    ps_next_reservations = Statement("""
+        SELECT reservation_date, user_id, user_name, status
+        FROM reservations_by_book
+        WHERE isbn = ? AND reservation_date >= ?
+        LIMIT ?
+    """)
+
+    ps_next_reservations_month = Statement("""
+        SELECT reservation_date, user_id, user_name, status
+        FROM reservations_by_book_month
+        WHERE isbn = ? AND month = ? AND reservation_date >= ?
+        LIMIT ?
+    """)
+
+    def __init__(self, session, bucketed: bool = False):
         self.session = session
+        # bucketed=True : file d'attente dans reservations_by_book_month (partitions (isbn, mois)),
+        # à n'activer qu'après migrate-buckets ; False : ancienne table reservations_by_book
+        self.bucketed = bucketed
+        self.buckets = BucketIndex(session)
+
+    def _reservation_writes(self, isbn: str, user_id: UUID, user_name: str,
+                            reservation_date: Optional[datetime] = None):
+        now = reservation_date or datetime.now(timezone.utc)
+        if not self.bucketed:
+            return [(self.ps_insert_reservation, (isbn, now, user_id, user_name, "PENDING"))]
+        month = month_bucket(now)
+        return [
+            (self.ps_insert_reservation_month, (isbn, month, now, user_id, user_name, "PENDING")),
+            self.buckets.entry(BOOK_RESERVATIONS, isbn, month),
+        ]
+
+    def status_write(self, reservation: Reservation, status: str):
+        """Upsert du statut d'une réservation (même clé : le bucket suit reservation_date)."""
+        r = reservation
+        if not self.bucketed:
+            return self.ps_insert_reservation, (r.isbn, r.reservation_date, r.user_id, r.user_name, status)
+        return self.ps_insert_reservation_month, (
+            r.isbn, month_bucket(r.reservation_date), r.reservation_date, r.user_id, r.user_name, status)
+
+    def requeue_writes(self, reservation: Reservation):
+        """Remise en fin de file : l'ancienne ligne passe REQUEUED, une nouvelle PENDING est datée de maintenant."""
+        r = reservation
+        return [self.status_write(r, "REQUEUED")] + self._reservation_writes(r.isbn, r.user_id, r.user_name)
 
-        # Insert reservation (queue by ISBN)
-        self.ps_insert_reservation: PreparedStatement = session.prepare("""
-            INSERT INTO reservations_by_book
-            (isbn, reservation_date, user_id, user_name, status)
-            VALUES (?, ?, ?, ?, ?)
-        """)
+    def next_pending(self, isbn: str, after: Optional[Tuple[datetime, UUID]] = None,
+                     batch: int = 16) -> Optional[Reservation]:
+        """Plus ancienne réservation PENDING strictement après `after` = (reservation_date, user_id).
 
-        # List reservations for a book (FIFO thanks to clustering order)
-        self.ps_list_reservations: PreparedStatement = session.prepare("""
-            SELECT reservation_date, user_id, user_name, status
-            FROM reservations_by_book
-            WHERE isbn = ?
-        """)
+        La lecture commence à la position donnée (bucket et clustering) : les réservations déjà
+        servies ne sont pas relues, quelle que soit la longueur de la file.
+        """
+        start = after[0] if after else EPOCH
+        if self.bucketed:
+            first = month_bucket(start)
+            months = self.buckets.months(BOOK_RESERVATIONS, isbn, newest_first=False)
+            queries = [(self.ps_next_reservations_month, (isbn, m)) for m in months if m >= first]
+        else:
+            queries = [(self.ps_next_reservations, (isbn,))]
+
+        for ps, key in queries:
+            while True:
+                rows = list(self.session.execute(ps, key + (start, batch)))
+                for r in rows:
+                    if after and (r.reservation_date, r.user_id) <= after:
+                        continue
+                    if r.status == "PENDING":
+                        return Reservation(isbn, r.reservation_date, r.user_id, r.user_name, r.status)
+                if len(rows) < batch:
+                    break
+                start, after = rows[-1].reservation_date, (rows[-1].reservation_date, rows[-1].user_id)
+        return None
+
+    @staticmethod
+    def _reservation_item(r):
+        return {
+            "reservation_date": r.reservation_date,
+            "user_id": r.user_id,
+            "user_name": r.user_name,
+            "status": r.status
+        }
 
     def add_reservation(self, isbn: str, user_id: UUID, user_name: str) -> bool:
         try:
-            now = datetime.now(timezone.utc)
-            self.session.execute(self.ps_insert_reservation, (isbn, now, user_id, user_name, "PENDING"))
+            futures = [self.session.execute_async(ps, params, execution_profile=WRITE_PROFILE)
+                       for ps, params in self._reservation_writes(isbn, user_id, user_name)]
+            for f in futures:
+                f.result()
             logger.success(f"✅ Réservation ajoutée: {isbn} pour {user_id}")
             return True
         except Exception as e:
             logger.error(f"❌ add_reservation error: {e}")
             return False
 
-    def list_reservations(self, isbn: str):
+    def list_reservations(self, isbn: str, limit: Optional[int] = None):
+        """File d'attente FIFO : buckets du plus ancien au plus récent, arrêt à `limit`."""
         try:
+            if self.bucketed:
+                months = self.buckets.months(BOOK_RESERVATIONS, isbn, newest_first=False)
+                return fetch_buckets(self.session, self.ps_list_reservations_month, isbn, months,
+                                     self._reservation_item, limit)
             rows = self.session.execute(self.ps_list_reservations, (isbn,))
-            return [
-                {
-                    "reservation_date": r.reservation_date,
-                    "user_id": r.user_id,
-                    "user_name": r.user_name,
-                    "status": r.status
-                }
-                for r in rows
-            ]
+            return [self._reservation_item(r) for r in islice(rows, limit)]
+        except Exception as e:
+            logger.error(f"❌ list_reservations error: {e}")
+            return []
+
+
+class AsyncReservationRepository(ReservationRepository):
+    """Variante asyncio de ReservationRepository."""
+
+    async def add_reservation(self, isbn: str, user_id: UUID, user_name: str) -> bool:
+        try:
+            await aexecute_all(self.session, self._reservation_writes(isbn, user_id, user_name))
+            logger.success(f"✅ Réservation ajoutée: {isbn} pour {user_id}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ add_reservation error: {e}")
+            return False
+
+    async def list_reservations(self, isbn: str, limit: Optional[int] = None):
+        try:
+            if self.bucketed:
+                months = await self.buckets.amonths(BOOK_RESERVATIONS, isbn, newest_first=False)
+                return await afetch_buckets(self.session, self.ps_list_reservations_month, isbn, months,
+                                            self._reservation_item, limit)
+            rows = await afetch_all(self.session, self.ps_list_reservations, (isbn,))
+            return [self._reservation_item(r) for r in islice(rows, limit)]
         except Exception as e:
             logger.error(f"❌ list_reservations error: {e}")
             return []
@@ -0,0 +1,85 @@
+from collections import namedtuple
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Type
+
+from cassandra.query import _clean_column_name, _sanitize_identifiers, named_tuple_factory
+from pydantic import BaseModel, TypeAdapter
+
+# row_factory des sessions : "cached" = named tuples dont la classe est réutilisée d'une réponse à l'autre,
+# "named_tuple" = factory du driver (une classe namedtuple recréée pour chaque page reçue)
+ROW_FACTORIES = ("cached", "named_tuple")
+# Jeux de colonnes distincts gardés en cache (requêtes préparées : quelques dizaines)
+MAX_ROW_CLASSES = 1024
+
+_row_classes: Dict[Tuple[str, ...], type] = {}
+
+
+def _row_class(colnames: Tuple[str, ...]) -> type:
+    names = [_clean_column_name(c) for c in colnames]
+    try:
+        return namedtuple("Row", names)
+    except ValueError:
+        # Mêmes règles que le driver pour les noms invalides (mots réservés, doublons...)
+        return namedtuple("Row", _sanitize_identifiers(names))
+
+
+def cached_named_tuple_factory(colnames, rows) -> List[Any]:
+    """Équivalent de named_tuple_factory sans créer de classe à chaque page.
+
+    Le driver appelle namedtuple() (compilation d'une classe, ~100 µs) pour chaque réponse, même d'une
+    seule ligne : c'est le premier poste CPU des lectures par clé. Ici la classe Row est créée une fois
+    par jeu de colonnes ; les lignes restent des named tuples (accès par attribut, _asdict, index).
+    """
+    key = tuple(colnames)
+    cls = _row_classes.get(key)
+    if cls is None:
+        cls = _row_class(key)
+        if len(_row_classes) < MAX_ROW_CLASSES:
+            _row_classes[key] = cls
+    return list(map(cls._make, rows))
+
+
+def was_applied(result) -> bool:
+    """Résultat d'une écriture conditionnelle (LWT), quelle que soit la row_factory.
+
+    ResultSet.was_applied du driver refuse toute factory autre que les siennes : on lit la colonne
+    `[applied]`, toujours la première de la ligne renvoyée par Cassandra.
+    """
+    row = result.one()
+    if row is None:
+        return True
+    return bool(row["[applied]"] if isinstance(row, dict) else row[0])
+
+
+def check_row_factory(name: str) -> str:
+    if name not in ROW_FACTORIES:
+        raise ValueError(f"row_factory inconnue: {name} ({', '.join(ROW_FACTORIES)})")
+    return name
+
+
+def row_factory(name: str) -> Callable:
+    return cached_named_tuple_factory if check_row_factory(name) == "cached" else named_tuple_factory
+
+
+class RowModel:
+    """Lignes du driver -> modèle pydantic, lues par attribut (from_attributes) : aucun dict intermédiaire.
+
+    La validation et la sérialisation JSON sont faites par pydantic-core ; `json` / `json_many`
+    vont directement des lignes aux octets de la réponse.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self._one = TypeAdapter(model)
+        self._many = TypeAdapter(List[model])
+
+    def __call__(self, row) -> BaseModel:
+        return self._one.validate_python(row, from_attributes=True)
+
+    def many(self, rows: Sequence[Any]) -> List[BaseModel]:
+        return self._many.validate_python(rows, from_attributes=True)
+
+    def json(self, row) -> bytes:
+        return self._one.dump_json(self(row))
+
+    def json_many(self, rows: Sequence[Any]) -> bytes:
+        return self._many.dump_json(self.many(rows))
@@ -0,0 +1,191 @@
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, asdict, field
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from models.statements import statements
+
+# Anneau du partitionneur Murmur3 : les tokens vont de -2^63 (exclu) à 2^63 - 1
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
+# Intervalles par process : assez pour équilibrer la charge entre les process
+SPLITS_PER_PROCESS = 16
+SCAN_FETCH_SIZE = 1000
+RANGE_RETRIES = 2
+
+
+def token_ranges(splits: int) -> List[Tuple[int, int]]:
+    """Découpe l'anneau en `splits` intervalles ]start, end] contigus qui le couvrent entièrement."""
+    if splits < 1:
+        raise ValueError("splits doit être >= 1")
+    step = (MAX_TOKEN - MIN_TOKEN) // splits
+    bounds = [MIN_TOKEN + i * step for i in range(splits)] + [MAX_TOKEN]
+    return list(zip(bounds, bounds[1:]))
+
+
+def range_query(table: str, partition_key: Sequence[str], columns: Sequence[str]) -> str:
+    pk = ", ".join(partition_key)
+    return f"SELECT {', '.join(columns)} FROM {table} WHERE token({pk}) > ? AND token({pk}) <= ?"
+
+
+def scan_range(session, query: str, start: int, end: int, fetch_size: int = SCAN_FETCH_SIZE) -> Iterator[Any]:
+    """Lignes d'un intervalle de tokens (générateur : pages lues au fil de l'itération)."""
+    bound = statements(session).get(query).bind((start, end))
+    bound.fetch_size = fetch_size
+    yield from session.execute(bound)
+
+
+# ========= Process de scan =========
+
+# Session propre à chaque process du pool (une session driver ne se partage pas entre process)
+_worker_session = None
+
+
+def connect_keyspace(keyspace: str):
+    """Connexion par défaut d'un process de scan (réglages CASSANDRA_* de l'environnement)."""
+    from config.database import CassandraConnection
+    return CassandraConnection(keyspace=keyspace).connect()
+
+
+def _init_worker(connect: Callable[[], Any]):
+    global _worker_session
+    _worker_session = connect()
+
+
+def _scan_task(query: str, start: int, end: int, fetch_size: int, handler: Callable[[Any], Any],
+               session=None) -> Tuple[int, List[Any]]:
+    """Parcourt un intervalle ; renvoie (lignes lues, résultats non None du handler)."""
+    rows, items = 0, []
+    for row in scan_range(session or _worker_session, query, start, end, fetch_size):
+        rows += 1
+        item = handler(row)
+        if item is not None:
+            items.append(item)
+    return rows, items
+
+
+@dataclass
+class ScanReport:
+    table: str
+    ranges: int = 0
+    ranges_done: int = 0
+    rows_read: int = 0
+    items: int = 0
+    failed_ranges: List[Tuple[int, int]] = field(default_factory=list)
+    elapsed_s: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_read / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["failed_ranges"] = len(self.failed_ranges)
+        data["rows_per_sec"] = round(self.rows_per_sec, 1)
+        return data
+
+
+class TokenRangeScan:
+    """Scan complet d'une table découpé par intervalles de tokens, répartis sur un pool de process.
+
+    Chaque process ouvre sa propre connexion (`connect`, appelée une fois par process) et
+    parcourt ses intervalles page par page ; `handler(ligne)` y est exécuté et seuls ses
+    résultats non None remontent. `run` est un générateur : les résultats d'un intervalle sont
+    rendus dès qu'il est terminé, et au plus 2 intervalles par process sont en cours à la fois
+    (mémoire bornée quelle que soit la taille de la table). `handler` et `connect` doivent être
+    picklables (fonctions de module, functools.partial, instances de classes de module).
+
+    processes=0 : scan séquentiel dans le process courant avec `session` (petites tables).
+    Pour les audits ponctuels : un scan complet charge tout le cluster.
+    """
+
+    def __init__(self, table: str, partition_key: Sequence[str], columns: Sequence[str],
+                 processes: int = 4, splits: Optional[int] = None, fetch_size: int = SCAN_FETCH_SIZE,
+                 connect: Optional[Callable[[], Any]] = None, keyspace: str = "library_system",
+                 session=None, retries: int = RANGE_RETRIES):
+        self.table = table
+        self.query = range_query(table, partition_key, columns)
+        self.processes = processes
+        self.splits = splits or max(1, processes) * SPLITS_PER_PROCESS
+        self.fetch_size = fetch_size
+        self.connect = connect or partial(connect_keyspace, keyspace)
+        self.session = session
+        self.retries = retries
+        self.report = ScanReport(table=table)
+
+    def _done(self, rows: int, items: List[Any]) -> List[Any]:
+        self.report.ranges_done += 1
+        self.report.rows_read += rows
+        self.report.items += len(items)
+        return items
+
+    def _failed(self, rng, attempt: int, error) -> bool:
+        """True si l'intervalle doit être relancé."""
+        if attempt < self.retries:
+            logger.warning(f"Intervalle {rng} en échec (essai {attempt + 1}), relancé: {error}")
+            return True
+        logger.error(f"❌ scan {self.table} intervalle {rng} abandonné: {error}")
+        self.report.failed_ranges.append(rng)
+        return False
+
+    def run(self, handler: Callable[[Any], Any]) -> Iterator[Any]:
+        ranges = token_ranges(self.splits)
+        self.report = ScanReport(table=self.table, ranges=len(ranges))
+        started = time.perf_counter()
+        try:
+            if self.processes <= 0:
+                yield from self._run_local(ranges, handler)
+            else:
+                yield from self._run_pool(ranges, handler)
+        finally:
+            self.report.elapsed_s = time.perf_counter() - started
+
+    def _run_local(self, ranges, handler) -> Iterator[Any]:
+        session = self.session or self.connect()
+        for rng in ranges:
+            for attempt in range(self.retries + 1):
+                try:
+                    rows, items = _scan_task(self.query, *rng, self.fetch_size, handler, session=session)
+                except Exception as e:
+                    if self._failed(rng, attempt, e):
+                        continue
+                    break
+                yield from self._done(rows, items)
+                break
+
+    def _run_pool(self, ranges, handler) -> Iterator[Any]:
+        pending = deque((rng, 0) for rng in ranges)
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                 initargs=(self.connect,)) as pool:
+            running = {}
+
+            def submit():
+                while pending and len(running) < self.processes * 2:
+                    rng, attempt = pending.popleft()
+                    future = pool.submit(_scan_task, self.query, *rng, self.fetch_size, handler)
+                    running[future] = (rng, attempt)
+
+            submit()
+            try:
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rng, attempt = running.pop(future)
+                        try:
+                            rows, items = future.result()
+                        except Exception as e:
+                            if self._failed(rng, attempt, e):
+                                pending.append((rng, attempt + 1))
+                            continue
+                        submit()
+                        yield from self._done(rows, items)
+                    submit()
+            finally:
+                # Consommateur arrêté avant la fin : les intervalles non démarrés sont abandonnés
+                for future in running:
+                    future.cancel()
@@ -0,0 +1,182 @@
+import asyncio
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cassandra.concurrent import execute_concurrent
+from cassandra.query import PreparedStatement
+from loguru import logger
+
+from config.database import WRITE_PROFILE
+from models.aio import aexecute_all, afetch_all
+from models.paging import decode_cursor, encode_cursor, check_page_size
+from models.statements import Statement, statements
+
+# Un mot est aussi indexé par ses préfixes (à partir de MIN_PREFIX caractères) :
+# « harr » retrouve « Harry ». Les mots plus courts ne sont trouvés qu'en entier.
+MIN_PREFIX = 3
+MAX_PREFIX = 20
+# Nombre max. d'ISBN lus par terme (borne le coût d'un préfixe très fréquent)
+MAX_POSTINGS = 10_000
+
+# Poids par champ (mot entier / préfixe) ; le score d'un livre = somme sur les termes de la requête
+WEIGHTS = {
+    "title": (10, 6),
+    "author": (6, 4),
+    "description": (1, 0),   # description : mots entiers seulement (trop de préfixes sinon)
+}
+
+STOPWORDS = {
+    "a", "au", "aux", "d", "de", "des", "du", "en", "et", "l", "la", "le", "les", "un", "une",
+    "the", "of", "and", "an", "to", "in",
+}
+
+_SPLIT = re.compile(r"[^0-9a-z]+")
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "ß": "ss"})
+
+
+def fold(text: str) -> str:
+    """Minuscules sans accents : « Étranger » -> « etranger »."""
+    decomposed = unicodedata.normalize("NFKD", (text or "").lower().translate(_LIGATURES))
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """Mots repliés (accents, casse), sans mots vides ; l'ordre d'apparition est conservé."""
+    return [t for t in _SPLIT.split(fold(text)) if t and t not in STOPWORDS]
+
+
+def _prefixes(token: str) -> Iterable[str]:
+    return (token[:n] for n in range(MIN_PREFIX, min(len(token), MAX_PREFIX + 1)))
+
+
+def book_terms(book) -> Dict[str, int]:
+    """Termes d'un livre -> poids (le meilleur poids par champ, cumulé entre champs)."""
+    terms: Dict[str, int] = defaultdict(int)
+    for field, (exact, prefix) in WEIGHTS.items():
+        best: Dict[str, int] = {}
+        for token in tokenize(getattr(book, field, "") or ""):
+            best[token] = max(best.get(token, 0), exact)
+            if prefix:
+                for p in _prefixes(token):
+                    best[p] = max(best.get(p, 0), prefix)
+        for term, weight in best.items():
+            terms[term] += weight
+    return dict(terms)
+
+
+def _encode_offset(offset: int) -> Optional[str]:
+    return encode_cursor(offset.to_bytes(4, "big")) if offset else None
+
+
+def _decode_offset(cursor: Optional[str]) -> int:
+    raw = decode_cursor(cursor)
+    if raw is None:
+        return 0
+    if len(raw) != 4:
+        raise ValueError("cursor invalide")
+    return int.from_bytes(raw, "big")
+
+
+class SearchIndex:
+    """Index inversé du catalogue dans Cassandra : books_by_term ((term), isbn) -> score.
+
+    Titre, auteur et description sont découpés en mots repliés (accents/casse) ; titre et
+    auteur sont aussi indexés par préfixes. Une recherche lit une partition par mot de la
+    requête, garde les ISBN présents dans toutes (ET) et les classe par score cumulé.
+    """
+
+    ps_insert_term = Statement("""
+        INSERT INTO books_by_term (term, isbn, score)
+        VALUES (?, ?, ?)
+    """)
+
+    ps_get_term = Statement("""
+        SELECT isbn, score FROM books_by_term
+        WHERE term = ?
+        LIMIT ?
+    """)
+
+    def __init__(self, session, concurrency: int = 64):
+        self.session = session
+        self.concurrency = concurrency
+
+    # ========= Indexation =========
+
+    def index_statements(self, book) -> List[Tuple[PreparedStatement, tuple]]:
+        return [(self.ps_insert_term, (term, book.isbn, weight)) for term, weight in book_terms(book).items()]
+
+    def index_book(self, book) -> bool:
+        results = execute_concurrent(self.session, self.index_statements(book), concurrency=self.concurrency,
+                                     raise_on_first_error=False, execution_profile=WRITE_PROFILE)
+        failed = [r for ok, r in results if not ok]
+        if failed:
+            logger.error(f"❌ index_book {book.isbn}: {failed[0]}")
+        return not failed
+
+    async def aindex_book(self, book) -> bool:
+        try:
+            await aexecute_all(self.session, self.index_statements(book))
+            return True
+        except Exception as e:
+            logger.error(f"❌ index_book {book.isbn}: {e}")
+            return False
+
+    def rebuild(self, book_repo, page_size: int = 1000) -> int:
+        """(Ré)indexe tout books_by_isbn (scan paginé, une page en mémoire à la fois)."""
+        stmt = statements(self.session).get("SELECT * FROM books_by_isbn").bind(())
+        stmt.fetch_size = page_size
+        result = self.session.execute(stmt)
+        indexed = 0
+        while True:
+            writes = []
+            for row in result.current_rows:
+                writes.extend(self.index_statements(book_repo._row_to_book(row)))
+                indexed += 1
+            for ok, r in execute_concurrent(self.session, writes, concurrency=self.concurrency,
+                                            raise_on_first_error=False, execution_profile=WRITE_PROFILE):
+                if not ok:
+                    logger.error(f"❌ reindex: {r}")
+            logger.info(f"  ✅ {indexed} livres indexés")
+            if not result.has_more_pages:
+                break
+            result.fetch_next_page()
+        return indexed
+
+    # ========= Recherche =========
+
+    @staticmethod
+    def _rank(postings: List[List[Tuple[str, int]]]) -> List[Tuple[str, int]]:
+        """ISBN présents pour chaque terme, classés par score décroissant (puis ISBN)."""
+        if not postings:
+            return []
+        scores: Dict[str, int] = dict(postings[0])
+        for rows in postings[1:]:
+            current = dict(rows)
+            scores = {isbn: s + current[isbn] for isbn, s in scores.items() if isbn in current}
+        return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+
+    @staticmethod
+    def _query_terms(q: str) -> List[str]:
+        return list(dict.fromkeys(tokenize(q)))  # que des mots vides -> aucun résultat
+
+    @staticmethod
+    def _slice(ranked, page_size: int, cursor: Optional[str]):
+        offset = _decode_offset(cursor)
+        end = offset + check_page_size(page_size)
+        return ranked[offset:end], (_encode_offset(end) if end < len(ranked) else None)
+
+    def search(self, q: str, page_size: int, cursor: Optional[str] = None):
+        """Renvoie ([(isbn, score)] de la page, curseur suivant). ValueError si curseur invalide."""
+        terms = self._query_terms(q)
+        futures = [self.session.execute_async(self.ps_get_term, (t, MAX_POSTINGS)) for t in terms]
+        postings = [[(r.isbn, r.score) for r in f.result()] for f in futures]
+        return self._slice(self._rank(postings), page_size, cursor)
+
+    async def asearch(self, q: str, page_size: int, cursor: Optional[str] = None):
+        terms = self._query_terms(q)
+        results = await asyncio.gather(*(afetch_all(self.session, self.ps_get_term, (t, MAX_POSTINGS))
+                                         for t in terms))
+        postings = [[(r.isbn, r.score) for r in rows] for rows in results]
+        return self._slice(self._rank(postings), page_size, cursor)
@@ -0,0 +1,131 @@
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, Tuple
+
+from cassandra.query import PreparedStatement
+
+# Nombre max. de PREPARE envoyés en parallèle
+PREPARE_CONCURRENCY = 16
+
+
+class StatementRegistry:
+    """Requêtes préparées d'une session : préparées au premier usage, par lots parallèles, puis réutilisées.
+
+    Partagé par tous les repositories de la session : une même requête n'est préparée qu'une fois
+    (et un objet PreparedStatement unique est renvoyé pour elle).
+    """
+
+    def __init__(self, session, concurrency: int = PREPARE_CONCURRENCY):
+        self.session = session
+        self.concurrency = concurrency
+        self._prepared: Dict[str, PreparedStatement] = {}
+        self._lock = threading.Lock()
+
+    def prepare_all(self, queries: Iterable[str]) -> int:
+        """Prépare en parallèle les requêtes pas encore connues. Renvoie le nombre de PREPARE envoyés."""
+        with self._lock:
+            missing = [q for q in dict.fromkeys(queries) if q not in self._prepared]
+            if len(missing) == 1:
+                self._prepared[missing[0]] = self._prepare(missing[0])
+            elif missing:
+                # session.prepare est bloquant (un aller-retour chacun) : on les recouvre
+                with ThreadPoolExecutor(max_workers=min(self.concurrency, len(missing))) as pool:
+                    self._prepared.update(zip(missing, pool.map(self._prepare, missing)))
+            return len(missing)
+
+    def _prepare(self, query: str) -> PreparedStatement:
+        ps = self.session.prepare(query)
+        # Une lecture peut être rejouée sans risque : seule une requête idempotente déclenche
+        # l'exécution spéculative du profil lecture (les écritures restent non idempotentes)
+        ps.is_idempotent = is_read(query)
+        return ps
+
+    def get(self, query: str, group: Iterable[str] = ()) -> PreparedStatement:
+        """La requête préparée ; au premier appel, `group` (ses voisines) est préparé dans le même lot."""
+        ps = self._prepared.get(query)
+        if ps is None:
+            self.prepare_all([query, *group])
+            ps = self._prepared[query]
+        return ps
+
+    def __len__(self) -> int:
+        return len(self._prepared)
+
+
+def is_read(query: str) -> bool:
+    return query.lstrip().upper().startswith("SELECT")
+
+
+# Requête -> "Classe.attribut" de sa déclaration (libellé des métriques, cf. models/metrics.py)
+_names: Dict[str, str] = {}
+
+_registries: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
+
+
+def statements(session) -> StatementRegistry:
+    """Le registre (unique) associé à une session."""
+    with _registries_lock:
+        registry = _registries.get(session)
+        if registry is None:
+            registry = _registries[session] = StatementRegistry(session)
+        return registry
+
+
+class Statement:
+    """Requête préparée déclarée sur la classe d'un repository : `ps_get = Statement("SELECT ...")`.
+
+    Rien n'est envoyé au cluster à la construction du repository : à la première lecture de
+    `self.ps_get`, toutes les requêtes déclarées par la classe sont préparées en un lot
+    parallèle, puis mémorisées sur l'instance (accès suivants = simple attribut).
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        _names.setdefault(self.query, f"{owner.__name__}.{name}")
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        ps = statements(obj.session).get(self.query, class_queries(type(obj)))
+        obj.__dict__[self.name] = ps
+        return ps
+
+
+def statement_name(query: str):
+    """Libellé "Classe.attribut" d'une requête déclarée avec Statement (None pour une requête ad hoc)."""
+    return _names.get(query)
+
+
+@lru_cache(maxsize=None)
+def class_queries(cls) -> Tuple[str, ...]:
+    """Toutes les requêtes `Statement` déclarées par une classe (héritage compris)."""
+    return tuple(dict.fromkeys(
+        attr.query for klass in reversed(cls.__mro__) for attr in vars(klass).values()
+        if isinstance(attr, Statement)
+    ))
+
+
+def _components(obj, session, seen):
+    """L'objet et, récursivement, ses attributs liés à la même session (repository enveloppé, Inventory...)."""
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    yield obj
+    for value in getattr(obj, "__dict__", {}).values():
+        if getattr(value, "session", None) is session:
+            yield from _components(value, session, seen)
+
+
+def prepare_statements(session, *repositories) -> int:
+    """Préchauffe : prépare en un seul lot parallèle toutes les requêtes des repositories donnés."""
+    seen: set = set()
+    queries = [q for repo in repositories for obj in _components(repo, session, seen)
+               for q in class_queries(type(obj))]
+    return statements(session).prepare_all(queries)
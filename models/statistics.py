@@ -1,36 +1,184 @@
-from cassandra.query import PreparedStatement
+import heapq
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
 from loguru import logger
 
+from config.database import WRITE_PROFILE
+from models.aio import aexecute
+from models.batch import build_batch
+from models.rows import was_applied
+from models.statements import Statement
+
+# Classement matérialisé : une seule partition (board) triée par rang
+LEADERBOARD_BOARD = "GLOBAL"
+LEADERBOARD_SIZE = 100
+
+
+class LeaderboardConflict(Exception):
+    """La réécriture conditionnelle de top_books a perdu `max_retries` fois (écrivains trop nombreux)."""
+
+
 class StatisticsRepository:
-    def __init__(self, session):
+    ps_get_total_borrows = Statement("""
+        SELECT total_borrows FROM global_stats WHERE stat_name = 'GLOBAL'
+    """)
+
+    # Scan complet : utilisé UNIQUEMENT par la compaction du classement (hors chemin de requête)
+    ps_get_all_popularity = Statement("""
+        SELECT isbn, borrow_count FROM book_popularity
+    """)
+
+    ps_get_popularity = Statement("""
+        SELECT isbn, borrow_count FROM book_popularity WHERE isbn = ?
+    """)
+
+    # ========= Classement top-K (table top_books) =========
+
+    ps_get_leaderboard = Statement("""
+        SELECT rank, isbn, borrow_count
+        FROM top_books
+        WHERE board = ?
+        LIMIT ?
+    """)
+
+    # Maintenance : top courant + version (colonne statique, présente sur chaque ligne)
+    ps_get_leaderboard_versioned = Statement("""
+        SELECT rank, isbn, borrow_count, version
+        FROM top_books
+        WHERE board = ?
+        LIMIT ?
+    """)
+
+    # Première écriture du batch : le reste n'est appliqué que si personne n'a réécrit entre-temps
+    ps_bump_leaderboard = Statement("""
+        UPDATE top_books SET version = ?
+        WHERE board = ?
+        IF version = ?
+    """)
+
+    ps_insert_leaderboard = Statement("""
+        INSERT INTO top_books (board, rank, isbn, borrow_count)
+        VALUES (?, ?, ?, ?)
+    """)
+
+    ps_trim_leaderboard = Statement("""
+        DELETE FROM top_books
+        WHERE board = ? AND rank >= ?
+    """)
+
+    def __init__(self, session, max_retries: int = 8, backoff: float = 0.005, max_backoff: float = 0.2):
         self.session = session
+        # Réécritures concurrentes de top_books (workers de l'API, CLI, cron) : CAS sur la version
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
 
-        self.ps_get_total_borrows: PreparedStatement = session.prepare("""
-            SELECT total_borrows FROM global_stats WHERE stat_name = 'GLOBAL'
-        """)
+    @staticmethod
+    def _total(row) -> int:
+        return int(row.total_borrows) if row and row.total_borrows is not None else 0
 
-        # On récupère tout et on triera côté Python (simple pour le projet)
-        self.ps_get_all_popularity: PreparedStatement = session.prepare("""
-            SELECT isbn, borrow_count FROM book_popularity
-        """)
+    @staticmethod
+    def _top(rows):
+        return [{"isbn": r.isbn, "borrow_count": int(r.borrow_count or 0)} for r in rows]
 
     def get_total_borrows(self) -> int:
         try:
-            row = self.session.execute(self.ps_get_total_borrows).one()
-            return int(row.total_borrows) if row and row.total_borrows is not None else 0
+            return self._total(self.session.execute(self.ps_get_total_borrows).one())
         except Exception as e:
             logger.error(f"❌ get_total_borrows error: {e}")
             return 0
 
     def get_top_books(self, limit: int = 10):
+        """Top-N lu dans la partition du classement (une seule lecture, déjà triée)."""
+        try:
+            return self._top(self.session.execute(self.ps_get_leaderboard, (LEADERBOARD_BOARD, limit)))
+        except Exception as e:
+            logger.error(f"❌ get_top_books error: {e}")
+            return []
+
+    # ========= Maintenance du classement =========
+
+    def _read_leaderboard(self, k: int) -> Tuple[Dict[str, int], Optional[int]]:
+        """Top-K courant (isbn -> compteur) et version de la partition (None si jamais écrite)."""
+        rows = list(self.session.execute(self.ps_get_leaderboard_versioned, (LEADERBOARD_BOARD, k)))
+        version = rows[0].version if rows else None
+        # Partition vidée par le trim : une ligne ne portant que la colonne statique (isbn null)
+        return {r.isbn: int(r.borrow_count or 0) for r in rows if r.isbn is not None}, version
+
+    def _write_leaderboard(self, top: List[Tuple[int, str]], version: Optional[int]) -> bool:
+        """Réécrit la partition en un BATCH mono-partition conditionnel (atomique, isolé, `IF version = ?`).
+
+        Renvoie False si un autre écrivain a réécrit le classement depuis la lecture de `version`.
+        """
+        queries = [(self.ps_bump_leaderboard, ((version or 0) + 1, LEADERBOARD_BOARD, version))]
+        queries += [
+            (self.ps_insert_leaderboard, (LEADERBOARD_BOARD, rank, isbn, count))
+            for rank, (count, isbn) in enumerate(top)
+        ]
+        # Supprime les rangs au-delà du nouveau top (classement plus court ou K réduit)
+        queries.append((self.ps_trim_leaderboard, (LEADERBOARD_BOARD, len(top))))
+        return was_applied(self.session.execute(build_batch(queries, "logged"), execution_profile=WRITE_PROFILE))
+
+    def _swap_leaderboard(self, fresh: Dict[str, int], k: int, replace: bool = False) -> int:
+        """Fusionne `fresh` au top-K courant et le réécrit par CAS sur la version (relecture + nouvel essai).
+
+        Sans condition, deux écrivains qui lisent le même top perdraient les ISBN l'un de l'autre.
+        Les compteurs ne font que croître : on garde le plus grand des deux. replace=True (reconstruction)
+        ignore le top courant au premier essai ; après une collision, les valeurs écrites entre-temps
+        sont conservées. Entre deux essais : backoff exponentiel + jitter (comme Inventory).
+        """
+        for attempt in range(self.max_retries + 1):
+            current, version = self._read_leaderboard(k)
+            board = {} if replace and attempt == 0 else current
+            for isbn, count in fresh.items():
+                board[isbn] = max(count, board.get(isbn, 0))
+            top = heapq.nlargest(k, ((count, isbn) for isbn, count in board.items()))
+            if self._write_leaderboard(top, version):
+                return len(top)
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+        raise LeaderboardConflict(f"top_books: {self.max_retries} conflits de version consécutifs")
+
+    def rebuild_leaderboard(self, k: int = LEADERBOARD_SIZE, page_size: int = 5000) -> int:
+        """Compaction complète : scan paginé de book_popularity + tas borné à K (mémoire O(K))."""
+        stmt = self.ps_get_all_popularity.bind(())
+        stmt.fetch_size = page_size
+        rows = self.session.execute(stmt)  # l'itération suit les pages du driver
+        top = heapq.nlargest(k, ((int(r.borrow_count or 0), r.isbn) for r in rows))
+        n = self._swap_leaderboard({isbn: count for count, isbn in top}, k, replace=True)
+        logger.success(f"✅ Classement reconstruit: {n} livres")
+        return n
+
+    def refresh_leaderboard(self, isbns: Iterable[str], k: int = LEADERBOARD_SIZE) -> int:
+        """Mise à jour incrémentale : relit les compteurs des ISBN touchés et les fusionne au top-K actuel.
+
+        Les compteurs ne font que croître : un livre hors du top ne peut y entrer
+        que s'il a été emprunté, donc fusionner les ISBN touchés suffit. Appelé par chaque
+        worker à chaque flush : la réécriture passe par le CAS de _swap_leaderboard.
+        """
+        fresh = {}
+        futures = [self.session.execute_async(self.ps_get_popularity, (isbn,)) for isbn in set(isbns)]
+        for f in futures:
+            row = f.result().one()
+            if row:
+                fresh[row.isbn] = int(row.borrow_count or 0)
+        return self._swap_leaderboard(fresh, k)
+
+
+class AsyncStatisticsRepository(StatisticsRepository):
+    """Variante asyncio de StatisticsRepository."""
+
+    async def get_total_borrows(self) -> int:
+        try:
+            return self._total((await aexecute(self.session, self.ps_get_total_borrows)).one())
+        except Exception as e:
+            logger.error(f"❌ get_total_borrows error: {e}")
+            return 0
+
+    async def get_top_books(self, limit: int = 10):
         try:
-            rows = list(self.session.execute(self.ps_get_all_popularity))
-            # borrow_count est un counter → cast en int
-            rows_sorted = sorted(rows, key=lambda r: int(r.borrow_count or 0), reverse=True)
-            return [
-                {"isbn": r.isbn, "borrow_count": int(r.borrow_count or 0)}
-                for r in rows_sorted[:limit]
-            ]
+            return self._top(await aexecute(self.session, self.ps_get_leaderboard, (LEADERBOARD_BOARD, limit)))
         except Exception as e:
             logger.error(f"❌ get_top_books error: {e}")
             return []
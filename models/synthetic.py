@@ -0,0 +1,515 @@
+import asyncio
+import hashlib
+import random
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
+from math import gcd, log
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from faker import Faker
+from loguru import logger
+
+from models.aggregator import StatsAggregator
+from models.aio import aexecute_concurrent
+from models.book import Book, BookRepository
+from models.borrow import BorrowRepository, LOAN_DAYS
+from models.reservation import ReservationRepository
+from models.scan import connect_keyspace
+from models.statistics import StatisticsRepository
+from models.user import User, UserRepository
+
+# Catégories par ordre de taille (la première est la plus fournie, cf. CATEGORY_ZIPF)
+CATEGORIES = [
+    "Roman", "Policier", "Jeunesse", "Bande Dessinée", "Thriller", "Science Fiction", "Fantasy", "Romance",
+    "Histoire", "Biographie", "Sciences", "Essai", "Manga", "Philosophie", "Cuisine", "Voyage", "Art",
+    "Psychologie", "Économie", "Santé", "Informatique", "Poésie", "Théâtre", "Religion", "Droit",
+    "Politique", "Sport", "Musique", "Horreur", "Aventure", "Nature", "Éducation", "Langues", "Bricolage",
+    "Humour", "Classique", "Mathématiques", "Géographie", "Sociologie", "Photographie",
+]
+PUBLISHERS = ["Gallimard", "Flammarion", "Hachette", "Albin Michel", "Seuil", "Grasset", "Actes Sud",
+              "Fayard", "Robert Laffont", "Casterman", "Dargaud", "Glénat", "Pocket", "Folio", "J'ai lu"]
+
+# Exposants des lois de Zipf : taille des catégories, productivité des auteurs
+CATEGORY_ZIPF = 1.0
+AUTHOR_ZIPF = 0.6
+# Dispersion (log-normale) de la profondeur d'historique par user : quelques gros lecteurs, beaucoup de petits
+HISTORY_SIGMA = 1.0
+MAX_HISTORY = 5000
+MAX_ACTIVE_PER_USER = 5
+# Les réservations en attente datent des RESERVATION_DAYS derniers jours
+RESERVATION_DAYS = 30
+
+# Entités par tâche d'un process et requêtes en vol par process
+CHUNK_SIZE = 1000
+WRITE_CONCURRENCY = 128
+
+
+def zipf_rank(rng: random.Random, n: int, s: float) -> int:
+    """Rang (0 = le plus fréquent) tiré selon une loi de Zipf d'exposant s sur n éléments.
+
+    Inversion de la loi continue de densité x^-s sur [1, n + 1) : O(1) en temps et en mémoire,
+    quel que soit n (pas de table cumulée de millions d'entrées par process).
+    """
+    u = rng.random()
+    if abs(s - 1.0) < 1e-9:
+        x = (n + 1) ** u
+    else:
+        a = 1.0 - s
+        x = (1.0 + u * ((n + 1) ** a - 1.0)) ** (1.0 / a)
+    return min(int(x), n) - 1
+
+
+def _count(rng: random.Random, mean: float, sigma: float = 0.0) -> int:
+    """Entier d'espérance `mean` : exponentielle (sigma=0) ou log-normale (sigma>0), arrondi aléatoire."""
+    if mean <= 0:
+        return 0
+    if sigma > 0:
+        x = rng.lognormvariate(log(mean) - sigma * sigma / 2, sigma)
+    else:
+        x = rng.expovariate(1.0 / mean)
+    return int(x + rng.random())
+
+
+def _ms(dt: datetime) -> datetime:
+    """Précision d'un timestamp Cassandra (ms) : les clés relues sont identiques à celles écrites."""
+    return dt.replace(microsecond=dt.microsecond // 1000 * 1000)
+
+
+def isbn13(i: int) -> str:
+    """ISBN-13 valide (préfixe 979) dérivé de l'indice du livre."""
+    body = f"979{i:09d}"
+    check = (10 - sum(int(d) * (1 if k % 2 == 0 else 3) for k, d in enumerate(body)) % 10) % 10
+    return body + str(check)
+
+
+@dataclass
+class SyntheticConfig:
+    """Volumes et distributions du jeu de données (identique pour un même seed et un même as_of)."""
+    books: int = 100_000
+    users: int = 50_000
+    borrows_per_user: float = 20.0       # profondeur moyenne d'un historique de history_days (log-normale)
+    reservations_per_user: float = 0.2   # réservations en attente par user (moyenne)
+    categories: int = len(CATEGORIES)
+    books_per_author: float = 5.0
+    zipf: float = 1.1                    # popularité des livres (emprunts et réservations)
+    history_days: int = 3 * 365
+    loan_days: int = LOAN_DAYS
+    max_active: int = MAX_ACTIVE_PER_USER
+    seed: int = 42
+    as_of: datetime = field(default_factory=lambda: datetime.now(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0))
+    index: bool = True                   # index de recherche (books_by_term)
+    bucketed: bool = False               # historiques dans les tables *_month (cf. HISTORY_BUCKETED)
+
+    @property
+    def authors(self) -> int:
+        return max(1, int(self.books / self.books_per_author))
+
+
+class _Permutation:
+    """Bijection rang -> indice (i * step + offset mod n) : la popularité ne suit pas l'ordre des ISBN."""
+
+    def __init__(self, n: int, rng: random.Random):
+        self.n = max(1, n)
+        step = rng.randrange(self.n // 2 + 1, self.n + 2) | 1
+        while gcd(step, self.n) != 1:
+            step += 2
+        self.step = step
+        self.offset = rng.randrange(self.n)
+
+    def __call__(self, rank: int) -> int:
+        return (rank * self.step + self.offset) % self.n
+
+
+class SyntheticCatalogue:
+    """Entités synthétiques dérivées uniquement de (seed, type, indice).
+
+    Un livre ou un user se recalcule à l'identique dans n'importe quel process, sans état partagé :
+    les historiques référencent les livres par indice, la sortie ne dépend ni du nombre de process
+    ni de la taille des tâches.
+    """
+
+    def __init__(self, config: SyntheticConfig):
+        self.config = config
+        self.fake = Faker("fr_FR")
+        rng = self._rng("permutation", 0)
+        self.popular = _Permutation(config.books, rng)
+        self.prolific = _Permutation(config.authors, rng)
+
+    def _rng(self, kind: str, i: int) -> random.Random:
+        return random.Random(f"{self.config.seed}:{kind}:{i}")
+
+    def _faker(self, kind: str, i: int) -> Faker:
+        self.fake.seed_instance(f"{self.config.seed}:{kind}:{i}")
+        return self.fake
+
+    def user_id(self, i: int) -> UUID:
+        return UUID(bytes=hashlib.md5(f"{self.config.seed}:user:{i}".encode()).digest(), version=4)
+
+    def category(self, rank: int) -> str:
+        name = CATEGORIES[rank % len(CATEGORIES)]
+        return name if rank < len(CATEGORIES) else f"{name} {rank // len(CATEGORIES) + 1}"
+
+    @lru_cache(maxsize=65536)
+    def author(self, j: int) -> str:
+        return self._faker("author", j).name()
+
+    @lru_cache(maxsize=65536)
+    def title(self, i: int) -> str:
+        """Titre du livre i (les historiques le dénormalisent : les livres chauds restent en cache)."""
+        fake = self._faker("title", i)
+        return fake.sentence(nb_words=self._rng("title", i).randint(2, 6))[:-1]
+
+    def book(self, i: int, active: int = 0) -> Book:
+        """Livre d'indice i ; `active` emprunts en cours (le stock en tient compte)."""
+        c = self.config
+        rng = self._rng("book", i)
+        total = max(rng.choice((1, 1, 2, 2, 3, 3, 4, 5, 8, 10)), active)
+        author = self.author(self.prolific(zipf_rank(rng, c.authors, AUTHOR_ZIPF)))
+        category = self.category(zipf_rank(rng, c.categories, CATEGORY_ZIPF))
+        return Book(
+            isbn=isbn13(i),
+            title=self.title(i),
+            author=author,
+            category=category,
+            publisher=rng.choice(PUBLISHERS),
+            publication_year=rng.randint(1950, c.as_of.year),
+            total_copies=total,
+            available_copies=total - active,
+            description=self._faker("description", i).text(max_nb_chars=200),
+        )
+
+    def popular_book(self, rng: random.Random) -> int:
+        return self.popular(zipf_rank(rng, self.config.books, self.config.zipf))
+
+    def user(self, i: int) -> User:
+        c = self.config
+        rng = self._rng("user", i)
+        fake = self._faker("user", i)
+        first, last = fake.first_name(), fake.last_name()
+        registered = c.as_of - timedelta(days=c.history_days * 1.5 * rng.random())
+        return User(
+            user_id=self.user_id(i),
+            email=f"{fake.user_name()}.{i}@{fake.free_email_domain()}",
+            first_name=first,
+            last_name=last,
+            phone=fake.phone_number(),
+            address=fake.address().replace("\n", ", "),
+            registration_date=_ms(registered),
+        )
+
+    def history(self, i: int, user: User) -> Tuple[List[tuple], List[tuple]]:
+        """Emprunts (livre, borrow_date, due_date, return_date ou None) et réservations (livre, date) du user i.
+
+        Les emprunts non rendus à `as_of` restent en cours (au plus max_active, un exemplaire par titre),
+        y compris en retard ; les réservations visent les titres chauds et sont toutes PENDING.
+        """
+        c = self.config
+        rng = self._rng("history", i)
+        start = max(user.registration_date, c.as_of - timedelta(days=c.history_days))
+        span = (c.as_of - start).total_seconds()
+        # Profondeur proportionnelle à l'ancienneté (un inscrit récent a un historique court)
+        tenure = span / (c.history_days * 86400)
+        depth = min(_count(rng, c.borrows_per_user * tenure, HISTORY_SIGMA), MAX_HISTORY)
+        loans, held = [], set()
+        for offset in sorted(rng.random() * span for _ in range(depth)):
+            book = self.popular_book(rng)
+            borrowed = _ms(start + timedelta(seconds=offset))
+            due = borrowed + timedelta(days=c.loan_days)
+            returned = borrowed + timedelta(days=rng.triangular(1, c.loan_days * 2, c.loan_days * 0.6))
+            if returned > c.as_of:
+                if len(held) < c.max_active and book not in held:
+                    held.add(book)
+                    loans.append((book, borrowed, due, None))
+                    continue
+                returned = borrowed + (c.as_of - borrowed) * rng.random()
+            loans.append((book, borrowed, due, _ms(returned)))
+
+        holds = []
+        for _ in range(_count(rng, c.reservations_per_user)):
+            book = self.popular_book(rng)
+            if book not in held:
+                date = c.as_of - timedelta(seconds=RESERVATION_DAYS * 86400 * rng.random())
+                holds.append((book, _ms(date)))
+        return loans, holds
+
+
+@dataclass
+class ChunkResult:
+    """Bilan d'une tâche : entités générées, écritures, emprunts en cours par indice de livre."""
+    counts: Counter = field(default_factory=Counter)
+    writes: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    active: Counter = field(default_factory=Counter)
+
+
+class SyntheticWriter:
+    """Écritures d'un process : les requêtes des repositories, envoyées en flux par aexecute_concurrent."""
+
+    def __init__(self, session, config: SyntheticConfig, concurrency: int = WRITE_CONCURRENCY):
+        self.session = session
+        self.catalogue = SyntheticCatalogue(config)
+        self.concurrency = concurrency
+        # Requêtes séparées (pas de batch) : la charge se répartit sur les réplicas de chaque partition
+        self.books = BookRepository(session, batch_mode=None)
+        self.users = UserRepository(session)
+        self.borrows = BorrowRepository(session, batch_mode=None, bucketed=config.bucketed)
+        self.reservations = ReservationRepository(session, bucketed=config.bucketed)
+        self.stats = StatsAggregator(session)
+        self.loop = asyncio.new_event_loop()
+
+    def _unique_buckets(self, queries) -> Iterator[Tuple[Any, Any]]:
+        """Une seule entrée history_buckets par (table, clé, mois) et par tâche (écritures répétées sinon)."""
+        ps_bucket, seen = self.borrows.buckets.ps_add_bucket, set()
+        for ps, params in queries:
+            if ps is ps_bucket:
+                if params in seen:
+                    continue
+                seen.add(params)
+            yield ps, params
+
+    def user_writes(self, start: int, end: int, result: ChunkResult) -> Iterator[Tuple[Any, Any]]:
+        catalogue, borrows = self.catalogue, self.borrows
+        popularity = Counter()
+        for i in range(start, end):
+            user = catalogue.user(i)
+            loans, holds = catalogue.history(i, user)
+            active = sum(1 for loan in loans if loan[3] is None)
+            user.total_borrows, user.active_borrows = len(loans), active
+            # Compteurs historiques portés par users_by_id (user_counters reste aux emprunts réels)
+            yield self.users.ps_insert, (
+                user.user_id, user.email, user.first_name, user.last_name, user.phone, user.address,
+                user.registration_date, user.total_borrows, user.active_borrows)
+
+            uid, name = user.user_id, f"{user.first_name} {user.last_name}"
+            for book, borrowed, due, returned in loans:
+                isbn, title = isbn13(book), catalogue.title(book)
+                popularity[isbn] += 1
+                yield from borrows._user_history_writes(uid, borrowed, isbn, title, name, "BORROWED", None)
+                if returned is None:
+                    result.active[book] += 1
+                    yield borrows.ps_upsert_active, (uid, isbn, borrowed, due, title, name)
+                    yield from borrows.due.entry(uid, isbn, due, borrowed, title, name)
+                    yield from borrows._book_history_rows(isbn, borrowed, uid, name, title, "BORROWED", None)
+                else:
+                    yield from borrows._user_history_writes(uid, returned, isbn, title, name, "RETURNED", returned)
+                    yield from borrows._book_history_rows(isbn, borrowed, uid, name, title, "RETURNED", returned)
+            for book, date in holds:
+                isbn = isbn13(book)
+                yield from self.reservations._reservation_writes(isbn, uid, name, reservation_date=date)
+
+            result.counts.update(users=1, borrows=len(loans), active_loans=active, reservations=len(holds))
+        # Compteurs book_popularity / global_stats : un incrément par ISBN et par tâche
+        if popularity:
+            yield from self.stats._statements(popularity)
+
+    def book_writes(self, start: int, end: int, active: Dict[int, int],
+                    result: ChunkResult) -> Iterator[Tuple[Any, Any]]:
+        for i in range(start, end):
+            book = self.catalogue.book(i, active.get(i, 0))
+            yield from self.books.insert_statements(book)
+            if self.catalogue.config.index:
+                yield from self.books.index.index_statements(book)
+            result.counts.update(books=1)
+
+    def run(self, phase: str, start: int, end: int, active: Optional[Dict[int, int]] = None) -> ChunkResult:
+        result = ChunkResult()
+        if phase == "users":
+            queries = self.user_writes(start, end, result)
+        else:
+            queries = self.book_writes(start, end, active or {}, result)
+        done, failed, error = self.loop.run_until_complete(
+            aexecute_concurrent(self.session, self._unique_buckets(queries), self.concurrency))
+        result.writes, result.failed = done, failed
+        if error is not None:
+            result.error = repr(error)
+            logger.error(f"❌ generate {phase} [{start}, {end}): {failed} écritures en échec ({error})")
+        return result
+
+
+# ========= Process d'écriture =========
+
+# Writer propre à chaque process du pool (session driver + boucle asyncio)
+_worker_writer: Optional[SyntheticWriter] = None
+
+
+def _init_worker(connect: Callable[[], Any], config: SyntheticConfig, concurrency: int):
+    global _worker_writer
+    _worker_writer = SyntheticWriter(connect(), config, concurrency)
+
+
+def _generate_task(phase: str, start: int, end: int, active: Optional[Dict[int, int]] = None) -> ChunkResult:
+    return _worker_writer.run(phase, start, end, active)
+
+
+@dataclass
+class PhaseReport:
+    entities: int = 0
+    writes: int = 0
+    failed: int = 0
+    elapsed_s: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["writes_per_sec"] = round(self.writes / self.elapsed_s, 1) if self.elapsed_s > 0 else 0.0
+        data["entities_per_sec"] = round(self.entities / self.elapsed_s, 1) if self.elapsed_s > 0 else 0.0
+        return data
+
+
+@dataclass
+class GenerationReport:
+    seed: int
+    processes: int
+    counts: Counter = field(default_factory=Counter)
+    phases: Dict[str, PhaseReport] = field(default_factory=dict)
+    failed_chunks: int = 0
+    leaderboard: int = 0
+    elapsed_s: float = 0.0
+
+    @property
+    def writes(self) -> int:
+        return sum(p.writes for p in self.phases.values())
+
+    @property
+    def writes_per_sec(self) -> float:
+        return self.writes / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "seed": self.seed,
+            "processes": self.processes,
+            "counts": dict(self.counts),
+            "writes": self.writes,
+            "writes_failed": sum(p.failed for p in self.phases.values()),
+            "failed_chunks": self.failed_chunks,
+            "elapsed_s": round(self.elapsed_s, 2),
+            "writes_per_sec": round(self.writes_per_sec, 1),
+            "phases": {name: p.to_dict() for name, p in self.phases.items()},
+            "leaderboard": self.leaderboard,
+        }
+
+
+class SyntheticDataGenerator:
+    """Jeu de données à l'échelle de la production, écrit en parallèle par un pool de process.
+
+    Phase "users" : profils, historiques d'emprunts (rendus et en cours, index des échéances),
+    réservations et compteurs de popularité. Phase "books" : catalogue (3 tables + index de recherche),
+    stock diminué des emprunts en cours remontés par la première phase. Chaque process ouvre sa
+    propre connexion (`connect`) et garde `concurrency` écritures en vol ; au plus 2 tâches de
+    `chunk_size` entités par process sont en cours (mémoire bornée quelle que soit la volumétrie).
+
+    Les écritures sont des upserts, sauf les compteurs (book_popularity, global_stats) : relancer
+    la génération sur les mêmes tables les double. processes=0 : tout dans le process courant avec
+    `session`.
+    """
+
+    def __init__(self, config: SyntheticConfig, processes: int = 4, concurrency: int = WRITE_CONCURRENCY,
+                 chunk_size: int = CHUNK_SIZE, connect: Optional[Callable[[], Any]] = None,
+                 keyspace: str = "library_system", session=None, leaderboard: bool = True):
+        self.config = config
+        self.processes = processes
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.connect = connect or partial(connect_keyspace, keyspace)
+        self.session = session
+        self.leaderboard = leaderboard
+        self.report = GenerationReport(seed=config.seed, processes=processes)
+
+    def _chunks(self, total: int, active: Counter) -> Iterator[Tuple[int, int, Optional[Dict[int, int]]]]:
+        for start in range(0, total, self.chunk_size):
+            end = min(start + self.chunk_size, total)
+            yield start, end, ({i: active[i] for i in range(start, end) if i in active} if active else None)
+
+    def _collect(self, phase: str, total: int, results: Iterator[ChunkResult], active: Counter):
+        report, started = PhaseReport(), time.perf_counter()
+        self.report.phases[phase] = report
+        step = max(1, total // 20)
+        logged = 0
+        for result in results:
+            report.entities += result.counts[phase]
+            report.writes += result.writes
+            report.failed += result.failed
+            report.elapsed_s = time.perf_counter() - started
+            self.report.counts.update(result.counts)
+            self.report.failed_chunks += result.error is not None
+            if phase == "users":
+                active.update(result.active)
+            if report.entities - logged >= step or report.entities >= total:
+                logged = report.entities
+                logger.info(f"  ✅ {phase}: {report.entities}/{total} "
+                            f"({report.writes / report.elapsed_s:.0f} écritures/s)")
+
+    def _run_local(self, phase: str, total: int, active: Counter) -> Iterator[ChunkResult]:
+        writer = SyntheticWriter(self.session or self.connect(), self.config, self.concurrency)
+        try:
+            for start, end, held in self._chunks(total, active):
+                yield writer.run(phase, start, end, held)
+        finally:
+            writer.loop.close()
+
+    def _run_pool(self, pool, phase: str, total: int, active: Counter) -> Iterator[ChunkResult]:
+        # Une tâche échouée n'est pas relancée : ses compteurs seraient incrémentés deux fois
+        chunks = iter(self._chunks(total, active))
+        running = set()
+
+        def submit():
+            for start, end, held in chunks:
+                running.add(pool.submit(_generate_task, phase, start, end, held))
+                if len(running) >= self.processes * 2:
+                    break
+
+        submit()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.discard(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logger.error(f"❌ generate {phase}: tâche abandonnée ({e})")
+                    yield ChunkResult(error=repr(e))
+            submit()
+
+    def _rebuild_leaderboard(self) -> int:
+        session = self.session or self.connect()
+        try:
+            return StatisticsRepository(session).rebuild_leaderboard()
+        finally:
+            if self.session is None and getattr(session, "cluster", None) is not None:
+                session.cluster.shutdown()
+
+    def run(self) -> GenerationReport:
+        c = self.config
+        self.report = GenerationReport(seed=c.seed, processes=self.processes)
+        active: Counter = Counter()
+        started = time.perf_counter()
+        logger.info(f"🎲 Génération (seed {c.seed}) : {c.users} users (~{c.borrows_per_user:g} emprunts chacun), "
+                    f"{c.books} livres, {c.authors} auteurs, {c.categories} catégories")
+        try:
+            if self.processes <= 0:
+                self._collect("users", c.users, self._run_local("users", c.users, Counter()), active)
+                self._collect("books", c.books, self._run_local("books", c.books, active), active)
+            else:
+                with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker,
+                                         initargs=(self.connect, c, self.concurrency)) as pool:
+                    self._collect("users", c.users, self._run_pool(pool, "users", c.users, Counter()), active)
+                    self._collect("books", c.books, self._run_pool(pool, "books", c.books, active), active)
+            if self.leaderboard:
+                self.report.leaderboard = self._rebuild_leaderboard()
+        finally:
+            self.report.elapsed_s = time.perf_counter() - started
+
+        r = self.report
+        logger.success(
+            f"✅ Génération terminée: {r.counts['books']} livres, {r.counts['users']} users, "
+            f"{r.counts['borrows']} emprunts ({r.counts['active_loans']} en cours), "
+            f"{r.counts['reservations']} réservations en {r.elapsed_s:.1f}s "
+            f"({r.writes_per_sec:.0f} écritures/s)"
+        )
+        return r
@@ -1,11 +1,14 @@
 from dataclasses import dataclass
 from typing import Optional
 from uuid import UUID, uuid4
-from cassandra.query import PreparedStatement
 from loguru import logger
 from datetime import datetime, timezone
 
-@dataclass
+from config.database import WRITE_PROFILE
+from models.aio import aexecute, afetch_one_all
+from models.statements import Statement
+
+@dataclass(slots=True)
 class User:
     user_id: UUID
     email: str
@@ -18,30 +21,57 @@ class User:
     active_borrows: int = 0
 
 class UserRepository:
+    ps_insert = Statement("""
+        INSERT INTO users_by_id
+        (user_id, email, first_name, last_name, phone, address,
+         registration_date, total_borrows, active_borrows)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """)
+
+    ps_get = Statement("""
+        SELECT * FROM users_by_id WHERE user_id = ?
+    """)
+
+    # Compteurs d'emprunts : table counter incrémentée à l'aveugle par BorrowRepository
+    ps_get_counters = Statement("""
+        SELECT total_borrows, active_borrows FROM user_counters WHERE user_id = ?
+    """)
+
     def __init__(self, session):
         self.session = session
 
-        self.ps_insert: PreparedStatement = session.prepare("""
-            INSERT INTO users_by_id
-            (user_id, email, first_name, last_name, phone, address,
-             registration_date, total_borrows, active_borrows)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """)
+    def _new_user_params(self, email: str, first_name: str, last_name: str,
+                         phone: str = "", address: str = ""):
+        user_id = uuid4()
+        reg_date = datetime.now(timezone.utc)
+        return user_id, (user_id, email, first_name, last_name, phone, address, reg_date, 0, 0)
+
+    def _get_reads(self, user_id: UUID):
+        # Profil + compteurs lus en parallèle
+        return [(self.ps_get, (user_id,)), (self.ps_get_counters, (user_id,))]
 
-        self.ps_get: PreparedStatement = session.prepare("""
-            SELECT * FROM users_by_id WHERE user_id = ?
-        """)
+    @staticmethod
+    def _row_to_user(row, counters=None) -> User:
+        # Les colonnes de users_by_id ne bougent plus (valeurs d'avant user_counters) :
+        # on y ajoute les incréments de la table counter.
+        return User(
+            user_id=row.user_id,
+            email=row.email,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            phone=row.phone or "",
+            address=row.address or "",
+            registration_date=row.registration_date,
+            total_borrows=(row.total_borrows or 0) + (counters.total_borrows or 0 if counters else 0),
+            active_borrows=(row.active_borrows or 0) + (counters.active_borrows or 0 if counters else 0)
+        )
 
     def create_user(self, email: str, first_name: str, last_name: str,
                     phone: str = "", address: str = "") -> UUID:
-        user_id = uuid4()
-        reg_date = datetime.now(timezone.utc)
+        user_id, params = self._new_user_params(email, first_name, last_name, phone, address)
 
         try:
-            self.session.execute(self.ps_insert, (
-                user_id, email, first_name, last_name, phone, address,
-                reg_date, 0, 0
-            ))
+            self.session.execute(self.ps_insert, params, execution_profile=WRITE_PROFILE)
             logger.success(f"✅ Utilisateur créé: {user_id}")
             return user_id
         except Exception as e:
@@ -50,21 +80,33 @@ class UserRepository:
 
     def get_user(self, user_id: UUID) -> Optional[User]:
         try:
-            row = self.session.execute(self.ps_get, (user_id,)).one()
-            if not row:
-                return None
-
-            return User(
-                user_id=row.user_id,
-                email=row.email,
-                first_name=row.first_name,
-                last_name=row.last_name,
-                phone=row.phone or "",
-                address=row.address or "",
-                registration_date=row.registration_date,
-                total_borrows=row.total_borrows or 0,
-                active_borrows=row.active_borrows or 0
-            )
+            futures = [self.session.execute_async(ps, params) for ps, params in self._get_reads(user_id)]
+            row, counters = [f.result().one() for f in futures]
+            return self._row_to_user(row, counters) if row else None
+        except Exception as e:
+            logger.error(f"❌ get_user error: {e}")
+            return None
+
+
+class AsyncUserRepository(UserRepository):
+    """Variante asyncio de UserRepository."""
+
+    async def create_user(self, email: str, first_name: str, last_name: str,
+                          phone: str = "", address: str = "") -> UUID:
+        user_id, params = self._new_user_params(email, first_name, last_name, phone, address)
+
+        try:
+            await aexecute(self.session, self.ps_insert, params, execution_profile=WRITE_PROFILE)
+            logger.success(f"✅ Utilisateur créé: {user_id}")
+            return user_id
+        except Exception as e:
+            logger.error(f"❌ create_user error: {e}")
+            raise
+
+    async def get_user(self, user_id: UUID) -> Optional[User]:
+        try:
+            row, counters = await afetch_one_all(self.session, self._get_reads(user_id))
+            return self._row_to_user(row, counters) if row else None
         except Exception as e:
             logger.error(f"❌ get_user error: {e}")
             return None
@@ -1,75 +1,81 @@
-from faker import Faker
-from uuid import uuid4
-from random import randint, choice
-from loguru import logger
+"""Jeu de données synthétique : python -m scripts.generate_data [--books 100000] [--users 50000] [--seed 42] ...
+
+Livres, users, historiques d'emprunts (rendus et en cours), réservations en attente et compteurs
+de popularité, écrits en parallèle par un pool de process (models/synthetic.py). Même seed et même
+--as-of : mêmes données, quel que soit le nombre de process.
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timezone
+
+from models.borrow import LOAN_DAYS
+from models.synthetic import (CATEGORIES, CHUNK_SIZE, WRITE_CONCURRENCY, SyntheticConfig,
+                              SyntheticDataGenerator)
+
+
+def _date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def main(argv=None) -> int:
+    default = SyntheticConfig()
+    parser = argparse.ArgumentParser(prog="python -m scripts.generate_data", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=default.books)
+    parser.add_argument("--users", type=int, default=default.users)
+    parser.add_argument("--borrows-per-user", type=float, default=default.borrows_per_user,
+                        help="Emprunts moyens sur --history-days (log-normale : quelques gros lecteurs)")
+    parser.add_argument("--reservations-per-user", type=float, default=default.reservations_per_user,
+                        help="Réservations en attente par user (moyenne)")
+    parser.add_argument("--categories", type=int, default=len(CATEGORIES), help="Nombre de catégories")
+    parser.add_argument("--books-per-author", type=float, default=default.books_per_author)
+    parser.add_argument("--zipf", type=float, default=default.zipf,
+                        help="Exposant de Zipf de la popularité des livres (emprunts, réservations)")
+    parser.add_argument("--history-days", type=int, default=default.history_days)
+    parser.add_argument("--loan-days", type=int, default=LOAN_DAYS)
+    parser.add_argument("--as-of", type=_date, default=default.as_of,
+                        help="Date de référence AAAA-MM-JJ (défaut: aujourd'hui) : fin des historiques")
+    parser.add_argument("--seed", type=int, default=default.seed)
+    parser.add_argument("--no-index", action="store_true", help="Sans index de recherche (books_by_term)")
+    parser.add_argument("--bucketed", action="store_true",
+                        help="Historiques dans les tables *_month (API/CLI lancés avec HISTORY_BUCKETED=1)")
+    parser.add_argument("--no-leaderboard", action="store_true", help="Ne pas reconstruire top_books à la fin")
+    parser.add_argument("--processes", type=int, default=4, help="Process d'écriture (0 = process courant)")
+    parser.add_argument("--concurrency", type=int, default=WRITE_CONCURRENCY, help="Requêtes en vol par process")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Entités par tâche")
+    parser.add_argument("--keyspace", default="library_system")
+    parser.add_argument("--report", default=None, help="Fichier JSON du rapport (défaut: stdout)")
+    args = parser.parse_args(argv)
+
+    config = SyntheticConfig(
+        books=args.books,
+        users=args.users,
+        borrows_per_user=args.borrows_per_user,
+        reservations_per_user=args.reservations_per_user,
+        categories=args.categories,
+        books_per_author=args.books_per_author,
+        zipf=args.zipf,
+        history_days=args.history_days,
+        loan_days=args.loan_days,
+        seed=args.seed,
+        as_of=args.as_of,
+        index=not args.no_index,
+        bucketed=args.bucketed,
+    )
+    generator = SyntheticDataGenerator(config, processes=args.processes, concurrency=args.concurrency,
+                                       chunk_size=args.chunk_size, keyspace=args.keyspace,
+                                       leaderboard=not args.no_leaderboard)
+    report = generator.run()
+
+    text = json.dumps(report.to_dict(), indent=2)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if report.failed_chunks else 0
 
-from config.database import CassandraConnection
-from models.book import BookRepository, Book
-from models.user import UserRepository
-
-fake = Faker("fr_FR")
-
-def generate_books(book_repo: BookRepository, count=100):
-    categories = ["Science Fiction", "Fantasy", "Thriller", "Romance",
-                  "Histoire", "Science", "Biographie", "Philosophie"]
-    publishers = ["Gallimard", "Flammarion", "Hachette", "Albin Michel", "Seuil"]
-
-    logger.info(f"📚 Génération de {count} livres...")
-
-    for i in range(count):
-        isbn = f"978-{randint(0,9)}-{randint(100000,999999)}-{randint(10,99)}-{randint(0,9)}"
-
-        total = randint(1, 10)
-        available = randint(0, total)
-
-        book = Book(
-            isbn=isbn,
-            title=fake.sentence(nb_words=4)[:-1],
-            author=fake.name(),
-            category=choice(categories),
-            publisher=choice(publishers),
-            publication_year=randint(1950, 2024),
-            total_copies=total,
-            available_copies=available,
-            description=fake.text(max_nb_chars=200)
-        )
-
-        book_repo.add_book(book)
-
-        if (i + 1) % 10 == 0:
-            logger.info(f"  ✅ {i+1}/{count} livres créés")
-
-    logger.success(f"✅ {count} livres générés")
-
-def generate_users(user_repo: UserRepository, count=50):
-    logger.info(f"👥 Génération de {count} utilisateurs...")
-
-    ids = []
-    for i in range(count):
-        user_id = user_repo.create_user(
-            email=fake.email(),
-            first_name=fake.first_name(),
-            last_name=fake.last_name(),
-            phone=fake.phone_number(),
-            address=fake.address().replace("\n", ", "),
-        )
-        ids.append(user_id)
-
-        if (i + 1) % 10 == 0:
-            logger.info(f"  ✅ {i+1}/{count} utilisateurs créés")
-
-    logger.success(f"✅ {count} utilisateurs générés")
-    return ids
 
 if __name__ == "__main__":
-    db = CassandraConnection(keyspace="library_system")
-    session = db.connect()
-
-    book_repo = BookRepository(session)
-    user_repo = UserRepository(session)
-
-    generate_books(book_repo, count=100)
-    generate_users(user_repo, count=50)
-
-    logger.success("🎉 Base de données peuplée !")
-    db.close()
+    sys.exit(main())